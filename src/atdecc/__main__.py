@@ -8,6 +8,9 @@ parser.add_argument("-c", "--config", type=str, default='/etc/atdecc/config.yml'
                     help="Config file (default='%(default)s')")
 parser.add_argument("-v", "--valid", type=float, default=62, help="Valid time in seconds (default=%(default)s)")
 parser.add_argument("--discover", action='store_true', help="Discover AVDECC entities")
+parser.add_argument("--cache", type=str, help="Entity cache file for warm starts of discovery")
+parser.add_argument("--journal", type=str, help="Journal file of listener connections for fast connect at startup")
+parser.add_argument("--ptp", type=str, help="ptp4l management socket for gPTP grandmaster updates, e.g. /var/run/ptp4l")
 parser.add_argument('-d', "--debug", action='store_true', default=0,
                     help="Enable debug mode")
 #    parser.add_argument('-v', "--verbose", action='count', default=0,
@@ -31,7 +34,7 @@ entity_info = EntityInfo(
     # talker_capabilities=at.JDKSAVDECC_ADP_TALKER_CAPABILITY_IMPLEMENTED + at.JDKSAVDECC_ADP_TALKER_CAPABILITY_AUDIO_SOURCE
 )
 
-with AVDECC(intf=args.intf, entity_info=entity_info, config=args.config, discover=args.discover) as avdecc:
+with AVDECC(intf=args.intf, entity_info=entity_info, config=args.config, discover=args.discover, cache=args.cache, ptp=args.ptp, journal=args.journal) as avdecc:
 
     while(True):
         time.sleep(0.1)
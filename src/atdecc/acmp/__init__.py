@@ -1,12 +1,18 @@
 from threading import Thread, Event
 from queue import Queue, Empty
 import copy
+import ctypes
+import heapq
+import itertools
 import logging
+import time
 import traceback
 
 from .. import atdecc_api as at
 from ..adp import GlobalStateMachine
 from ..acmp.struct import *
+from ..acmp.talker import ACMPTalkerStateMachine
+from ..acmp.journal import ConnectionJournal
 from ..util import *
 from ..pdu_print import *
 
@@ -20,16 +26,54 @@ timeout_values = {
     at.JDKSAVDECC_ACMP_MESSAGE_TYPE_GET_TX_CONNECTION_COMMAND: at.JDKSAVDECC_ACMP_TIMEOUT_GET_TX_CONNECTION_COMMAND,
 }
 
+# flags of the GET_STREAM_INFO response (IEEE 1722.1-2021, 7.4.16)
+STREAM_INFO_FLAG_STREAM_VLAN_ID_VALID = 1<<25
+STREAM_INFO_FLAG_CONNECTED = 1<<26
+STREAM_INFO_FLAG_STREAM_DEST_MAC_VALID = 1<<28
+STREAM_INFO_FLAG_STREAM_ID_VALID = 1<<30
+
+def inflightKey(commandResponse):
+    """
+    Integer key of the stream connection a command or response refers to:
+    (controller_entity_id, talker_entity_id, talker_unique_id, listener_entity_id, listener_unique_id)
+    """
+    return (
+        eui64_to_uint64(commandResponse.controller_entity_id),
+        eui64_to_uint64(commandResponse.talker_entity_id),
+        commandResponse.talker_unique_id,
+        eui64_to_uint64(commandResponse.listener_entity_id),
+        commandResponse.listener_unique_id,
+    )
+
+# the controller uses timeout_values
+from ..acmp.controller import ACMPController
+from ..acmp.snapshot import ConnectionSnapshot
+
+
 class ACMPListenerStateMachine(
     GlobalStateMachine,
     Thread
     ):
     """
     IEEE 1722.1-2021, section 8.2.4
+
+    Timeouts are deadlines on the clock (seconds, monotonic by default),
+    the thread wakes up at the earliest pending deadline.
+
+    With a ConnectionJournal the connected streams are saved on every change
+    and fast-connected at startup.
+
+    ownership is the OwnershipView published by the EntityModelEntityStateMachine.
+    Connection changes are announced to the controllers registered in notifications
+    (the UnsolicitedNotifications of the EntityModelEntityStateMachine).
     """
     
-    def __init__(self, entity_info, interfaces):
+    def __init__(self, entity_info, interfaces, clock=time.monotonic, journal=None, ownership=None, notifications=None):
         super(ACMPListenerStateMachine, self).__init__()
+        self.clock = clock
+        self.journal = journal
+        self.ownership = ownership
+        self.notifications = notifications
         self.event = Event()
         # a structure of type ACMPCommandResponse containing the next received ACMPDUtobe processed
         self.rcvdCmdResp = Queue()
@@ -37,14 +81,24 @@ class ACMPListenerStateMachine(
         self.interfaces = interfaces
         
         self.my_id = entity_info.entity_id
-        self.inflight = []
-        self.retried = []
-        self.listenerStreamInfos = {}
-        self.rcvdConnectRXCmd = False
-        self.rcvdDisconnectRXCmd = False
-        self.rcvdConnectTXResp = False
-        self.rcvdDisconnectTXResp = False
-        self.rcvdGetRXState = False
+        self.inflight = {} # inflightKey -> struct_acmp_inflight_command
+        self.inflightTimeouts = [] # heap of (timeout, order, inflightKey), entries are stale if the timeout has changed
+        self.inflightOrder = itertools.count()
+        self.inflightSequenceIDs = {} # sequence_id -> inflightKey, correlates responses with their commands
+        # sequence IDs of the commands sent by the listener, 
+        # one allocator for all interfaces as a command is sent on all of them
+        self.sequenceIDs = SequenceIDAllocator()
+        self.maxWait = 1 # seconds to wait if no timeout is pending
+        # one preallocated record per stream sink, indexed by listener_unique_id
+        self.listenerStreamInfos = (struct_acmp_listener_stream_info * entity_info.listener_stream_sinks)()
+        self.batchSize = 64 # received messages handled before timeouts are checked again
+
+    @property
+    def currentTime(self):
+        """
+        Get seconds of the state machine clock
+        """
+        return self.clock()
 
     def performTerminate(self):
         self.doTerminate = True
@@ -54,27 +108,18 @@ class ACMPListenerStateMachine(
     def acmp_cb(self, acmpdu: at.struct_jdksavdecc_acmpdu):
         if eui64_to_uint64(acmpdu.listener_entity_id) == self.my_id:
             logging.info("ACMP: %s", acmpdu_str(acmpdu))
-            self.rcvdCmdResp.put(copy.deepcopy(acmpdu)) # copy structure (will probably be overwritten)
-
-            if(acmpdu.header.message_type == at.JDKSAVDECC_ACMP_MESSAGE_TYPE_CONNECT_RX_COMMAND):
-                self.rcvdConnectRXCmd = True
-            elif(acmpdu.header.message_type == at.JDKSAVDECC_ACMP_MESSAGE_TYPE_DISCONNECT_RX_COMMAND):
-                self.rcvdDisconnectRXCmd = True
-            elif(acmpdu.header.message_type == at.JDKSAVDECC_ACMP_MESSAGE_TYPE_CONNECT_TX_RESPONSE):
-                self.rcvdConnectTXResp = True
-            elif(acmpdu.header.message_type == at.JDKSAVDECC_ACMP_MESSAGE_TYPE_DISCONNECT_TX_RESPONSE):
-                self.rcvdDisconnectTXResp = True
-            elif(acmpdu.header.message_type == at.JDKSAVDECC_ACMP_MESSAGE_TYPE_GET_RX_STATE_COMMAND):
-                self.rcvdGetRXState = True
-            
+            # copy structure (will probably be overwritten), it carries its own message_type
+            self.rcvdCmdResp.put(copy.deepcopy(acmpdu))
             self.event.set()
 
     def validListenerUnique(self, ListenerUniqueId):
         """
         The validListenerUnique function returns a Boolean indicating if the 
         ATDECC ListenerUniqueId passed in is valid for the ATDECC Entity.
+
+        ListenerUniqueIds are the indices 0 to listener_stream_sinks-1.
         """
-        return ListenerUniqueId == self.my_id
+        return 0 <= ListenerUniqueId < len(self.listenerStreamInfos)
 
     def listenerIsConnected(self, command):
         """
@@ -94,17 +139,17 @@ class ACMPListenerStateMachine(
         the next connection attempt by the ATDECC Controller to restore the connection will succeed.
         """
 
-        try:
-            streamInfo = self.listenerStreamInfos[command.listener_unique_id]
-
-            return (
-                (eui64_to_uint64(streamInfo.talker_entity_id) != eui64_to_uint64(command.talker_entity_id) and 
-                streamInfo.talker_unique_id != command.talker_unique_id) and
-                (streamInfo.connected or streamInfo.pending_connection)
-            )
-        except KeyError:
+        if not self.validListenerUnique(command.listener_unique_id):
             return False
 
+        streamInfo = self.listenerStreamInfos[command.listener_unique_id]
+
+        return (
+            (eui64_to_uint64(streamInfo.talker_entity_id) != eui64_to_uint64(command.talker_entity_id) and 
+            streamInfo.talker_unique_id != command.talker_unique_id) and
+            (streamInfo.connected or streamInfo.pending_connection)
+        )
+
 
     def listenerIsConnectedTo(self, command):
         """
@@ -116,16 +161,16 @@ class ACMPListenerStateMachine(
         and talker_unique_id in the command matches talker_entity_id and talker_unique_id 
         in the listenerStreamInfos entry otherwise it returns FALSE.
         """
-        try:
-            streamInfo = self.listenerStreamInfos[command.listener_unique_id]
-
-            return (
-                eui64_to_uint64(streamInfo.talker_entity_id) == eui64_to_uint64(command.talker_entity_id) and 
-                streamInfo.talker_unique_id == command.talker_unique_id
-            )
-        except KeyError:
+        if not self.validListenerUnique(command.listener_unique_id):
             return False
 
+        streamInfo = self.listenerStreamInfos[command.listener_unique_id]
+
+        return (
+            eui64_to_uint64(streamInfo.talker_entity_id) == eui64_to_uint64(command.talker_entity_id) and 
+            streamInfo.talker_unique_id == command.talker_unique_id
+        )
+
     def txCommand(self, messageType, command, retry):
         """
         The txCommand function transmits a command of type messageType. 
@@ -155,11 +200,12 @@ class ACMPListenerStateMachine(
 
         try:
             if retry:
-                matching_inflight_index = self.findMatchingInflightIndex(command)
-                if matching_inflight_index is not None:
-                    inflightCommand = self.inflight[matching_inflight_index]
+                key = self.findMatchingInflightIndex(command)
+                if key is not None:
+                    inflightCommand = self.inflight[key]
                     inflightCommand.retried = True
-                    inflightCommand.timeout = int(self.currentTime * 1000) + timeout_values[messageType]
+                    inflightCommand.timeout = self.currentTime + timeout_values[messageType]/1000.
+                    self.scheduleTimeout(key, inflightCommand)
 
                     self._tx(command, messageType, at.JDKSAVDECC_ACMP_STATUS_SUCCESS)
 
@@ -169,11 +215,17 @@ class ACMPListenerStateMachine(
 
                     return False
             else:
-                self.inflight.append(struct_acmp_inflight_command(
-                    timeout=int(self.currentTime * 1000) + timeout_values[messageType],
+                # our own sequence_id, the controller's is restored in the response
+                original_sequence_id = command.sequence_id
+                command.sequence_id = self.sequenceIDs.allocate()
+                # the inflight entry keeps the transmitted message_type to dispatch its timeout
+                inflightCommand = type(command).from_buffer_copy(command)
+                inflightCommand.header.message_type = messageType
+                self.addInflight(struct_acmp_inflight_command(
+                    timeout=self.currentTime + timeout_values[messageType]/1000.,
                     retried=False,
-                    command=command,
-                    original_sequence_id=command.sequence_id
+                    command=inflightCommand,
+                    original_sequence_id=original_sequence_id
                 ))
 
                 self._tx(command, messageType, at.JDKSAVDECC_ACMP_STATUS_SUCCESS)
@@ -209,17 +261,19 @@ class ACMPListenerStateMachine(
 
         # we don't support SRP
 
-        self.listenerStreamInfos[response.listener_unique_id] = struct_acmp_listener_stream_info(
-            talker_entity_id = response.talker_entity_id,
-            talker_unique_id = response.talker_unique_id,
-            connected = True,
-            stream_id = response.header.stream_id,
-            stream_dest_mac = response.stream_dest_mac,
-            controller_entity_id = response.controller_entity_id,
-            flags = response.flags,
-            stream_vlan_id = response.stream_vlan_id,
-            pending_connection = False
-        )
+        # update the preallocated record in place
+        streamInfo = self.listenerStreamInfos[response.listener_unique_id]
+        streamInfo.talker_entity_id = response.talker_entity_id
+        streamInfo.talker_unique_id = response.talker_unique_id
+        streamInfo.connected = True
+        streamInfo.stream_id = response.header.stream_id
+        streamInfo.stream_dest_mac = response.stream_dest_mac
+        streamInfo.controller_entity_id = response.controller_entity_id
+        streamInfo.flags = response.flags
+        streamInfo.stream_vlan_id = response.stream_vlan_id
+        streamInfo.pending_connection = False
+        self.saveJournal()
+        self.notifyStreamInfo(response.listener_unique_id)
 
         # TODO are there any reasons for this to error out, i.e. return a different status?
         return [response, at.JDKSAVDECC_ACMP_STATUS_SUCCESS]
@@ -239,21 +293,82 @@ class ACMPListenerStateMachine(
 
         # we don't support SRP
 
-        self.listenerStreamInfos[command.listener_unique_id] = struct_acmp_listener_stream_info(
-            talker_entity_id = uint64_to_eui64(0),
-            talker_unique_id = 0,
-            connected = False,
-            stream_id = uint64_to_eui64(0),
-            stream_dest_mac = uint64_to_eui48(0),
-            controller_entity_id = uint64_to_eui64(0),
-            flags = 0,
-            stream_vlan_id = 0,
-            pending_connection = False
-        )
+        streamInfo = self.listenerStreamInfos[command.listener_unique_id]
+        ctypes.memset(ctypes.addressof(streamInfo), 0, ctypes.sizeof(streamInfo))
+        self.saveJournal()
+        self.notifyStreamInfo(command.listener_unique_id)
 
         # TODO are there any reasons for this to error out, i.e. return a different status?
         return [command, at.JDKSAVDECC_ACMP_STATUS_SUCCESS]
 
+    def saveJournal(self):
+        if self.journal is None:
+            return
+        try:
+            self.journal.save(self.listenerStreamInfos)
+        except OSError as e:
+            logging.warning("Cannot write connection journal, disabling it: %s", e)
+            self.journal = None
+
+    def streamInfoPayload(self, listener_unique_id):
+        """
+        The GET_STREAM_INFO response payload of the STREAM_INPUT listener_unique_id
+        """
+        streamInfo = self.listenerStreamInfos[listener_unique_id]
+        flags = 0
+        if streamInfo.connected:
+            flags = STREAM_INFO_FLAG_CONNECTED | STREAM_INFO_FLAG_STREAM_ID_VALID | \
+                    STREAM_INFO_FLAG_STREAM_DEST_MAC_VALID | STREAM_INFO_FLAG_STREAM_VLAN_ID_VALID
+        return struct.pack("!2HLQQL6sBBQ2H",
+            at.JDKSAVDECC_DESCRIPTOR_STREAM_INPUT, # descriptor_type
+            listener_unique_id, # descriptor_index
+            flags, # flags
+            0, # stream_format
+            eui64_to_uint64(streamInfo.stream_id), # stream_id
+            0, # msrp_accumulated_latency
+            bytes(streamInfo.stream_dest_mac.value), # stream_dest_mac
+            0, # msrp_failure_code
+            0, # reserved
+            0, # msrp_failure_bridge_id
+            streamInfo.stream_vlan_id, # stream_vlan_id
+            0, # reserved
+        )
+
+    def notifyStreamInfo(self, listener_unique_id):
+        if self.notifications is None:
+            return
+        self.notifications.notify(at.JDKSAVDECC_AEM_COMMAND_GET_STREAM_INFO, self.streamInfoPayload(listener_unique_id))
+
+    def fastConnect(self):
+        """
+        Reconnect the streams saved in the journal.
+
+        A CONNECT_TX_COMMAND with the FAST_CONNECT flag is sent for every saved stream,
+        all of them are inflight in parallel. A journal entry stays until the next change 
+        of the connections, even if its fast connect fails.
+        """
+        if self.journal is None:
+            return
+        for listener_unique_id, info in self.journal.load():
+            if not self.validListenerUnique(listener_unique_id):
+                continue
+            logging.debug("Fast connect listener %d to %016x/%d", 
+                          listener_unique_id, eui64_to_uint64(info.talker_entity_id), info.talker_unique_id)
+            self._handleConnectRxCommand(at.struct_jdksavdecc_acmpdu(
+                header=at.struct_jdksavdecc_acmpdu_common_control_header(
+                    message_type=at.JDKSAVDECC_ACMP_MESSAGE_TYPE_CONNECT_RX_COMMAND,
+                    stream_id=info.stream_id,
+                ),
+                controller_entity_id=info.controller_entity_id,
+                talker_entity_id=info.talker_entity_id,
+                talker_unique_id=info.talker_unique_id,
+                listener_entity_id=uint64_to_eui64(self.my_id),
+                listener_unique_id=listener_unique_id,
+                stream_dest_mac=info.stream_dest_mac,
+                stream_vlan_id=info.stream_vlan_id,
+                flags=info.flags | at.JDKSAVDECC_ACMP_FLAG_FAST_CONNECT,
+            ))
+
     def cancelTimeout(self, commandResponse):
         """
         The cancelTimeout function stops the timeout timer of the inflight entry 
@@ -264,10 +379,11 @@ class ACMPListenerStateMachine(
 
         # assumption: "stops the timeout" means "sets the timout field in the inflight entry to zero"
         
-        matching_inflight_index = self.findMatchingInflightIndex(commandResponse)
+        key = self.findMatchingInflightIndex(commandResponse)
 
-        if matching_inflight_index is not None:
-            self.inflight[matching_inflight_index].timeout = 0
+        if key is not None:
+            # the entry in inflightTimeouts becomes stale
+            self.inflight[key].timeout = 0
 
     def removeInflight(self, commandResponse):
         """
@@ -276,10 +392,61 @@ class ACMPListenerStateMachine(
         The commandResponse may be a copy of the command entry within the inflight entry 
         or may be the response received for that command.
         """
-        matching_inflight_index = self.findMatchingInflightIndex(commandResponse)
-
-        if matching_inflight_index is not None:
-            del self.inflight[matching_inflight_index]
+        key = self.findMatchingInflightIndex(commandResponse)
+
+        if key is not None:
+            infl = self.inflight.pop(key)
+            self.inflightSequenceIDs.pop(infl.command.sequence_id, None)
+
+    def addInflight(self, inflightCommand):
+        key = inflightKey(inflightCommand.command)
+        previous = self.inflight.get(key)
+        if previous is not None:
+            # replaced by a newer command for the same stream
+            self.inflightSequenceIDs.pop(previous.command.sequence_id, None)
+        self.inflight[key] = inflightCommand
+        self.inflightSequenceIDs[inflightCommand.command.sequence_id] = key
+        self.scheduleTimeout(key, inflightCommand)
+
+    def scheduleTimeout(self, key, inflightCommand):
+        heapq.heappush(self.inflightTimeouts, (inflightCommand.timeout, next(self.inflightOrder), key))
+
+    def expiredInflights(self, ct):
+        """
+        Returns the inflight entries whose timeout has passed, in timeout order
+        """
+        expired = []
+        while self.inflightTimeouts and self.inflightTimeouts[0][0] <= ct:
+            timeout, _, key = heapq.heappop(self.inflightTimeouts)
+            infl = self.inflight.get(key)
+            if infl is not None and infl.timeout == timeout and timeout != 0:
+                expired.append(infl)
+        return expired
+
+    def nextTimeout(self):
+        """
+        Returns the earliest pending timeout, or None
+        """
+        while self.inflightTimeouts:
+            timeout, _, key = self.inflightTimeouts[0]
+            infl = self.inflight.get(key)
+            if infl is not None and infl.timeout == timeout and timeout != 0:
+                return timeout
+            heapq.heappop(self.inflightTimeouts) # stale
+        return None
+
+    def processTimeouts(self, ct):
+        """
+        Handles all inflight commands whose timeout has passed at ct
+        """
+        for infl in self.expiredInflights(ct):
+            if infl.command.header.message_type == at.JDKSAVDECC_ACMP_MESSAGE_TYPE_CONNECT_TX_COMMAND:
+                # CONNECT TX TIMEOUT
+                self._handleConnectTxTimeout(infl)
+            
+            elif infl.command.header.message_type == at.JDKSAVDECC_ACMP_MESSAGE_TYPE_DISCONNECT_TX_COMMAND:
+                # DISCONNECT TX TIMEOUT
+                self._handleDisconnectTxTimeout(infl)
 
     def getState(self, command):
         """
@@ -328,43 +495,56 @@ class ACMPListenerStateMachine(
         does not match the acquiring ATDECC Controller’s Entity ID. Otherwise it returns FALSE.
         """
 
-        # TODO we implement the Entity Model, hence option 2 applies
-        # the issue is, we have no access to AEM from here, we need to inject it
-        return False
+        # we implement the Entity Model, hence option 2 applies
+        # the STREAM_INPUT index is the listener_unique_id
+        if self.ownership is None:
+            return False
+        return self.ownership.isAcquiredOrLockedByOther(
+            eui64_to_uint64(commandResponse.controller_entity_id),
+            at.JDKSAVDECC_DESCRIPTOR_STREAM_INPUT,
+            commandResponse.listener_unique_id)
 
     def findMatchingInflightIndex(self, commandResponse):
-        return next((index for index, item in enumerate(self.inflight) if (
-            eui64_to_uint64(item.command.controller_entity_id) == eui64_to_uint64(commandResponse.controller_entity_id) and
-            eui64_to_uint64(item.command.talker_entity_id) == eui64_to_uint64(commandResponse.talker_entity_id) and
-            item.command.talker_unique_id == commandResponse.talker_unique_id and
-            eui64_to_uint64(item.command.listener_entity_id) == eui64_to_uint64(commandResponse.listener_entity_id) and
-            item.command.listener_unique_id == commandResponse.listener_unique_id
-        )), None)
+        """
+        Returns the key of the inflight entry matching commandResponse, or None
+
+        The entry is looked up by the sequence_id, the stream has to match as well.
+        """
+        key = self.inflightSequenceIDs.get(commandResponse.sequence_id)
+        if key is not None and key == inflightKey(commandResponse):
+            return key
+        return None
+
+    def originalSequenceID(self, commandResponse):
+        """
+        Returns the controller's sequence_id of the inflight command matching commandResponse
+        """
+        key = self.findMatchingInflightIndex(commandResponse)
+        if key is None:
+            return commandResponse.sequence_id
+        return self.inflight[key].original_sequence_id
 
     def _handleConnectTxTimeout(self, infl):
         if infl.retried:
-            response = infl.command
+            response = type(infl.command).from_buffer_copy(infl.command)
             response.sequence_id = infl.original_sequence_id
-            listenerInfo = self.listenerStreamInfos[self.rcvdCmdResp.listener_unique_id]
+            listenerInfo = self.listenerStreamInfos[infl.command.listener_unique_id]
             listenerInfo.pending_connection = False
             self.txResponse(at.JDKSAVDECC_ACMP_MESSAGE_TYPE_CONNECT_RX_RESPONSE, response, at.JDKSAVDECC_ACMP_STATUS_LISTENER_TALKER_TIMEOUT)
+            self.removeInflight(infl.command)
         else:
-            # Retry
+            # Retry, updates the inflight entry
             self.txCommand(at.JDKSAVDECC_ACMP_MESSAGE_TYPE_CONNECT_TX_COMMAND, infl.command, True)
-            # this happens instead of self.removeInflight, apparently
-            infl.retried = True
-            self.retried.append(infl)
 
     def _handleDisconnectTxTimeout(self, infl):
         if infl.retried:
-            response = infl.command
+            response = type(infl.command).from_buffer_copy(infl.command)
             response.sequence_id = infl.original_sequence_id
             self.txResponse(at.JDKSAVDECC_ACMP_MESSAGE_TYPE_DISCONNECT_RX_RESPONSE, response, at.JDKSAVDECC_ACMP_STATUS_LISTENER_TALKER_TIMEOUT)
+            self.removeInflight(infl.command)
         else:
+            # Retry, updates the inflight entry
             self.txCommand(at.JDKSAVDECC_ACMP_MESSAGE_TYPE_DISCONNECT_TX_COMMAND, infl.command, True)
-            # this happens instead of self.removeInflight, apparently
-            infl.retried = True
-            self.retried.append(infl)
 
     def _handleConnectRxCommand(self, command):
         if self.validListenerUnique(command.listener_unique_id):
@@ -381,8 +561,6 @@ class ACMPListenerStateMachine(
         else:
             self.txResponse(at.JDKSAVDECC_ACMP_MESSAGE_TYPE_CONNECT_RX_RESPONSE, command, at.JDKSAVDECC_ACMP_STATUS_LISTENER_UNKNOWN_ID)
 
-        self.rcvdConnectRXCmd = False
-
     def _handleConnectTxResponse(self, command):
         if self.validListenerUnique(command.listener_unique_id):
             if command.header.status == at.JDKSAVDECC_ACMP_STATUS_SUCCESS:
@@ -393,12 +571,12 @@ class ACMPListenerStateMachine(
             listenerInfo = self.listenerStreamInfos[command.listener_unique_id]
             listenerInfo.pending_connection = False
         
-            # response.sequence_id = inflight[x].original_sequence_id # ????
+            sequence_id = self.originalSequenceID(command)
             self.cancelTimeout(command)
             self.removeInflight(command)
+            # the controller gets its own sequence_id back
+            response.sequence_id = sequence_id
             self.txResponse(at.JDKSAVDECC_ACMP_MESSAGE_TYPE_CONNECT_RX_RESPONSE, response, status)
-        
-        self.rcvdConnectTXResp = False
 
     def _handleGetRxState(self, command):
         if self.validListenerUnique(command.listener_unique_id):
@@ -408,8 +586,6 @@ class ACMPListenerStateMachine(
         
         self.txResponse(at.JDKSAVDECC_ACMP_MESSAGE_TYPE_GET_RX_STATE_RESPONSE, response, error)
 
-        self.rcvdGetRXState = False
-
     def _handleDisconnectRxCommand(self, command):
         if self.validListenerUnique(command.listener_unique_id):
             if self.listenerIsConnectedTo(command):
@@ -423,19 +599,40 @@ class ACMPListenerStateMachine(
         else:
             self.txResponse(at.JDKSAVDECC_ACMP_MESSAGE_TYPE_DISCONNECT_RX_RESPONSE, command, at.JDKSAVDECC_ACMP_STATUS_LISTENER_UNKNOWN_ID)
 
-        self.rcvdDisconnectRXCmd = False
-
     def _handleDisconnectTxResponse(self, command):
         if self.validListenerUnique(command.listener_unique_id):
             response, status = (command, command.header.status)
 
-            # response.sequence_id = inflight[x].original_sequence_id # ???
+            sequence_id = self.originalSequenceID(command)
             self.cancelTimeout(command)
             self.removeInflight(command)
+            # the controller gets its own sequence_id back
+            response.sequence_id = sequence_id
             self.txResponse(at.JDKSAVDECC_ACMP_MESSAGE_TYPE_DISCONNECT_RX_RESPONSE, response, status)
 
-            self.rcvdDisconnectTXResp = False
+    # message_type -> name of the handler method
+    handlers = {
+        at.JDKSAVDECC_ACMP_MESSAGE_TYPE_CONNECT_RX_COMMAND: '_handleConnectRxCommand',
+        at.JDKSAVDECC_ACMP_MESSAGE_TYPE_CONNECT_TX_RESPONSE: '_handleConnectTxResponse',
+        at.JDKSAVDECC_ACMP_MESSAGE_TYPE_GET_RX_STATE_COMMAND: '_handleGetRxState',
+        at.JDKSAVDECC_ACMP_MESSAGE_TYPE_DISCONNECT_RX_COMMAND: '_handleDisconnectRxCommand',
+        at.JDKSAVDECC_ACMP_MESSAGE_TYPE_DISCONNECT_TX_RESPONSE: '_handleDisconnectTxResponse',
+    }
+
+    def processCommandResponse(self, cmd):
+        """
+        Dispatches a received ACMPDU to the handler for its message_type
+        """
+        if eui64_to_uint64(cmd.listener_entity_id) != self.my_id:
+            return
+
+        handler = self.handlers.get(cmd.header.message_type)
+        if handler is None:
+            logging.debug("Ignoring ACMP message type %d", cmd.header.message_type)
+            return
 
+        logging.debug("Received ACMP message type %d", cmd.header.message_type)
+        getattr(self, handler)(cmd)
 
     def run(self):
         logging.debug("ACMPListenerStateMachine: Starting thread")
@@ -443,82 +640,43 @@ class ACMPListenerStateMachine(
         for intf in self.interfaces:
             intf.register_acmp_cb(self.acmp_cb)
 
-        while True:
-            self.rcvdConnectRXCmd = False
-            self.rcvdDisconnectRXCmd = False
-            self.rcvdConnectTXResp = False
-            self.rcvdDisconnectTXResp = False
-            self.rcvdGetRXState = False
+        try:
+            self.fastConnect()
+        except Exception as e:
+            traceback.print_exc()
 
+        while True:
             if self.rcvdCmdResp.empty():
-                self.event.wait(1)
+                # sleep until the next timeout is due
+                wait = self.maxWait
+                nextTimeout = self.nextTimeout()
+                if nextTimeout is not None:
+                    wait = min(wait, max(0, nextTimeout-self.currentTime))
+                self.event.wait(wait)
                 # signalled
                 self.event.clear()
                 
             if self.doTerminate:
                 break
-                
-            try:
-                cmd = self.rcvdCmdResp.get_nowait()
-            except Empty:
-                pass
-            
+
             try:
                 # check timeouts
-                ct = self.currentTime
-                self.retried = []
-
-                # self.inflight: list struct_jdksavdecc_acmpdu
-
-                if len(self.inflight):
-                    while len(self.inflight) and ct >= self.inflight[0].timeout:
-                        # this happens instead of self.removeInflight, apparently
-                        infl = self.inflight.pop(0)
-                        if infl.command.header.message_type == at.JDKSAVDECC_ACMP_MESSAGE_TYPE_CONNECT_TX_COMMAND:
-                            # CONNECT TX TIMEOUT
-                            self._handleConnectTxTimeout(infl)
-                        
-                        elif infl.command.header.message_type == at.JDKSAVDECC_ACMP_MESSAGE_TYPE_DISCONNECT_TX_COMMAND:
-                            # DISCONNECT TX TIMEOUT
-                            self._handleDisconnectTxTimeout(infl)
-                        
-                # reinsert retries into inflights
-                for infl in self.retried[::-1]:
-                    self.inflight.insert(0, infl)
-            
-                if self.rcvdConnectRXCmd and eui64_to_uint64(cmd.listener_entity_id) == self.my_id:
-                    # CONNECT RX COMMAND
-                    logging.debug("Received Connect RX command")
-
-                    self._handleConnectRxCommand(cmd)
-
-                if self.rcvdConnectTXResp and eui64_to_uint64(cmd.listener_entity_id) == self.my_id:
-                    # CONNECT TX RESPONSE
-                    logging.debug("Received Connect TX response")
-
-                    self._handleConnectTxResponse(cmd)
-
-                if self.rcvdGetRXState and eui64_to_uint64(cmd.listener_entity_id) == self.my_id:
-                    # GET STATE
-                    logging.debug("Received Get State")
-
-                    self._handleGetRxState(cmd)
-
-                if self.rcvdDisconnectRXCmd and eui64_to_uint64(cmd.listener_entity_id) == self.my_id:
-                    # DISCONNECT RX COMMAND
-                    logging.debug("Received Disconnect RX command")
-
-                    self._handleDisconnectRxCommand(cmd)
-
-                if self.rcvdDisconnectTXResp and eui64_to_uint64(cmd.listener_entity_id) == self.my_id:
-                    # DISCONNECT TX RESPONSE
-                    logging.debug("Received Disconnect TX response")
-
-                    self._handleDisconnectTxResponse(cmd)
-
+                self.processTimeouts(self.currentTime)
             except Exception as e:
                 traceback.print_exc()
-#                logging.error("Exception: %s", e)
+
+            # handle a batch of received messages
+            for _ in range(self.batchSize):
+                try:
+                    cmd = self.rcvdCmdResp.get_nowait()
+                except Empty:
+                    break
+
+                try:
+                    self.processCommandResponse(cmd)
+                except Exception as e:
+                    traceback.print_exc()
+#                    logging.error("Exception: %s", e)
 
         for intf in self.interfaces:
             intf.unregister_acmp_cb(self.acmp_cb)
@@ -0,0 +1,245 @@
+from threading import Thread, Event
+from queue import Queue, Empty
+from collections import deque
+import concurrent.futures
+import asyncio
+import copy
+import heapq
+import itertools
+import logging
+import time
+import traceback
+
+from .. import atdecc_api as at
+from ..adp import GlobalStateMachine
+from ..util import *
+from ..pdu_print import *
+from ..acmp import timeout_values
+
+
+class ACMPControllerCommand:
+    """
+    A command of the ACMPController, waiting to be sent or inflight
+    """
+    __slots__ = ('messageType', 'command', 'future', 'timeout', 'retried')
+
+    def __init__(self, messageType, command, future):
+        self.messageType = messageType
+        self.command = command
+        self.future = future
+        self.timeout = 0
+        self.retried = False
+
+
+class ACMPController(
+    GlobalStateMachine,
+    Thread
+    ):
+    """
+    ATDECC Controller client for ACMP (IEEE 1722.1-2021, section 8.2.2).
+
+    connect, disconnect and getRxState return a concurrent.futures.Future
+    resolving to the response ACMPDU (see its header.status),
+    or failing with TimeoutError if the listener did not answer a retry.
+    The *_async variants are awaitable in asyncio.
+
+    At most window commands are inflight, the others wait in submission order.
+    Timeouts are the values of Table 8-1, a command is retried once.
+    """
+
+    responseTypes = (
+        at.JDKSAVDECC_ACMP_MESSAGE_TYPE_CONNECT_RX_RESPONSE,
+        at.JDKSAVDECC_ACMP_MESSAGE_TYPE_DISCONNECT_RX_RESPONSE,
+        at.JDKSAVDECC_ACMP_MESSAGE_TYPE_GET_RX_STATE_RESPONSE,
+    )
+
+    def __init__(self, entity_id, interfaces, window=64, clock=time.monotonic):
+        super(ACMPController, self).__init__(daemon=True)
+        self.event = Event()
+        self.doTerminate = False
+        self.interfaces = interfaces
+        self.clock = clock
+
+        self.my_id = entity_id
+        self.window = window
+        self.sequenceIDs = SequenceIDAllocator()
+        self.requests = Queue() # ACMPControllerCommand, submitted by other threads
+        self.rcvdResponses = Queue() # received ACMPDUs
+        self.pending = deque() # ACMPControllerCommand waiting for a free slot in the window
+        self.inflight = {} # sequence_id -> ACMPControllerCommand
+        self.inflightTimeouts = [] # heap of (timeout, order, sequence_id), entries are stale if the command is gone or retried
+        self.inflightOrder = itertools.count()
+
+    @property
+    def currentTime(self):
+        return self.clock()
+
+    def performTerminate(self):
+        self.doTerminate = True
+        logging.debug("doTerminate")
+        self.event.set()
+
+    def acmp_cb(self, acmpdu: at.struct_jdksavdecc_acmpdu):
+        if acmpdu.header.message_type in self.responseTypes and \
+           eui64_to_uint64(acmpdu.controller_entity_id) == self.my_id:
+            # copy structure (will probably be overwritten)
+            self.rcvdResponses.put(copy.deepcopy(acmpdu))
+            self.event.set()
+
+    def submit(self, messageType, talker_entity_id, talker_unique_id, listener_entity_id, listener_unique_id, flags=0):
+        future = concurrent.futures.Future()
+        command = at.struct_jdksavdecc_acmpdu(
+            header=at.struct_jdksavdecc_acmpdu_common_control_header(
+                message_type=messageType,
+            ),
+            controller_entity_id=uint64_to_eui64(self.my_id),
+            talker_entity_id=uint64_to_eui64(talker_entity_id),
+            talker_unique_id=talker_unique_id,
+            listener_entity_id=uint64_to_eui64(listener_entity_id),
+            listener_unique_id=listener_unique_id,
+            flags=flags,
+        )
+        self.requests.put(ACMPControllerCommand(messageType, command, future))
+        self.event.set()
+        return future
+
+    def connect(self, talker_entity_id, talker_unique_id, listener_entity_id, listener_unique_id, flags=0):
+        return self.submit(at.JDKSAVDECC_ACMP_MESSAGE_TYPE_CONNECT_RX_COMMAND,
+                           talker_entity_id, talker_unique_id, listener_entity_id, listener_unique_id, flags)
+
+    def disconnect(self, talker_entity_id, talker_unique_id, listener_entity_id, listener_unique_id):
+        return self.submit(at.JDKSAVDECC_ACMP_MESSAGE_TYPE_DISCONNECT_RX_COMMAND,
+                           talker_entity_id, talker_unique_id, listener_entity_id, listener_unique_id)
+
+    def getRxState(self, listener_entity_id, listener_unique_id):
+        return self.submit(at.JDKSAVDECC_ACMP_MESSAGE_TYPE_GET_RX_STATE_COMMAND,
+                           0, 0, listener_entity_id, listener_unique_id)
+
+    def connect_many(self, connections, flags=0):
+        """
+        Connect a routing matrix, an iterable of
+        (talker_entity_id, talker_unique_id, listener_entity_id, listener_unique_id).
+        Returns the list of futures, the commands are pipelined within the window.
+        """
+        return [self.connect(*connection, flags=flags) for connection in connections]
+
+    def disconnect_many(self, connections):
+        return [self.disconnect(*connection) for connection in connections]
+
+    async def connect_async(self, *args, **kwargs):
+        return await asyncio.wrap_future(self.connect(*args, **kwargs))
+
+    async def disconnect_async(self, *args, **kwargs):
+        return await asyncio.wrap_future(self.disconnect(*args, **kwargs))
+
+    async def getRxState_async(self, *args, **kwargs):
+        return await asyncio.wrap_future(self.getRxState(*args, **kwargs))
+
+    def _tx(self, entry):
+        for intf in self.interfaces:
+            intf.send_acmp(entry.command, entry.messageType, at.JDKSAVDECC_ACMP_STATUS_SUCCESS)
+
+    def _schedule(self, sequence_id, entry):
+        # Table 8-1 timeouts of the RX commands
+        entry.timeout = self.currentTime + timeout_values[entry.messageType]/1000.
+        heapq.heappush(self.inflightTimeouts, (entry.timeout, next(self.inflightOrder), sequence_id))
+
+    def processRequests(self):
+        while True:
+            try:
+                self.pending.append(self.requests.get_nowait())
+            except Empty:
+                break
+
+    def fillWindow(self):
+        """
+        Send pending commands while there is room in the window
+        """
+        while self.pending and len(self.inflight) < self.window:
+            entry = self.pending.popleft()
+            if entry.future.cancelled():
+                continue
+            sequence_id = self.sequenceIDs.allocate()
+            entry.command.sequence_id = sequence_id
+            self.inflight[sequence_id] = entry
+            self._schedule(sequence_id, entry)
+            self._tx(entry)
+
+    def processResponses(self):
+        while True:
+            try:
+                response = self.rcvdResponses.get_nowait()
+            except Empty:
+                break
+
+            entry = self.inflight.get(response.sequence_id)
+            if entry is None or entry.messageType+1 != response.header.message_type or \
+               eui64_to_uint64(entry.command.listener_entity_id) != eui64_to_uint64(response.listener_entity_id) or \
+               entry.command.listener_unique_id != response.listener_unique_id:
+                # unsolicited or late
+                continue
+
+            del self.inflight[response.sequence_id]
+            try:
+                entry.future.set_result(response)
+            except concurrent.futures.InvalidStateError:
+                pass # cancelled
+
+    def processTimeouts(self, ct):
+        while self.inflightTimeouts and self.inflightTimeouts[0][0] <= ct:
+            timeout, _, sequence_id = heapq.heappop(self.inflightTimeouts)
+            entry = self.inflight.get(sequence_id)
+            if entry is None or entry.timeout != timeout:
+                continue # stale
+            if entry.retried:
+                del self.inflight[sequence_id]
+                try:
+                    entry.future.set_exception(TimeoutError(
+                        f"ACMP message type {entry.messageType} to {eui64_to_uint64(entry.command.listener_entity_id):016x}/{entry.command.listener_unique_id} timed out"))
+                except concurrent.futures.InvalidStateError:
+                    pass # cancelled
+            else:
+                entry.retried = True
+                self._schedule(sequence_id, entry)
+                self._tx(entry)
+
+    def nextTimeout(self):
+        return self.inflightTimeouts[0][0] if self.inflightTimeouts else None
+
+    def run(self):
+        logging.debug("ACMPController: Starting thread")
+
+        for intf in self.interfaces:
+            intf.register_acmp_cb(self.acmp_cb)
+
+        while True:
+            if self.requests.empty() and self.rcvdResponses.empty():
+                # sleep until the next timeout is due
+                wait = 1
+                nextTimeout = self.nextTimeout()
+                if nextTimeout is not None:
+                    wait = min(wait, max(0, nextTimeout-self.currentTime))
+                self.event.wait(wait)
+                # signalled
+                self.event.clear()
+
+            if self.doTerminate:
+                break
+
+            try:
+                self.processRequests()
+                self.processResponses()
+                self.processTimeouts(self.currentTime)
+                self.fillWindow()
+            except Exception as e:
+                traceback.print_exc()
+
+        for intf in self.interfaces:
+            intf.unregister_acmp_cb(self.acmp_cb)
+
+        # commands that have not been answered
+        self.processRequests()
+        for entry in itertools.chain(self.inflight.values(), self.pending):
+            entry.future.cancel()
+
+        logging.debug("ACMPController: Ending thread")
@@ -0,0 +1,90 @@
+import os
+import struct
+import logging
+
+from ..acmp.struct import *
+from ..util import *
+
+
+class ConnectionJournal:
+    """
+    Compact binary journal of the connected listener streams.
+
+    The file consists of a header (magic, version, record count)
+    followed by fixed size records, one per connected stream sink.
+    Writing goes to a temporary file which then replaces the journal file,
+    so that a crash never leaves a truncated journal behind.
+    """
+
+    MAGIC = b'ATCJ'
+    VERSION = 1
+    header = struct.Struct('!4sHI')
+    record = struct.Struct('!HQHQQQHH')
+
+    def __init__(self, path):
+        self.path = path
+
+    def save(self, listenerStreamInfos):
+        """
+        Write the connected entries of listenerStreamInfos, indexed by listener_unique_id
+        """
+        connected = [(listener_unique_id, info) for listener_unique_id, info in enumerate(listenerStreamInfos) if info.connected]
+        buf = bytearray(self.header.size+self.record.size*len(connected))
+        self.header.pack_into(buf, 0, self.MAGIC, self.VERSION, len(connected))
+        offset = self.header.size
+        for listener_unique_id, info in connected:
+            self.record.pack_into(buf, offset,
+                listener_unique_id,
+                eui64_to_uint64(info.talker_entity_id),
+                info.talker_unique_id,
+                eui64_to_uint64(info.controller_entity_id),
+                eui64_to_uint64(info.stream_id),
+                eui48_to_uint64(info.stream_dest_mac),
+                info.stream_vlan_id,
+                info.flags,
+            )
+            offset += self.record.size
+
+        tmp = self.path+'.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(buf)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path)
+
+    def load(self):
+        """
+        Return list of (listener_unique_id, struct_acmp_listener_stream_info) (empty if there is no valid journal)
+        """
+        try:
+            with open(self.path, 'rb') as f:
+                buf = f.read()
+        except FileNotFoundError:
+            return []
+        except OSError as e:
+            logging.warning("Cannot read connection journal: %s", e)
+            return []
+
+        try:
+            magic, version, count = self.header.unpack_from(buf, 0)
+        except struct.error:
+            magic = None
+        if magic != self.MAGIC or version != self.VERSION or \
+           len(buf) != self.header.size+self.record.size*count:
+            logging.warning("Ignoring invalid connection journal %s", self.path)
+            return []
+
+        records = []
+        for listener_unique_id, talker_entity_id, talker_unique_id, controller_entity_id, \
+            stream_id, stream_dest_mac, stream_vlan_id, flags in self.record.iter_unpack(memoryview(buf)[self.header.size:]):
+            records.append((listener_unique_id, struct_acmp_listener_stream_info(
+                talker_entity_id=uint64_to_eui64(talker_entity_id),
+                talker_unique_id=talker_unique_id,
+                connected=True,
+                stream_id=uint64_to_eui64(stream_id),
+                stream_dest_mac=uint64_to_eui48(stream_dest_mac),
+                controller_entity_id=uint64_to_eui64(controller_entity_id),
+                flags=flags,
+                stream_vlan_id=stream_vlan_id,
+            )))
+        return records
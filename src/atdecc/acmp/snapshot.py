@@ -0,0 +1,107 @@
+from collections import deque
+import concurrent.futures
+import logging
+
+from .. import atdecc_api as at
+from ..util import *
+
+
+class ConnectionSnapshot:
+    """
+    Routing matrix of the listeners known to a DiscoveryStateMachine,
+    polled with GET_RX_STATE commands of an ACMPController (IEEE 1722.1-2021, section 8.2.2.5).
+
+    The matrix maps (listener_entity_id, listener_unique_id) to (talker_entity_id, talker_unique_id),
+    or None if the sink is not connected. Sinks which did not answer successfully are missing.
+
+    At most window commands are outstanding, at most perEntity of them for the same listener entity.
+    An entity is polled again only if its ADP available_index changed since its last poll.
+    """
+
+    def __init__(self, controller, discovery, window=32, perEntity=4):
+        self.controller = controller # ACMPController
+        self.discovery = discovery # DiscoveryStateMachine
+        self.window = window
+        self.perEntity = perEntity
+        self.matrix = {}
+        self.polledIndices = {} # listener_entity_id -> available_index of the last poll
+
+    def forget(self, entity_id):
+        self.polledIndices.pop(entity_id, None)
+        for key in [key for key in self.matrix if key[0] == entity_id]:
+            del self.matrix[key]
+
+    def changedEntities(self, entity_ids=None):
+        """
+        Returns {entity_id: entity_info} of the listeners to poll,
+        entities which are no longer discovered are removed from the matrix
+        """
+        entities = {entity_id: entity_info for entity_id, (entity_info, _) in list(self.discovery.entities.items())}
+        if entity_ids is None:
+            entity_ids = set(self.polledIndices) | {key[0] for key in self.matrix} | set(entities)
+
+        changed = {}
+        for entity_id in entity_ids:
+            entity_info = entities.get(entity_id)
+            if entity_info is None or not entity_info.listener_stream_sinks:
+                self.forget(entity_id)
+            elif self.polledIndices.get(entity_id) != entity_info.available_index:
+                changed[entity_id] = entity_info
+        return changed
+
+    def _handleRxState(self, entity_id, listener_unique_id, future):
+        try:
+            response = future.result()
+        except (TimeoutError, concurrent.futures.CancelledError) as e:
+            logging.warning("GET_RX_STATE of %016x/%d failed: %s", entity_id, listener_unique_id, e)
+            # poll the entity again next time
+            self.polledIndices.pop(entity_id, None)
+            return
+
+        if response.header.status != at.JDKSAVDECC_ACMP_STATUS_SUCCESS:
+            logging.debug("GET_RX_STATE of %016x/%d: status %d", entity_id, listener_unique_id, response.header.status)
+            return
+
+        if response.connection_count:
+            self.matrix[(entity_id, listener_unique_id)] = (eui64_to_uint64(response.talker_entity_id), response.talker_unique_id)
+        else:
+            self.matrix[(entity_id, listener_unique_id)] = None
+
+    def snapshot_connections(self, entity_ids=None):
+        """
+        Poll the sinks of the listener entities entity_ids (all discovered listeners if None)
+        whose available_index changed, and return a copy of the routing matrix.
+        The commands are interleaved between the entities, the matrix is updated as the answers arrive.
+        """
+        sinks = {} # entity_id -> deque of listener_unique_ids to poll
+        for entity_id, entity_info in self.changedEntities(entity_ids).items():
+            self.forget(entity_id)
+            self.polledIndices[entity_id] = entity_info.available_index
+            sinks[entity_id] = deque(range(entity_info.listener_stream_sinks))
+
+        outstanding = {} # future -> (entity_id, listener_unique_id)
+        active = dict.fromkeys(sinks, 0) # entity_id -> outstanding commands
+        while sinks or outstanding:
+            # one command per entity and round, within the window and the per entity limit
+            submitted = True
+            while submitted and sinks and len(outstanding) < self.window:
+                submitted = False
+                for entity_id in list(sinks):
+                    if len(outstanding) >= self.window:
+                        break
+                    if active[entity_id] >= self.perEntity:
+                        continue
+                    listener_unique_id = sinks[entity_id].popleft()
+                    if not sinks[entity_id]:
+                        del sinks[entity_id]
+                    outstanding[self.controller.getRxState(entity_id, listener_unique_id)] = (entity_id, listener_unique_id)
+                    active[entity_id] += 1
+                    submitted = True
+
+            done, _ = concurrent.futures.wait(outstanding, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                entity_id, listener_unique_id = outstanding.pop(future)
+                active[entity_id] -= 1
+                self._handleRxState(entity_id, listener_unique_id, future)
+
+        return dict(self.matrix)
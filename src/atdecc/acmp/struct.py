@@ -21,7 +21,7 @@ class struct_acmp_inflight_command(at.Structure):
     pass
 
 struct_acmp_inflight_command._fields_ = [
-    ('timeout', ctypes.c_uint16),
+    ('timeout', ctypes.c_double), # deadline in seconds of the state machine clock
     ('retried', ctypes.c_bool),
     ('command', at.struct_jdksavdecc_acmpdu),
     ('original_sequence_id', ctypes.c_uint16),
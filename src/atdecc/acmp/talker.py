@@ -0,0 +1,294 @@
+from threading import Thread, Event
+from queue import Queue, Empty
+import copy
+import logging
+import traceback
+
+from .. import atdecc_api as at
+from ..adp import GlobalStateMachine
+from ..util import *
+from ..pdu_print import *
+
+
+class TalkerStreamInfo:
+    """
+    IEEE 1722.1-2021, section 8.2.2.6.2.1
+
+    The connected listeners are kept in a list for access by index (GET_TX_CONNECTION)
+    and a dict of their positions, so adding and removing a listener is O(1).
+    Removing a listener moves the last listener into its position.
+    """
+    __slots__ = ('stream_id', 'stream_dest_mac', 'stream_vlan_id', 'connected_listeners', 'listenerPositions')
+
+    def __init__(self, stream_id=0, stream_dest_mac=0, stream_vlan_id=0):
+        self.stream_id = stream_id
+        self.stream_dest_mac = stream_dest_mac
+        self.stream_vlan_id = stream_vlan_id
+        self.connected_listeners = [] # (listener_entity_id, listener_unique_id)
+        self.listenerPositions = {} # (listener_entity_id, listener_unique_id) -> index in connected_listeners
+
+    @property
+    def connection_count(self):
+        return len(self.connected_listeners)
+
+    def addListener(self, listener):
+        """
+        Returns False if the listener was already connected
+        """
+        if listener in self.listenerPositions:
+            return False
+        self.listenerPositions[listener] = len(self.connected_listeners)
+        self.connected_listeners.append(listener)
+        return True
+
+    def removeListener(self, listener):
+        """
+        Returns False if the listener was not connected
+        """
+        index = self.listenerPositions.pop(listener, None)
+        if index is None:
+            return False
+        last = self.connected_listeners.pop()
+        if index < len(self.connected_listeners):
+            self.connected_listeners[index] = last
+            self.listenerPositions[last] = index
+        return True
+
+
+class ACMPTalkerStateMachine(
+    GlobalStateMachine,
+    Thread
+    ):
+    """
+    IEEE 1722.1-2021, section 8.2.3
+
+    ownership is the OwnershipView published by the EntityModelEntityStateMachine.
+    """
+
+    def __init__(self, entity_info, interfaces, ownership=None):
+        super(ACMPTalkerStateMachine, self).__init__()
+        self.ownership = ownership
+        self.event = Event()
+        # a structure of type ACMPCommandResponse containing the next received ACMPDU to be processed
+        self.rcvdCmdResp = Queue()
+        self.doTerminate = False
+        self.interfaces = interfaces
+
+        self.my_id = entity_info.entity_id
+        # one entry per stream source, indexed by talker_unique_id
+        self.talkerStreamInfos = [
+            TalkerStreamInfo(stream_id=(self.my_id & ~0xffff) | talker_unique_id)
+            for talker_unique_id in range(entity_info.talker_stream_sources)
+        ]
+        self.batchSize = 64
+
+    def performTerminate(self):
+        self.doTerminate = True
+        logging.debug("doTerminate")
+        self.event.set()
+
+    def acmp_cb(self, acmpdu: at.struct_jdksavdecc_acmpdu):
+        if eui64_to_uint64(acmpdu.talker_entity_id) == self.my_id:
+            logging.info("ACMP: %s", acmpdu_str(acmpdu))
+            # copy structure (will probably be overwritten), it carries its own message_type
+            self.rcvdCmdResp.put(copy.deepcopy(acmpdu))
+            self.event.set()
+
+    def validTalkerUnique(self, TalkerUniqueId):
+        """
+        The validTalkerUnique function returns a Boolean indicating if the
+        ATDECC TalkerUniqueId passed in is valid for the ATDECC Entity.
+
+        TalkerUniqueIds are the indices 0 to talker_stream_sources-1.
+        """
+        return 0 <= TalkerUniqueId < len(self.talkerStreamInfos)
+
+    def talkerIsAcquiredOrLockedByOther(self, commandResponse):
+        """
+        The talkerIsAcquiredOrLockedByOther function returns a Boolean
+        indicating if the stream has been acquired or locked for exclusive access by another ATDECC Controller.
+        """
+
+        # the STREAM_OUTPUT index is the talker_unique_id
+        if self.ownership is None:
+            return False
+        return self.ownership.isAcquiredOrLockedByOther(
+            eui64_to_uint64(commandResponse.controller_entity_id),
+            at.JDKSAVDECC_DESCRIPTOR_STREAM_OUTPUT,
+            commandResponse.talker_unique_id)
+
+    def _response(self, command, talkerInfo):
+        response = type(command).from_buffer_copy(command)
+        response.header.stream_id = uint64_to_eui64(talkerInfo.stream_id)
+        response.stream_dest_mac = uint64_to_eui48(talkerInfo.stream_dest_mac)
+        response.stream_vlan_id = talkerInfo.stream_vlan_id
+        response.connection_count = talkerInfo.connection_count
+        return response
+
+    def connectTalker(self, command):
+        """
+        The connectTalker function uses the passed in command to add a connection to the ATDECC Talker.
+
+        This function adds the listener_entity_id and listener_unique_id of the command to the
+        connected_listeners of the ATDECC TalkerStreamInfos entry for the talker_unique_id,
+        if they are not already present.
+
+        The connectTalker function returns a response structure with the stream_id, stream_dest_mac,
+        stream_vlan_id and connection_count fields set to the values for the stream,
+        and a status code as defined in Table 8-3.
+        """
+
+        # we don't support SRP
+
+        talkerInfo = self.talkerStreamInfos[command.talker_unique_id]
+        talkerInfo.addListener((eui64_to_uint64(command.listener_entity_id), command.listener_unique_id))
+
+        return [self._response(command, talkerInfo), at.JDKSAVDECC_ACMP_STATUS_SUCCESS]
+
+    def disconnectTalker(self, command):
+        """
+        The disconnectTalker function uses the passed in command to remove a connection from the ATDECC Talker.
+
+        This function removes the listener_entity_id and listener_unique_id of the command from the
+        connected_listeners of the ATDECC TalkerStreamInfos entry for the talker_unique_id.
+
+        The disconnectTalker function returns a response structure with the updated connection_count,
+        and a status code as defined in Table 8-3.
+        """
+
+        talkerInfo = self.talkerStreamInfos[command.talker_unique_id]
+        talkerInfo.removeListener((eui64_to_uint64(command.listener_entity_id), command.listener_unique_id))
+
+        return [self._response(command, talkerInfo), at.JDKSAVDECC_ACMP_STATUS_SUCCESS]
+
+    def getState(self, command):
+        """
+        The getState function returns a response structure filled with the contents of the command parameter,
+        with the stream_id, stream_dest_mac, stream_vlan_id and connection_count fields set to the values
+        for the ATDECC TalkerStreamInfos entry associated with the talker_unique_id.
+        """
+
+        talkerInfo = self.talkerStreamInfos[command.talker_unique_id]
+
+        return [self._response(command, talkerInfo), at.JDKSAVDECC_ACMP_STATUS_SUCCESS]
+
+    def getConnection(self, command):
+        """
+        The getConnection function returns a response structure filled with the contents of the command parameter,
+        with the listener_entity_id and listener_unique_id of the connection indexed by the connection_count field
+        of the command, and the stream_id, stream_dest_mac and stream_vlan_id of the stream.
+        If there is no such connection the status is NO_SUCH_CONNECTION.
+        """
+
+        talkerInfo = self.talkerStreamInfos[command.talker_unique_id]
+        index = command.connection_count
+
+        response = self._response(command, talkerInfo)
+        if index >= talkerInfo.connection_count:
+            response.connection_count = index
+            return [response, at.JDKSAVDECC_ACMP_STATUS_NO_SUCH_CONNECTION]
+
+        listener_entity_id, listener_unique_id = talkerInfo.connected_listeners[index]
+        response.listener_entity_id = uint64_to_eui64(listener_entity_id)
+        response.listener_unique_id = listener_unique_id
+        response.connection_count = index
+
+        return [response, at.JDKSAVDECC_ACMP_STATUS_SUCCESS]
+
+    def txResponse(self, messageType, response, error):
+        """
+        The txResponse function transmits a response of type messageType.
+        It sets the ACMPDU fields to the values from the response parameter,
+        the message_type field to the value of messageType and the status field to the value of the error parameter.
+        """
+        for intf in self.interfaces:
+            intf.send_acmp(response, messageType, error)
+
+    def _handleConnectTxCommand(self, command):
+        if self.validTalkerUnique(command.talker_unique_id):
+            if self.talkerIsAcquiredOrLockedByOther(command):
+                response, status = (command, at.JDKSAVDECC_ACMP_STATUS_CONTROLLER_NOT_AUTHORIZED)
+            else:
+                response, status = self.connectTalker(command)
+        else:
+            response, status = (command, at.JDKSAVDECC_ACMP_STATUS_TALKER_UNKNOWN_ID)
+
+        self.txResponse(at.JDKSAVDECC_ACMP_MESSAGE_TYPE_CONNECT_TX_RESPONSE, response, status)
+
+    def _handleDisconnectTxCommand(self, command):
+        if self.validTalkerUnique(command.talker_unique_id):
+            response, status = self.disconnectTalker(command)
+        else:
+            response, status = (command, at.JDKSAVDECC_ACMP_STATUS_TALKER_UNKNOWN_ID)
+
+        self.txResponse(at.JDKSAVDECC_ACMP_MESSAGE_TYPE_DISCONNECT_TX_RESPONSE, response, status)
+
+    def _handleGetTxState(self, command):
+        if self.validTalkerUnique(command.talker_unique_id):
+            response, status = self.getState(command)
+        else:
+            response, status = (command, at.JDKSAVDECC_ACMP_STATUS_TALKER_UNKNOWN_ID)
+
+        self.txResponse(at.JDKSAVDECC_ACMP_MESSAGE_TYPE_GET_TX_STATE_RESPONSE, response, status)
+
+    def _handleGetTxConnection(self, command):
+        if self.validTalkerUnique(command.talker_unique_id):
+            response, status = self.getConnection(command)
+        else:
+            response, status = (command, at.JDKSAVDECC_ACMP_STATUS_TALKER_UNKNOWN_ID)
+
+        self.txResponse(at.JDKSAVDECC_ACMP_MESSAGE_TYPE_GET_TX_CONNECTION_RESPONSE, response, status)
+
+    # message_type -> name of the handler method
+    handlers = {
+        at.JDKSAVDECC_ACMP_MESSAGE_TYPE_CONNECT_TX_COMMAND: '_handleConnectTxCommand',
+        at.JDKSAVDECC_ACMP_MESSAGE_TYPE_DISCONNECT_TX_COMMAND: '_handleDisconnectTxCommand',
+        at.JDKSAVDECC_ACMP_MESSAGE_TYPE_GET_TX_STATE_COMMAND: '_handleGetTxState',
+        at.JDKSAVDECC_ACMP_MESSAGE_TYPE_GET_TX_CONNECTION_COMMAND: '_handleGetTxConnection',
+    }
+
+    def processCommandResponse(self, cmd):
+        """
+        Dispatches a received ACMPDU to the handler for its message_type
+        """
+        if eui64_to_uint64(cmd.talker_entity_id) != self.my_id:
+            return
+
+        handler = self.handlers.get(cmd.header.message_type)
+        if handler is None:
+            return
+
+        logging.debug("Received ACMP message type %d", cmd.header.message_type)
+        getattr(self, handler)(cmd)
+
+    def run(self):
+        logging.debug("ACMPTalkerStateMachine: Starting thread")
+
+        for intf in self.interfaces:
+            intf.register_acmp_cb(self.acmp_cb)
+
+        while True:
+            if self.rcvdCmdResp.empty():
+                self.event.wait(1)
+                # signalled
+                self.event.clear()
+
+            if self.doTerminate:
+                break
+
+            # handle a batch of received messages
+            for _ in range(self.batchSize):
+                try:
+                    cmd = self.rcvdCmdResp.get_nowait()
+                except Empty:
+                    break
+
+                try:
+                    self.processCommandResponse(cmd)
+                except Exception as e:
+                    traceback.print_exc()
+
+        for intf in self.interfaces:
+            intf.unregister_acmp_cb(self.acmp_cb)
+
+        logging.debug("ACMPTalkerStateMachine: Ending thread")
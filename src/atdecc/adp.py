@@ -1,14 +1,17 @@
 import time
 import random
 import logging
-import copy
-from threading import Thread, Event
+import os
+import struct
+from threading import Thread, Event, Condition, Lock, RLock
 from queue import Queue, Empty
+from collections import OrderedDict
 
 from .pdu import *
 from .pdu_print import *
 from .aem import *
 from .util import *
+from .aecp.counters import *
 
 class EntityInfo:
     """
@@ -75,6 +78,44 @@ class EntityInfo:
             association_id=uint64_to_eui64(self.association_id),
         )
 
+    @classmethod
+    def from_adpdu(cls, adpdu):
+        """
+        Create EntityInfo from a received ADPDU (the inverse of get_adpdu)
+        """
+        entity_info = cls(
+            valid_time=adpdu.header.valid_time*2,
+            entity_id=eui64_to_uint64(adpdu.header.entity_id),
+            entity_model_id=eui64_to_uint64(adpdu.entity_model_id),
+            entity_capabilities=adpdu.entity_capabilities,
+            talker_stream_sources=adpdu.talker_stream_sources,
+            talker_capabilities=adpdu.talker_capabilities,
+            listener_stream_sinks=adpdu.listener_stream_sinks,
+            listener_capabilities=adpdu.listener_capabilities,
+            controller_capabilities=adpdu.controller_capabilities,
+            gptp_grandmaster_id=eui64_to_uint64(adpdu.gptp_grandmaster_id),
+            gptp_domain_number=adpdu.gptp_domain_number,
+            current_configuration_index=adpdu.current_configuration_index,
+            identify_control_index=adpdu.identify_control_index,
+            interface_index=adpdu.interface_index,
+            association_id=eui64_to_uint64(adpdu.association_id),
+        )
+        entity_info.available_index = adpdu.available_index
+        return entity_info
+
+
+def entityInfoChanged(previous, current):
+    """
+    Returns True if the advertised state of an entity has changed.
+    A regular increment of available_index is not a change, 
+    whereas a decrement means that the entity has restarted.
+    """
+    if current.available_index < previous.available_index:
+        return True
+    a = vars(previous)
+    b = vars(current)
+    return any(a[k] != b.get(k) for k in a if k != 'available_index')
+
 
 class GlobalStateMachine:
     """
@@ -165,6 +206,198 @@ class AdvertisingEntityStateMachine(
         logging.debug("AdvertisingEntityStateMachine: Ending thread")
 
 
+class DiscoverTarget:
+    """
+    ADPDU source for an ENTITY_DISCOVER.
+    IEEE 1722.1-2021, section 6.2.1: all fields except the entity_id are zero
+    """
+
+    def __init__(self, entity_id=0):
+        self.entity_id = entity_id
+
+    def get_adpdu(self):
+        return at.struct_jdksavdecc_adpdu()
+
+
+class EntityCache:
+    """
+    Compact binary snapshot of a discovered entity table.
+
+    The file consists of a header (magic, version, save time, record count)
+    followed by fixed size records, one per entity.
+    Writing goes to a temporary file which then replaces the cache file, 
+    so that a crash never leaves a truncated cache behind.
+    """
+
+    MAGIC = b'ATEC'
+    VERSION = 1
+    header = struct.Struct('!4sHdI')
+    record = struct.Struct('!fQQIHHHHIIQBHHHQ')
+    fields = (
+        'valid_time',
+        'entity_id',
+        'entity_model_id',
+        'entity_capabilities',
+        'talker_stream_sources',
+        'talker_capabilities',
+        'listener_stream_sinks',
+        'listener_capabilities',
+        'controller_capabilities',
+        'available_index',
+        'gptp_grandmaster_id',
+        'gptp_domain_number',
+        'current_configuration_index',
+        'identify_control_index',
+        'interface_index',
+        'association_id',
+    )
+
+    def __init__(self, path, max_age=3600):
+        self.path = path
+        self.max_age = max_age # in seconds, older caches are ignored
+
+    def save(self, entity_infos, now=None):
+        entity_infos = list(entity_infos)
+        buf = bytearray(self.header.size+self.record.size*len(entity_infos))
+        self.header.pack_into(buf, 0, self.MAGIC, self.VERSION, 
+                              time.time() if now is None else now, len(entity_infos))
+        offset = self.header.size
+        for entity_info in entity_infos:
+            self.record.pack_into(buf, offset, *(getattr(entity_info, f) for f in self.fields))
+            offset += self.record.size
+
+        tmp = self.path+'.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(buf)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path)
+
+    def load(self, now=None):
+        """
+        Return list of cached EntityInfo (empty if there is no valid cache)
+        """
+        try:
+            with open(self.path, 'rb') as f:
+                buf = f.read()
+        except FileNotFoundError:
+            return []
+        except OSError as e:
+            logging.warning("Cannot read entity cache: %s", e)
+            return []
+
+        try:
+            magic, version, saved, count = self.header.unpack_from(buf, 0)
+        except struct.error:
+            magic = None
+        if magic != self.MAGIC or version != self.VERSION or \
+           len(buf) != self.header.size+self.record.size*count:
+            logging.warning("Ignoring invalid entity cache %s", self.path)
+            return []
+
+        if self.max_age is not None and (time.time() if now is None else now)-saved > self.max_age:
+            logging.debug("Ignoring outdated entity cache %s", self.path)
+            return []
+
+        entity_infos = []
+        for values in self.record.iter_unpack(memoryview(buf)[self.header.size:]):
+            entity_info = EntityInfo()
+            for f, v in zip(self.fields, values):
+                setattr(entity_info, f, v)
+            entity_infos.append(entity_info)
+        return entity_infos
+
+
+class DiscoveryEvent:
+    """
+    Kinds of entity table changes published by the DiscoveryStateMachine
+    """
+    ADDED = 1
+    UPDATED = 2
+    REMOVED = 3
+
+
+class DiscoverySubscription:
+    """
+    Filtered view on the entity table of a DiscoveryStateMachine.
+
+    Events are kept in a bounded queue holding at most one pending event per entity.
+    A newer event for an entity replaces the pending one, so that a slow consumer 
+    sees the latest state of each entity instead of a backlog.
+    If more than maxsize entities are pending, an event is dropped and resync is set: 
+    the consumer should then clear it and re-read the entities of the DiscoveryStateMachine.
+    The oldest ADDED/UPDATED event is dropped first, REMOVED events only if nothing else is pending.
+    """
+
+    def __init__(self, entity_ids=None, capabilities=0, entity_model_id=None, maxsize=256):
+        self.entity_ids = None if entity_ids is None else frozenset(entity_ids)
+        self.capabilities = capabilities # all bits must be set in entity_capabilities
+        self.entity_model_id = entity_model_id
+        self.maxsize = maxsize
+        self.dropped = 0
+        self.resync = False
+        self._pending = OrderedDict() # entity_id -> (event, entity_info)
+        self._cond = Condition()
+
+    def matches(self, entity_info):
+        if self.entity_ids is not None and entity_info.entity_id not in self.entity_ids:
+            return False
+        if entity_info.entity_capabilities & self.capabilities != self.capabilities:
+            return False
+        if self.entity_model_id is not None and entity_info.entity_model_id != self.entity_model_id:
+            return False
+        return True
+
+    def put(self, event, entity_info):
+        """
+        Queue an event, coalescing it with a pending event for the same entity.
+        Never blocks.
+        """
+        eid = entity_info.entity_id
+        with self._cond:
+            try:
+                pending, _ = self._pending.pop(eid)
+            except KeyError:
+                pending = None
+
+            if pending == DiscoveryEvent.ADDED:
+                if event == DiscoveryEvent.REMOVED:
+                    # consumer has never seen the entity
+                    return
+                event = DiscoveryEvent.ADDED
+            elif pending == DiscoveryEvent.REMOVED and event == DiscoveryEvent.ADDED:
+                event = DiscoveryEvent.UPDATED
+
+            self._pending[eid] = (event, entity_info)
+            if len(self._pending) > self.maxsize:
+                for key, (ev, _) in self._pending.items():
+                    if ev != DiscoveryEvent.REMOVED:
+                        del self._pending[key]
+                        break
+                else:
+                    self._pending.popitem(last=False)
+                self.dropped += 1
+                self.resync = True
+            self._cond.notify()
+
+    def get(self, timeout=None):
+        """
+        Return the next (event, entity_info) tuple. 
+        Raises queue.Empty if nothing arrives within timeout seconds.
+        """
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._pending, timeout):
+                raise Empty()
+            _, item = self._pending.popitem(last=False)
+            return item
+
+    def get_nowait(self):
+        return self.get(timeout=0)
+
+    def qsize(self):
+        return len(self._pending)
+
+
 class DiscoveryStateMachine(
     GlobalStateMachine, 
     Thread
@@ -176,24 +409,64 @@ class DiscoveryStateMachine(
     requiring Entity discovery
     """
 
-    def __init__(self, interfaces, discoverID=0):
+    def __init__(self, interfaces, discoverID=0, 
+                 cache=None, cacheInterval=10, 
+                 confirmTimeout=1, discoverBatch=16, discoverInterval=0.05):
         super(DiscoveryStateMachine, self).__init__()
 
         self.discoverID = discoverID # 0 discovers everything
         self.rcvdEntityInfo = None
         self.rcvdAvailable = False
         self.rcvdDeparting = False
+        self.rcvdADP = Queue()
 
         self.doDiscover = False
         self.doTerminate = False
         self.event = Event()
 
         self.entities = {}
-        self.interfaces = []
+        self.interfaces = interfaces
+        self.subscriptions = []
+        self.subscriptionLock = RLock() # entity table changes and their publication are atomic for subscribe
+
+        # warm start
+        self.cache = cache # EntityCache or None
+        self.cacheInterval = cacheInterval # seconds between cache writes
+        self.nextCacheWrite = 0
+        self.cacheDirty = False # entity table changed since the last cache write
+        self.confirmTimeout = confirmTimeout # seconds of margin on top of the responder's randomDeviceDelay
+        self.unconfirmed = set() # entity_ids loaded from cache and not yet seen
+        self.pendingDiscovers = [] # entity_ids waiting for a targeted ENTITY_DISCOVER
+        self.discoverBatch = discoverBatch # targeted discovers per batch
+        self.discoverInterval = discoverInterval # seconds between batches
+        self.nextDiscoverBatch = 0
 
     def performTerminate(self):
         self.doTerminate = True
         self.event.set()
+
+    def subscribe(self, entity_ids=None, capabilities=0, entity_model_id=None, maxsize=256):
+        """
+        Register for ADDED/UPDATED/REMOVED events of entities matching the filter.
+        Entities already known are delivered as ADDED.
+        """
+        subscription = DiscoverySubscription(entity_ids, capabilities, entity_model_id, maxsize)
+        with self.subscriptionLock:
+            for entity_info, _ in self.entities.values():
+                if subscription.matches(entity_info):
+                    subscription.put(DiscoveryEvent.ADDED, entity_info)
+            self.subscriptions = self.subscriptions+[subscription]
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self.subscriptionLock:
+            self.subscriptions = [s for s in self.subscriptions if s is not subscription]
+
+    def publish(self, event, entity_info):
+        with self.subscriptionLock:
+            for subscription in self.subscriptions:
+                if subscription.matches(entity_info):
+                    subscription.put(event, entity_info)
         
     def performDiscover(self):
         self.doDiscover = True
@@ -205,7 +478,71 @@ class DiscoveryStateMachine(
         If the ATDECC Entity has more than one enabled network port, 
         then the same ADPDU is sent out each port.
         """
-        raise NotImplementedError()
+        target = DiscoverTarget(entityID)
+        for intf in self.interfaces:
+            intf.send_adp(at.JDKSAVDECC_ADP_MESSAGE_TYPE_ENTITY_DISCOVER, target)
+
+    def isConfirmed(self, entityID):
+        """
+        False for entities loaded from the cache which have not advertised themselves yet
+        """
+        return entityID in self.entities and entityID not in self.unconfirmed
+
+    def loadCache(self):
+        """
+        Enter the cached entities as unconfirmed and schedule targeted discovers for them.
+        Subscribers get them as ADDED, and as UPDATED once they have confirmed themselves.
+        An entity may delay its answer by up to 1/5 of its valid time (randomDeviceDelay), 
+        entities which do not answer within that plus confirmTimeout are removed.
+        """
+        with self.subscriptionLock:
+            for entity_info in self.cache.load():
+                if entity_info.entity_id and not self.haveEntity(entity_info.entity_id):
+                    self.unconfirmed.add(entity_info.entity_id)
+                    # the timeout starts with the targeted discover
+                    self.entities[entity_info.entity_id] = (entity_info, float('inf'))
+                    self.publish(DiscoveryEvent.ADDED, entity_info)
+                    self.pendingDiscovers.append(entity_info.entity_id)
+        self.cacheDirty = False
+        logging.debug("Loaded %d entities from cache", len(self.unconfirmed))
+
+    def saveCache(self):
+        """
+        Write the entity table if it has changed. 
+        The cache is disabled if it cannot be written.
+        """
+        if not self.cacheDirty:
+            return
+        self.cacheDirty = False
+        with self.subscriptionLock:
+            entity_infos = [entity_info for entity_info, _ in self.entities.values()]
+        try:
+            self.cache.save(entity_infos)
+        except OSError as e:
+            logging.warning("Cannot write entity cache, disabling it: %s", e)
+            self.cache = None
+
+    def txPendingDiscovers(self, ct):
+        """
+        Send the next batch of targeted discovers if the rate limit allows
+        """
+        if self.pendingDiscovers and ct >= self.nextDiscoverBatch:
+            batch = self.pendingDiscovers[:self.discoverBatch]
+            del self.pendingDiscovers[:self.discoverBatch]
+            for entityID in batch:
+                if entityID in self.unconfirmed:
+                    with self.subscriptionLock:
+                        entity_info, _ = self.entities[entityID]
+                        self.entities[entityID] = (entity_info, ct+entity_info.valid_time/5.+self.confirmTimeout)
+                    self.txDiscover(entityID)
+            self.nextDiscoverBatch = ct+self.discoverInterval
+
+    def adp_cb(self, adpdu):
+        message_type = adpdu.header.message_type
+        if message_type == at.JDKSAVDECC_ADP_MESSAGE_TYPE_ENTITY_AVAILABLE or \
+           message_type == at.JDKSAVDECC_ADP_MESSAGE_TYPE_ENTITY_DEPARTING:
+            self.rcvdADP.put((message_type, EntityInfo.from_adpdu(adpdu)))
+            self.event.set()
         
     def haveEntity(self, entityID):
         return entityID in self.entities
@@ -215,11 +552,28 @@ class DiscoveryStateMachine(
         The addEntity function adds a new Entity record to the entities variable with the contents of the entityInfo structure parameter.
 
         """
-        self.updateEntity(entityInfo, ct)
+        if entityInfo.entity_id:
+            with self.subscriptionLock:
+                self.entities[entityInfo.entity_id] = (entityInfo, ct+entityInfo.valid_time)
+                self.cacheDirty = True
+                self.publish(DiscoveryEvent.ADDED, entityInfo)
+        else:
+            logging.warning("entityID == 0")
 
     def updateEntity(self, entityInfo, ct=GlobalStateMachine().currentTime):
         if entityInfo.entity_id:
-            self.entities[entityInfo.entity_id] = (entityInfo, ct+entityInfo.valid_time)
+            with self.subscriptionLock:
+                try:
+                    previous, _ = self.entities[entityInfo.entity_id]
+                except KeyError:
+                    previous = None
+                self.entities[entityInfo.entity_id] = (entityInfo, ct+entityInfo.valid_time)
+                if previous is None:
+                    self.cacheDirty = True
+                    self.publish(DiscoveryEvent.ADDED, entityInfo)
+                elif entityInfoChanged(previous, entityInfo):
+                    self.cacheDirty = True
+                    self.publish(DiscoveryEvent.UPDATED, entityInfo)
         else:
             logging.warning("entityID == 0")
 
@@ -227,51 +581,102 @@ class DiscoveryStateMachine(
         """
         The remove Entity function removes an ATDECC Entity record from the entities variable for an ATDECC Entity whose entity_id matches the eui64 parameter.
         """
-        try:
-            del self.entities[eui64_to_uint64(eui64)]
-        except KeyError:
-            logging.warning("entityID not found in database")
+        with self.subscriptionLock:
+            try:
+                entity_info, _ = self.entities.pop(eui64_to_uint64(eui64))
+            except KeyError:
+                logging.warning("entityID not found in database")
+            else:
+                self.cacheDirty = True
+                self.publish(DiscoveryEvent.REMOVED, entity_info)
             
+    def _handleRcvdEntityInfo(self, ct):
+        # AVAILABLE
+        if self.rcvdAvailable:
+            if self.rcvdEntityInfo.entity_id in self.unconfirmed:
+                # cached entity confirmed
+                self.unconfirmed.discard(self.rcvdEntityInfo.entity_id)
+                with self.subscriptionLock:
+                    self.entities[self.rcvdEntityInfo.entity_id] = (self.rcvdEntityInfo, ct+self.rcvdEntityInfo.valid_time)
+                    self.cacheDirty = True
+                    self.publish(DiscoveryEvent.UPDATED, self.rcvdEntityInfo)
+            elif self.haveEntity(self.rcvdEntityInfo.entity_id):
+                self.updateEntity(self.rcvdEntityInfo, ct)
+            else:
+                self.addEntity(self.rcvdEntityInfo, ct)
+
+        # DEPARTING
+        if self.rcvdDeparting:
+            self.unconfirmed.discard(self.rcvdEntityInfo.entity_id)
+            self.removeEntity(uint64_to_eui64(self.rcvdEntityInfo.entity_id))
+
+        self.rcvdAvailable = False
+        self.rcvdDeparting = False
+
     def run(self):
+        for intf in self.interfaces:
+            intf.register_adp_cb(self.adp_cb)
+
+        if self.cache is not None:
+            self.loadCache()
+
         while True:
             # WAITING
             self.rcvdAvailable = False
             self.rcvdDeparting = False
-            self.doDiscover = False
 
-            self.event.wait(1)
+            # a discover requested before start is sent without waiting
+            if not self.doDiscover:
+                self.event.wait(self.discoverInterval if self.pendingDiscovers else 1)
             if self.doTerminate:
                 break
             self.event.clear()
 
             # DISCOVER
             if self.doDiscover:
+                self.doDiscover = False
                 self.txDiscover(self.discoverID)
 
             ct = self.currentTime
 
-            # AVAILABLE
-            if self.rcvdAvailable:
-                if self.haveEntity(self.rcvdEntityInfo.entity_id):
-                    self.updateEntity(self.rcvdEntityInfo, ct)
-                else:
-                    self.addEntity(self.rcvdEntityInfo, ct)
+            self.txPendingDiscovers(ct)
 
-            # DEPARTING
-            if self.rcvdDeparting:
-                self.removeEntity(uint64_to_eui64(self.rcvdEntityInfo.entity_id))
+            # AVAILABLE / DEPARTING, set directly or queued by adp_cb
+            while True:
+                self._handleRcvdEntityInfo(ct)
+                try:
+                    message_type, self.rcvdEntityInfo = self.rcvdADP.get_nowait()
+                except Empty:
+                    break
+                self.rcvdAvailable = message_type == at.JDKSAVDECC_ADP_MESSAGE_TYPE_ENTITY_AVAILABLE
+                self.rcvdDeparting = message_type == at.JDKSAVDECC_ADP_MESSAGE_TYPE_ENTITY_DEPARTING
 
             # TIMEOUT
-            for key in self.entities:
+            for key in list(self.entities):
                 entity_info, timeout = self.entities[key]
                 if ct >= timeout:
+                    self.unconfirmed.discard(key)
                     self.removeEntity(uint64_to_eui64(entity_info.entity_id))
 
+            if self.cache is not None and ct >= self.nextCacheWrite:
+                self.saveCache()
+                self.nextCacheWrite = ct+self.cacheInterval
+
+        # thread ending
+        if self.cache is not None:
+            self.saveCache()
+
+        for intf in self.interfaces:
+            intf.unregister_adp_cb(self.adp_cb)
+
 
 # combined:
 # AdvertisingInterfaceStateMachine
 # DiscoveryInterfaceStateMachine
-class InterfaceStateMachine(Thread):
+class InterfaceStateMachine(
+    GlobalStateMachine,
+    Thread
+    ):
     """
     IEEE 1722.1-2021, section 6.2.5
     for each AVB interface of the ATDECC Entity being published in the End Station
@@ -279,7 +684,7 @@ class InterfaceStateMachine(Thread):
     IEEE 1722.1-2021, section 6.2.7    
     """
     
-    def __init__(self, entity_info, interfaces):
+    def __init__(self, entity_info, interfaces, randomDeviceDelay=None, minAdvertiseInterval=1.):
         super(InterfaceStateMachine, self).__init__()
         
         self.event = Event()
@@ -289,15 +694,28 @@ class InterfaceStateMachine(Thread):
         self.doAdvertise = False
         self.interfaces = interfaces
         self.entity_info = entity_info
+
+        # advertise coalescing
+        self.randomDeviceDelay = randomDeviceDelay # callable returning ms, e.g. AdvertisingEntityStateMachine.randomDeviceDelay
+        self.minAdvertiseInterval = minAdvertiseInterval # in seconds
+        self.advertiseLock = Lock() # guards doAdvertise, advertiseDue and lastAdvertise
+        self.advertiseDue = None # time of the scheduled ENTITY_AVAILABLE, None for immediately
+        self.lastAdvertise = None
+        self.advertisesRequested = 0
+        self.advertisesSent = 0
         
         # DiscoveryInterfaceStateMachine
-        self.rcvdDiscover = Queue()
+        self.rcvdDiscover = Queue() # entity_ids of received ENTITY_DISCOVERs for us
+        self.rcvdDiscoverHighWater = 0 # maximum length of rcvdDiscover
         self.currentGrandmasterID = None
         self.advertisedGrandmasterID = None
         self.linkIsUp = True
         self.lastLinkIsUp = False
         self.currentConfigurationIndex = 0
         self.advertisedConfigurationIndex = None
+
+        # AVB_INTERFACE counters, see attachCounters
+        self.counters = None
         
         
     def performTerminate(self):
@@ -305,8 +723,59 @@ class InterfaceStateMachine(Thread):
         logging.debug("doTerminate")
         self.event.set()
         
-    def performAdvertise(self):
-        self.doAdvertise = True
+    def performAdvertise(self, randomDelay=False):
+        """
+        Schedule an ENTITY_AVAILABLE.
+        Requests arriving before the scheduled one has been sent are coalesced into it. 
+        The advertisement is sent no earlier than minAdvertiseInterval after the previous one,
+        and, with randomDelay, after a randomDeviceDelay to spread out responses to a discover.
+        """
+        due = self.currentTime
+        if randomDelay and self.randomDeviceDelay is not None:
+            due += self.randomDeviceDelay() / 1000.
+        with self.advertiseLock:
+            self.advertisesRequested += 1
+            if self.lastAdvertise is not None:
+                due = max(due, self.lastAdvertise+self.minAdvertiseInterval)
+            if not self.doAdvertise or (self.advertiseDue is not None and due < self.advertiseDue):
+                self.advertiseDue = due
+            self.doAdvertise = True
+        self.event.set()
+        
+    def attachCounters(self, counters, avb_interface_index=0):
+        """
+        Count link and grandmaster changes in the CounterBlocks of the AVB_INTERFACE avb_interface_index
+        """
+        self.linkUpCounter = counters.index(at.JDKSAVDECC_DESCRIPTOR_AVB_INTERFACE, avb_interface_index, AVB_INTERFACE_LINK_UP)
+        self.linkDownCounter = counters.index(at.JDKSAVDECC_DESCRIPTOR_AVB_INTERFACE, avb_interface_index, AVB_INTERFACE_LINK_DOWN)
+        self.gmChangedCounter = counters.index(at.JDKSAVDECC_DESCRIPTOR_AVB_INTERFACE, avb_interface_index, AVB_INTERFACE_GPTP_GM_CHANGED)
+        self.counters = counters
+
+    def setLinkState(self, linkIsUp):
+        """
+        Called by a link monitor on link state changes
+        """
+        if self.counters is not None and linkIsUp != self.linkIsUp:
+            self.counters.array[self.linkUpCounter if linkIsUp else self.linkDownCounter] += 1
+        self.linkIsUp = linkIsUp
+        self.event.set()
+
+    def setGrandmasterID(self, grandmasterID):
+        """
+        Called by a gPTP grandmaster source on grandmaster changes
+        """
+        if self.counters is not None and self.currentGrandmasterID is not None and grandmasterID != self.currentGrandmasterID:
+            self.counters.array[self.gmChangedCounter] += 1
+        self.entity_info.gptp_grandmaster_id = grandmasterID
+        self.currentGrandmasterID = grandmasterID
+        self.event.set()
+
+    def setConfigurationIndex(self, configurationIndex):
+        """
+        Called by the EntityModelEntityStateMachine on SET_CONFIGURATION
+        """
+        self.entity_info.current_configuration_index = configurationIndex
+        self.currentConfigurationIndex = configurationIndex
         self.event.set()
         
     def txEntityAvailable(self):
@@ -335,7 +804,12 @@ class InterfaceStateMachine(Thread):
 #        logging.info("ADP: %s", adpdu_str(adpdu))
 
         if adpdu.header.message_type == at.JDKSAVDECC_ADP_MESSAGE_TYPE_ENTITY_DISCOVER:
-            self.rcvdDiscover.put(copy.deepcopy(adpdu.header.entity_id))
+            entityID = eui64_to_uint64(adpdu.header.entity_id)
+            # discovers for other entities are of no interest
+            if entityID == 0 or entityID == self.entity_info.entity_id:
+                self.rcvdDiscover.put(entityID)
+                self.rcvdDiscoverHighWater = max(self.rcvdDiscoverHighWater, self.rcvdDiscover.qsize())
+                self.event.set()
 
     def run(self):
         logging.debug("InterfaceStateMachine: Starting thread")
@@ -345,30 +819,31 @@ class InterfaceStateMachine(Thread):
 
         while True:
             if self.rcvdDiscover.empty():
-                self.event.wait(1)
+                timeout = 1
+                with self.advertiseLock:
+                    if self.doAdvertise and self.advertiseDue is not None:
+                        timeout = min(timeout, max(0, self.advertiseDue-self.currentTime))
+                self.event.wait(timeout)
                 # signalled
                 self.event.clear()
                 
             if self.doTerminate:
                 break
-            
-            # AdvertisingInterfaceStateMachine
-            if self.doAdvertise:
-                self.txEntityAvailable()
-                self.doAdvertise = False
                 
             # DiscoveryInterfaceStateMachine
-            try:
-                disc = eui64_to_uint64(self.rcvdDiscover.get_nowait())
-            except Empty:
-                disc = None
+            # all discovers received since the last wakeup are answered by one advertisement
+            discs = set()
+            while True:
+                try:
+                    discs.add(self.rcvdDiscover.get_nowait())
+                except Empty:
+                    break
                 
-            if disc is not None:
-                # RECEIVED DISCOVER
-                if disc == 0 or disc == self.entity_info.entity_id:
-                    # DISCOVER
-                    logging.debug("Respond to Discover")
-                    self.performAdvertise()
+            # RECEIVED DISCOVER
+            if 0 in discs or self.entity_info.entity_id in discs:
+                # DISCOVER
+                logging.debug("Respond to Discover")
+                self.performAdvertise(randomDelay=True)
             
             if self.currentGrandmasterID != self.advertisedGrandmasterID:
                 # UPDATE GM
@@ -389,6 +864,19 @@ class InterfaceStateMachine(Thread):
                 self.advertisedConfigurationIndex = self.currentConfigurationIndex 
                 self.performAdvertise()
 
+            # AdvertisingInterfaceStateMachine
+            # evaluated last, so that all the triggers above end up in a single advertisement
+            ct = self.currentTime
+            with self.advertiseLock:
+                send = self.doAdvertise and (self.advertiseDue is None or ct >= self.advertiseDue)
+                if send:
+                    self.doAdvertise = False
+                    self.advertiseDue = None
+                    self.lastAdvertise = ct
+            if send:
+                self.txEntityAvailable()
+                self.advertisesSent += 1
+
         # thread ending
         self.txEntityDeparting()
 
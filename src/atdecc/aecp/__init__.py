@@ -1,5 +1,6 @@
 from threading import Thread, Event
 from queue import Queue, Empty
+from concurrent.futures import ThreadPoolExecutor
 import copy
 import logging
 import traceback
@@ -8,14 +9,19 @@ import yaml
 from .. import atdecc_api as at
 from ..util import *
 from ..pdu_print import *
-from ..aem import AEMDescriptorFactory
+from ..aem import AEMDescriptorFactory, DescriptorCache, EntityModel
+from .ownership import OwnershipView
+from .handlers import AEMCommandHandler, AEMCommandRegistry
+from .responses import ResponseCache
+from .unsolicited import UnsolicitedNotifications
+from .counters import *
 
 class EntityModelEntityStateMachine(Thread):
     """
     IEEE 1722.1-2021, section 9.3.5
     """
     
-    def __init__(self, entity_info, interfaces, config):
+    def __init__(self, entity_info, interfaces, config, ownership=None, workers=4, notifications=None, counters=None):
         super(EntityModelEntityStateMachine, self).__init__()
         self.event = Event()
         self.doTerminate = False
@@ -24,15 +30,63 @@ class EntityModelEntityStateMachine(Thread):
         self.rcvdCommand = Queue()
         self.rcvdAEMCommand = False
         self.entity_info = entity_info
-        self.unsolicited = None
-        self.unsolicitedSequenceID = 0
-        self.unsolicited_list = set()
+        # controllers registered for unsolicited notifications, shared with the ACMP listener
+        self.notifications = UnsolicitedNotifications(entity_info.entity_id) if notifications is None else notifications
+        self.notifications.wakeup = self.event.set
         
-        self.owner_entity_id = 0 # uint64
+        # AEM command dispatch, vendor handlers can be registered here
+        self.handlers = self.defaultHandlers.copy()
+        # responses of recent commands, for retransmissions
+        self.responseCache = ResponseCache()
+        # slow commands are processed by the workers
+        self.workers = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="AEMWorker")
+        self.inProgressCommands = set() # keys of the commands processed by the workers
+        self.completedCommands = Queue() # (key, response, response_payload) of the workers
+
+        # acquire state shared with the ACMP state machines
+        self.ownership = OwnershipView() if ownership is None else ownership
+        self._owner_entity_id = 0 # uint64
 
         # config
         with open(config, 'r') as cfg:
             self.config = yaml.safe_load(cfg)
+        # encoded descriptors for READ_DESCRIPTOR, a malformed config raises EntityModelError
+        self.descriptorCache = DescriptorCache(AEMDescriptorFactory)
+        # one model per configuration, compiled once, SET_CONFIGURATION switches entityModel
+        self.entityModels = EntityModel.compileConfigurations(entity_info, self.config, self.descriptorCache)
+        self.entityModel = self.entityModels[entity_info.current_configuration_index]
+        # called with the new configuration_index, e.g. InterfaceStateMachine.setConfigurationIndex
+        self.configurationChanged = None
+        # counter blocks of GET_COUNTERS, shared with the interface and the other state machines
+        self.counters = CounterBlocks.fromModels(self.entityModels) if counters is None else counters
+
+    @property
+    def owner_entity_id(self):
+        return self._owner_entity_id
+
+    @owner_entity_id.setter
+    def owner_entity_id(self, controller_id):
+        self._owner_entity_id = controller_id
+        self.ownership.publish(at.JDKSAVDECC_DESCRIPTOR_ENTITY, 0, acquired_by=controller_id)
+
+    @property
+    def unsolicited_list(self):
+        return self.notifications
+
+    @unsolicited_list.setter
+    def unsolicited_list(self, controller_ids):
+        self.notifications.replace(controller_ids)
+
+    def setConfiguration(self, configuration_index, controller_id=0):
+        """
+        Switch to the precompiled model of configuration_index.
+        ADP advertises the new current_configuration_index, the registered controllers
+        other than controller_id get an unsolicited SET_CONFIGURATION response.
+        """
+        self.entityModel = self.entityModels[configuration_index]
+        if self.configurationChanged is not None:
+            self.configurationChanged(configuration_index)
+        self.notifications.notify(at.JDKSAVDECC_AEM_COMMAND_SET_CONFIGURATION, struct.pack("!2H", 0, configuration_index), exclude=controller_id)
 
     def performTerminate(self):
         self.doTerminate = True
@@ -113,6 +167,10 @@ class EntityModelEntityStateMachine(Thread):
         # Make it a response
         response.aecpdu_header.header.message_type = at.JDKSAVDECC_AECP_MESSAGE_TYPE_AEM_RESPONSE
         response.aecpdu_header.header.status = status
+
+        if status == at.JDKSAVDECC_AEM_STATUS_SUCCESS:
+            # the other controllers learn about the new owner
+            self.notifications.notify(at.JDKSAVDECC_AEM_COMMAND_ACQUIRE_ENTITY, resp_payload, exclude=controller_id)
         
         logging.debug("ACQUIRE_ENTITY done")
         
@@ -224,100 +282,219 @@ class EntityModelEntityStateMachine(Thread):
     def _handleGetAudioMap(self, command: at.struct_jdksavdecc_aecpdu_aem, payload):
         descriptor_type, descriptor_index, map_index, _ = struct.unpack_from("!4H", payload)
 
-        logging.debug("GET_AUDIO_MAP: descriptor_type=%s, descriptor_index=%d"%(
-                api_enum('JDKSAVDECC_DESCRIPTOR_', descriptor_type),
-                descriptor_index)
-        )
+        logging.debug("GET_AUDIO_MAP: descriptor_type=%#06x, descriptor_index=%d, map_index=%d", 
+                      descriptor_type, descriptor_index, map_index)
 
         response = copy.deepcopy(command)
         response.aecpdu_header.header.message_type = at.JDKSAVDECC_AECP_MESSAGE_TYPE_AEM_RESPONSE
-        response.aecpdu_header.header.status = at.JDKSAVDECC_AEM_STATUS_NOT_IMPLEMENTED
+
+        audioMappings = self.entityModel.audioMappings
+        number_of_maps, number_of_mappings, mappings = 0, 0, bytes()
+        status = self._audioMappingsStatus(descriptor_type, descriptor_index)
+        if status == at.JDKSAVDECC_AEM_STATUS_SUCCESS:
+            try:
+                # the precomputed page
+                number_of_maps, number_of_mappings, mappings = audioMappings.page(descriptor_type, descriptor_index, map_index)
+            except IndexError:
+                number_of_maps = audioMappings.numberOfMaps(descriptor_type, descriptor_index)
+                status = at.JDKSAVDECC_AEM_STATUS_BAD_ARGUMENTS
+        response.aecpdu_header.header.status = status
 
         response_payload = struct.pack("!6H",
             descriptor_type, # descriptor_type
             descriptor_index, # descriptor_index
             map_index, # map_index
-            2, # number_of_maps
-            8, # number_of_mappings
+            number_of_maps, # number_of_maps
+            number_of_mappings, # number_of_mappings
             0, # reserved
-            # N * Audio_mappings_format
-        )
-
-        m = [(descriptor_index, c, 0, c) for c in range(8)]
-        mappings = struct.pack("!32H", *flatten_list(m))
-        # TODO get this from factory
-        # response_payload = pack_struct(descriptor) #+mappings
+        )+mappings # N * Audio_mappings_format
 
         return response, response_payload
 
-    def _handleGetCounters(self, command: at.struct_jdksavdecc_aecpdu_aem, payload):
-        descriptor_type, descriptor_index = struct.unpack_from("!2H", payload)
+    def _handleAddAudioMappings(self, command: at.struct_jdksavdecc_aecpdu_aem, payload):
+        return self._updateAudioMappings(command, payload, self.entityModel.audioMappings.add)
 
-        logging.debug("GET_COUNTERS: descriptor_type=%s, descriptor_index=%d"%(
-                api_enum('JDKSAVDECC_DESCRIPTOR_', descriptor_type),
-                descriptor_index)
-        )
+    def _handleRemoveAudioMappings(self, command: at.struct_jdksavdecc_aecpdu_aem, payload):
+        return self._updateAudioMappings(command, payload, self.entityModel.audioMappings.remove)
+
+    def _audioMappingsStatus(self, descriptor_type, descriptor_index):
+        if (descriptor_type, descriptor_index) in self.entityModel.audioMappings:
+            return at.JDKSAVDECC_AEM_STATUS_SUCCESS
+        if self.entityModel.get(self.entityModel.configurationIndex, descriptor_type, descriptor_index) is None:
+            return at.JDKSAVDECC_AEM_STATUS_NO_SUCH_DESCRIPTOR
+        # not a stream port
+        return at.JDKSAVDECC_AEM_STATUS_NOT_IMPLEMENTED
+
+    def _updateAudioMappings(self, command: at.struct_jdksavdecc_aecpdu_aem, payload, update):
+        """
+        ADD_AUDIO_MAPPINGS and REMOVE_AUDIO_MAPPINGS, the response echoes the command payload
+        """
+        descriptor_type, descriptor_index, number_of_mappings, _ = struct.unpack_from("!4H", payload)
+
+        logging.debug("AUDIO_MAPPINGS %#06x: descriptor_type=%#06x, descriptor_index=%d, number_of_mappings=%d", 
+                      command.command_type, descriptor_type, descriptor_index, number_of_mappings)
 
         response = copy.deepcopy(command)
         response.aecpdu_header.header.message_type = at.JDKSAVDECC_AECP_MESSAGE_TYPE_AEM_RESPONSE
-        response.aecpdu_header.header.status = at.JDKSAVDECC_AEM_STATUS_NOT_IMPLEMENTED
 
-        if descriptor_type == at.JDKSAVDECC_DESCRIPTOR_ENTITY:
-            counters_valid = 0
+        status = self._audioMappingsStatus(descriptor_type, descriptor_index)
+        if status == at.JDKSAVDECC_AEM_STATUS_SUCCESS:
+            if len(payload) < 8+8*number_of_mappings:
+                status = at.JDKSAVDECC_AEM_STATUS_BAD_ARGUMENTS
+            else:
+                update(descriptor_type, descriptor_index, struct.iter_unpack("!4H", payload[8:8+8*number_of_mappings]))
+        response.aecpdu_header.header.status = status
 
-        elif descriptor_type == at.JDKSAVDECC_DESCRIPTOR_AVB_INTERFACE:
-            counters_valid = 0
+        return response, payload[:8+8*number_of_mappings]
 
-        elif descriptor_type == at.JDKSAVDECC_DESCRIPTOR_CLOCK_DOMAIN:
-            counters_valid = 0
+    def _handleGetCounters(self, command: at.struct_jdksavdecc_aecpdu_aem, payload):
+        descriptor_type, descriptor_index = struct.unpack_from("!2H", payload)
 
-        elif descriptor_type == at.JDKSAVDECC_DESCRIPTOR_STREAM_INPUT:
-            counters_valid = 0
+        logging.debug("GET_COUNTERS: descriptor_type=%#06x, descriptor_index=%d", descriptor_type, descriptor_index)
 
-        elif descriptor_type == at.JDKSAVDECC_DESCRIPTOR_STREAM_OUTPUT:
-            counters_valid = 0
+        response = copy.deepcopy(command)
+        response.aecpdu_header.header.message_type = at.JDKSAVDECC_AECP_MESSAGE_TYPE_AEM_RESPONSE
 
-        elif descriptor_type == at.JDKSAVDECC_DESCRIPTOR_PTP_PORT:
-            counters_valid = 0
+        # the blocks cover all configurations, only the descriptors of the current one are answered
+        snapshot = None
+        if self.entityModel.get(self.entityModel.configurationIndex, descriptor_type, descriptor_index) is None:
+            response.aecpdu_header.header.status = at.JDKSAVDECC_AEM_STATUS_NO_SUCH_DESCRIPTOR
+        else:
+            snapshot = self.counters.snapshot(descriptor_type, descriptor_index)
+            if snapshot is not None:
+                response.aecpdu_header.header.status = at.JDKSAVDECC_AEM_STATUS_SUCCESS
+            else:
+                # a descriptor without counters
+                response.aecpdu_header.header.status = at.JDKSAVDECC_AEM_STATUS_NOT_IMPLEMENTED
+        counters_valid, counters = (0, bytes(COUNTERS*4)) if snapshot is None else snapshot
 
         response_payload = struct.pack("!2HL",
             descriptor_type, # descriptor_type
             descriptor_index, # descriptor_index
             counters_valid, # counters_valid
-        )+bytes(32*4)
+        )+counters
+
+        return response, response_payload
+
+
+    def _handleSetConfiguration(self, command: at.struct_jdksavdecc_aecpdu_aem, payload):
+        _, configuration_index = struct.unpack_from("!2H", payload)
+
+        logging.debug("SET_CONFIGURATION: configuration_index=%d", configuration_index)
+
+        response = copy.deepcopy(command)
+        response.aecpdu_header.header.message_type = at.JDKSAVDECC_AECP_MESSAGE_TYPE_AEM_RESPONSE
+
+        controller_id = eui64_to_uint64(command.aecpdu_header.controller_entity_id)
+        if configuration_index >= len(self.entityModels):
+            status = at.JDKSAVDECC_AEM_STATUS_BAD_ARGUMENTS
+        elif self.ownership.isAcquiredOrLockedByOther(controller_id, at.JDKSAVDECC_DESCRIPTOR_ENTITY, 0):
+            status = at.JDKSAVDECC_AEM_STATUS_ENTITY_ACQUIRED
+        else:
+            status = at.JDKSAVDECC_AEM_STATUS_SUCCESS
+            if configuration_index != self.entityModel.configurationIndex:
+                self.setConfiguration(configuration_index, controller_id)
+        response.aecpdu_header.header.status = status
+
+        # the current configuration, also if it has not changed
+        response_payload = struct.pack("!2H", 0, self.entityModel.configurationIndex)
+
+        return response, response_payload
+
+    def _handleGetConfiguration(self, command: at.struct_jdksavdecc_aecpdu_aem, payload):
+        logging.debug("GET_CONFIGURATION")
+
+        response = copy.deepcopy(command)
+        response.aecpdu_header.header.message_type = at.JDKSAVDECC_AECP_MESSAGE_TYPE_AEM_RESPONSE
+        response.aecpdu_header.header.status = at.JDKSAVDECC_AEM_STATUS_SUCCESS
+        response_payload = struct.pack("!2H", 0, self.entityModel.configurationIndex)
 
         return response, response_payload
 
 
     def _handleReadDescriptor(self, command: at.struct_jdksavdecc_aecpdu_aem, payload):
         em = self.entity_info
-        _, _, descriptor_type, descriptor_index = struct.unpack_from("!4H", payload)
-        configuration_index = 0 # need to adjust if more than one configuration
+        configuration_index, _, descriptor_type, descriptor_index = struct.unpack_from("!4H", payload)
 
         logging.debug("READ_DESCRIPTOR %s", api_enum('JDKSAVDECC_DESCRIPTOR_', descriptor_type))
         logging.debug("DESCRIPTOR INDEX %d", descriptor_index)
 
-        descriptor = None
+        # the ENTITY descriptor is the one of the current configuration,
+        # a CONFIGURATION descriptor is in the model of its configuration (IEEE 1722.1-2021, 7.4.5.1)
+        if descriptor_type == at.JDKSAVDECC_DESCRIPTOR_ENTITY:
+            model_index = self.entityModel.configurationIndex
+        elif descriptor_type == at.JDKSAVDECC_DESCRIPTOR_CONFIGURATION:
+            model_index = descriptor_index
+        else:
+            model_index = configuration_index
 
-        try:
-            descriptor = AEMDescriptorFactory.create_descriptor(descriptor_type, descriptor_index, em, self.config)
-            response_payload = descriptor.encode()
-        except ValueError:
-            logging.error("DESCRIPTOR CLASS NOT FOUND")
-            traceback.print_exc()
-            pass
+        response_payload = None
+        if model_index < len(self.entityModels):
+            # descriptors with changed EntityInfo fields are rebuilt
+            model = self.entityModels[model_index] = self.entityModels[model_index].current(em)
+            if model_index == self.entityModel.configurationIndex:
+                self.entityModel = model
+            response_payload = model.get(model_index, descriptor_type, descriptor_index)
 
-        
-        if descriptor is not None:
-            response = copy.deepcopy(command)
-            response.aecpdu_header.header.message_type = at.JDKSAVDECC_AECP_MESSAGE_TYPE_AEM_RESPONSE
+        response = copy.deepcopy(command)
+        response.aecpdu_header.header.message_type = at.JDKSAVDECC_AECP_MESSAGE_TYPE_AEM_RESPONSE
+        prefix = struct.pack("!2H", configuration_index, 0)
+
+        if response_payload is None:
+            logging.error("NO SUCH DESCRIPTOR")
+            response.aecpdu_header.header.status = at.JDKSAVDECC_AEM_STATUS_NO_SUCH_DESCRIPTOR
+            # the command payload
+            response_payload = prefix+struct.pack("!2H", descriptor_type, descriptor_index)
+        else:
             response.aecpdu_header.header.status = at.JDKSAVDECC_AEM_STATUS_SUCCESS
-            prefix = struct.pack("!2H", configuration_index, 0)
             response_payload = prefix+response_payload
 
         return response, response_payload
 
 
+    # AEM command_type -> AEMCommandHandler (IEEE 1722.1-2021, Table 7-125)
+    # payload struct and size of the command specific data of command and response
+    defaultHandlers = AEMCommandRegistry([
+        AEMCommandHandler(at.JDKSAVDECC_AEM_COMMAND_ACQUIRE_ENTITY, 'acquireEntity', "!QQHH", 20),
+        AEMCommandHandler(at.JDKSAVDECC_AEM_COMMAND_LOCK_ENTITY, 'lockEntity', "!LQHH", 16),
+        AEMCommandHandler(at.JDKSAVDECC_AEM_COMMAND_ENTITY_AVAILABLE, '_handleEntityAvailable', "!", 0),
+        AEMCommandHandler(at.JDKSAVDECC_AEM_COMMAND_CONTROLLER_AVAILABLE, None, "!", 0),
+        AEMCommandHandler(at.JDKSAVDECC_AEM_COMMAND_READ_DESCRIPTOR, '_handleReadDescriptor', "!4H"),
+        AEMCommandHandler(at.JDKSAVDECC_AEM_COMMAND_SET_CONFIGURATION, '_handleSetConfiguration', "!2H", 4),
+        AEMCommandHandler(at.JDKSAVDECC_AEM_COMMAND_GET_CONFIGURATION, '_handleGetConfiguration', "!", 4),
+        AEMCommandHandler(at.JDKSAVDECC_AEM_COMMAND_SET_STREAM_FORMAT, None, "!2HQ", 12),
+        AEMCommandHandler(at.JDKSAVDECC_AEM_COMMAND_GET_STREAM_FORMAT, None, "!2H", 12),
+        AEMCommandHandler(at.JDKSAVDECC_AEM_COMMAND_SET_NAME, None, "!4H64s", 72),
+        AEMCommandHandler(at.JDKSAVDECC_AEM_COMMAND_GET_NAME, None, "!4H", 72),
+        AEMCommandHandler(at.JDKSAVDECC_AEM_COMMAND_SET_SAMPLING_RATE, None, "!2HL", 8),
+        AEMCommandHandler(at.JDKSAVDECC_AEM_COMMAND_GET_SAMPLING_RATE, None, "!2H", 8),
+        AEMCommandHandler(at.JDKSAVDECC_AEM_COMMAND_SET_CLOCK_SOURCE, None, "!4H", 8),
+        AEMCommandHandler(at.JDKSAVDECC_AEM_COMMAND_GET_CLOCK_SOURCE, None, "!2H", 8),
+        AEMCommandHandler(at.JDKSAVDECC_AEM_COMMAND_START_STREAMING, None, "!2H", 4),
+        AEMCommandHandler(at.JDKSAVDECC_AEM_COMMAND_STOP_STREAMING, None, "!2H", 4),
+        AEMCommandHandler(at.JDKSAVDECC_AEM_COMMAND_REGISTER_UNSOLICITED_NOTIFICATION, '_handleRegisterUnsolicitedNotification', "!", 4),
+        AEMCommandHandler(at.JDKSAVDECC_AEM_COMMAND_DEREGISTER_UNSOLICITED_NOTIFICATION, '_handleDeregisterUnsolicitedNotification', "!", 4),
+        AEMCommandHandler(at.JDKSAVDECC_AEM_COMMAND_GET_AVB_INFO, '_handleGetAvbInfo', "!2H", 20),
+        AEMCommandHandler(at.JDKSAVDECC_AEM_COMMAND_GET_AS_PATH, '_handleGetAsPath', "!2H"),
+        AEMCommandHandler(at.JDKSAVDECC_AEM_COMMAND_GET_COUNTERS, '_handleGetCounters', "!2H", 136),
+        AEMCommandHandler(at.JDKSAVDECC_AEM_COMMAND_REBOOT, None, "!2H", 4),
+        AEMCommandHandler(at.JDKSAVDECC_AEM_COMMAND_GET_AUDIO_MAP, '_handleGetAudioMap', "!4H"),
+        AEMCommandHandler(at.JDKSAVDECC_AEM_COMMAND_ADD_AUDIO_MAPPINGS, '_handleAddAudioMappings', "!4H"),
+        AEMCommandHandler(at.JDKSAVDECC_AEM_COMMAND_REMOVE_AUDIO_MAPPINGS, '_handleRemoveAudioMappings', "!4H"),
+    ])
+
+    def notImplemented(self, command: at.struct_jdksavdecc_aecpdu_aem, payload, handler=None):
+        """
+        A NOT_IMPLEMENTED response, sized as declared by the handler of the command_type
+        or echoing the command payload for unknown command_types
+        """
+        response = copy.deepcopy(command)
+        response.aecpdu_header.header.message_type = at.JDKSAVDECC_AECP_MESSAGE_TYPE_AEM_RESPONSE
+        response.aecpdu_header.header.status = at.JDKSAVDECC_AEM_STATUS_NOT_IMPLEMENTED
+        if handler is None:
+            return response, payload or bytes()
+        return response, handler.notImplementedPayload(payload)
+
     def processCommand(self, command: at.struct_jdksavdecc_aecpdu_aem, payload):
         """
         The processCommand is used to handle the receipt, processing and respond to an AEM Command other than 
@@ -329,43 +506,92 @@ class EntityModelEntityStateMachine(Thread):
         responded to with a correctly sized response and a status of NOT_IMPLEMENTED.
         
         The AEMCommandResponse type (struct_jdksavdecc_aecpdu_common) is a structure containing the fields of a base AEM AECPDU.
+
+        The handlers are looked up in self.handlers, ACQUIRE_ENTITY and LOCK_ENTITY
+        are dispatched to acquireEntity and lockEntity the same way.
         """
-        # handle AEM Command other than ACQUIRE_ENTITY and LOCK_ENTITY
+        handler = self.handlers.get(command.command_type)
+        if handler is None or handler.handler is None:
+            return self.notImplemented(command, payload, handler)
 
-        response = None
-        response_payload = None
+        if isinstance(handler.handler, str):
+            response, response_payload = getattr(self, handler.handler)(command, payload)
+        else:
+            response, response_payload = handler.handler(command, payload)
 
-        if command.command_type == at.JDKSAVDECC_AEM_COMMAND_ENTITY_AVAILABLE:
-            response, response_payload = self._handleEntityAvailable(command, payload)
-        
-        elif command.command_type == at.JDKSAVDECC_AEM_COMMAND_REGISTER_UNSOLICITED_NOTIFICATION:
-            response, response_payload = self._handleRegisterUnsolicitedNotification(command, payload)
+        if response is None:
+            return self.notImplemented(command, payload, handler)
 
-        elif command.command_type == at.JDKSAVDECC_AEM_COMMAND_DEREGISTER_UNSOLICITED_NOTIFICATION:
-            response, response_payload = self._handleDeregisterUnsolicitedNotification(command, payload)
+        return response, response_payload
 
-        elif command.command_type == at.JDKSAVDECC_AEM_COMMAND_READ_DESCRIPTOR:
-            response, response_payload = self._handleReadDescriptor(command, payload)
-            
-        elif command.command_type == at.JDKSAVDECC_AEM_COMMAND_GET_AVB_INFO:
-            response, response_payload = self._handleGetAvbInfo(command, payload)
 
-        elif command.command_type == at.JDKSAVDECC_AEM_COMMAND_GET_AS_PATH:
-            response, response_payload = self._handleGetAsPath(command, payload)
+    def commandKey(self, command: at.struct_jdksavdecc_aecpdu_aem):
+        return (
+            eui64_to_uint64(command.aecpdu_header.controller_entity_id),
+            command.aecpdu_header.sequence_id,
+            command.command_type,
+        )
 
-        elif command.command_type == at.JDKSAVDECC_AEM_COMMAND_GET_AUDIO_MAP:
-            response, response_payload = self._handleGetAudioMap(command, payload)
+    def handleCommand(self, command: at.struct_jdksavdecc_aecpdu_aem, payload):
+        """
+        Process a received command and transmit the response,
+        a retransmitted command is answered from the response cache
+        """
+        key = self.commandKey(command)
+        # any command keeps the registration of a controller alive
+        self.notifications.touch(key[0])
+        cached = self.responseCache.get(key)
+        if cached is not None:
+            logging.debug("Retransmitted command, sending cached response")
+            self.txResponse(*cached)
+            return
+
+        handler = self.handlers.get(command.command_type)
+        if handler is not None and handler.slow:
+            # IN_PROGRESS now (also for a retransmission), the response when the worker is done
+            self.txResponse(*self.inProgress(command, payload))
+            if key not in self.inProgressCommands:
+                self.inProgressCommands.add(key)
+                self.workers.submit(self._processSlowCommand, key, command, payload)
+            return
+
+        response, response_payload = self.processCommand(command, payload)
+        self._txCommandResponse(key, response, response_payload)
+
+    def inProgress(self, command: at.struct_jdksavdecc_aecpdu_aem, payload):
+        """
+        An IN_PROGRESS response (IEEE 1722.1-2021, 9.2.1.2.5) with the payload of the command
+        """
+        response = copy.deepcopy(command)
+        response.aecpdu_header.header.message_type = at.JDKSAVDECC_AECP_MESSAGE_TYPE_AEM_RESPONSE
+        response.aecpdu_header.header.status = at.JDKSAVDECC_AEM_STATUS_IN_PROGRESS
+        return response, payload or bytes()
 
-        elif command.command_type == at.JDKSAVDECC_AEM_COMMAND_GET_COUNTERS:
-            response, response_payload = self._handleGetCounters(command, payload)
+    def _processSlowCommand(self, key, command, payload):
+        # on a worker thread, the response is sent by the state machine thread
+        try:
+            response, response_payload = self.processCommand(command, payload)
+        except Exception as e:
+            traceback.print_exc()
+            response, response_payload = None, None
+        self.completedCommands.put((key, response, response_payload))
+        self.event.set()
 
-        if response is None:
-            response = copy.deepcopy(command.aecpdu_header)
-            response.header.message_type = at.JDKSAVDECC_AECP_MESSAGE_TYPE_AEM_RESPONSE
-            response.header.status = at.JDKSAVDECC_AEM_STATUS_NOT_IMPLEMENTED
-            
-        return response, response_payload
+    def txCompletedCommands(self):
+        while True:
+            try:
+                key, response, response_payload = self.completedCommands.get_nowait()
+            except Empty:
+                break
+            self.inProgressCommands.discard(key)
+            self._txCommandResponse(key, response, response_payload)
 
+    def _txCommandResponse(self, key, response, response_payload):
+        if response is not None:
+            self.responseCache.put(key, response, response_payload)
+            self.txResponse(response, response_payload)
+        else:
+            logging.warning("Response is None")
 
     def txResponse(self, response, payload=None):
         """
@@ -384,10 +610,13 @@ class EntityModelEntityStateMachine(Thread):
             intf.register_aecp_aem_cb(self.aecp_aem_cb)
 
         while True:
-            self.unsolicited = None
-            
-            if self.rcvdCommand.empty():
-                self.event.wait(1)
+            if self.rcvdCommand.empty() and self.completedCommands.empty():
+                # sleep until the next notification is due
+                wait = 1
+                nextDeadline = self.notifications.nextDeadline()
+                if nextDeadline is not None:
+                    wait = min(wait, max(0, nextDeadline-self.notifications.clock()))
+                self.event.wait(wait)
                 # signalled
                 self.event.clear()
                 
@@ -400,30 +629,15 @@ class EntityModelEntityStateMachine(Thread):
                 cmd = None
             
             try:
-                if self.unsolicited is not None:
-                    # UNSOLICITED RESPONSE
-                    logging.debug("Unsolidated response")
-                    self.unsolicited.sequence_id = self.unsolicitedSequenceID
-                    self.txResponse(self.unsolicited)
-                    self.unsolicitedSequenceID += 1
-                    self.unsolicited = None
-                
+                # responses of slow commands
+                self.txCompletedCommands()
+
                 if cmd is not None:
                     # RECEIVED COMMAND
-                    response_payload = None
-                    
-                    if cmd.command_type == at.JDKSAVDECC_AEM_COMMAND_ACQUIRE_ENTITY:
-                        response, response_payload = self.acquireEntity(cmd, payload)
-                        
-                    elif cmd.command_type == at.JDKSAVDECC_AEM_COMMAND_LOCK_ENTITY:
-                        response, response_payload = self.lockEntity(cmd, payload)
-                    else:
-                        response, response_payload = self.processCommand(cmd, payload)
-                    
-                    if response is not None:
-                        self.txResponse(response, response_payload)
-                    else:
-                        logging.warning("Response is None")
+                    self.handleCommand(cmd, payload)
+
+                # UNSOLICITED RESPONSE, after the response of the command that caused it
+                self.notifications.flush(self.txResponse, self.notifications.clock())
                     
             except Exception as e:
                 traceback.print_exc();
@@ -432,4 +646,6 @@ class EntityModelEntityStateMachine(Thread):
         for intf in self.interfaces:
             intf.unregister_aecp_aem_cb(self.aecp_aem_cb)
 
+        self.workers.shutdown(wait=False)
+
         logging.debug("EntityModelEntityStateMachine: Ending thread")
@@ -0,0 +1,114 @@
+from array import array
+import ctypes
+import sys
+
+from .. import atdecc_api as at
+
+# counters of GET_COUNTERS (IEEE 1722.1-2021, 7.4.42), the index of a counter
+# in the block is the bit of counters_valid
+COUNTERS = 32
+
+AVB_INTERFACE_LINK_UP = 0
+AVB_INTERFACE_LINK_DOWN = 1
+AVB_INTERFACE_FRAMES_TX = 2
+AVB_INTERFACE_FRAMES_RX = 3
+AVB_INTERFACE_RX_CRC_ERROR = 4
+AVB_INTERFACE_GPTP_GM_CHANGED = 5
+
+STREAM_INPUT_MEDIA_LOCKED = 0
+STREAM_INPUT_MEDIA_UNLOCKED = 1
+STREAM_INPUT_STREAM_INTERRUPTED = 2
+STREAM_INPUT_SEQ_NUM_MISMATCH = 3
+STREAM_INPUT_MEDIA_RESET = 4
+STREAM_INPUT_TIMESTAMP_UNCERTAIN = 5
+STREAM_INPUT_TIMESTAMP_VALID = 6
+STREAM_INPUT_TIMESTAMP_NOT_VALID = 7
+STREAM_INPUT_UNSUPPORTED_FORMAT = 8
+STREAM_INPUT_LATE_TIMESTAMP = 9
+STREAM_INPUT_EARLY_TIMESTAMP = 10
+STREAM_INPUT_FRAMES_RX = 11
+STREAM_INPUT_FRAMES_TX = 12
+
+# ENTITY_SPECIFIC_1 is the last counter of every block
+ENTITY_SPECIFIC_1 = 31
+
+
+class CounterBlocks:
+    """
+    The counters of the ATDECC Entity, one block of 32 uint32 per descriptor with counters
+    (ENTITY, AVB_INTERFACE and STREAM_INPUT), all of them in a single ctypes array.
+
+    Writers resolve the index of a counter once with index(), which also marks the counter valid,
+    and increment array[index] in place. Every counter has a single writer: the native worker of
+    the interface increments its counters atomically through pointer(), the state machines
+    increment theirs from their own thread. snapshot() copies a block in one go for GET_COUNTERS.
+    """
+
+    descriptorTypes = (
+        at.JDKSAVDECC_DESCRIPTOR_ENTITY,
+        at.JDKSAVDECC_DESCRIPTOR_AVB_INTERFACE,
+        at.JDKSAVDECC_DESCRIPTOR_STREAM_INPUT,
+    )
+
+    def __init__(self, counts):
+        """
+        counts is {descriptor_type: number of descriptors}, types without counters are ignored
+        """
+        self.offsets = {} # (descriptor_type, descriptor_index) -> index of the first counter
+        for descriptor_type in self.descriptorTypes:
+            for descriptor_index in range(counts.get(descriptor_type, 0)):
+                self.offsets[(descriptor_type, descriptor_index)] = len(self.offsets)*COUNTERS
+        self.valid = dict.fromkeys(self.offsets, 0) # (descriptor_type, descriptor_index) -> counters_valid
+        self.array = (ctypes.c_uint32 * (len(self.offsets)*COUNTERS))()
+
+    @classmethod
+    def fromModel(cls, entity_model, configuration_index=0):
+        return cls({
+            descriptor_type: count
+            for (index, descriptor_type), count in entity_model.counts.items()
+            if index == configuration_index
+        })
+
+    @classmethod
+    def fromModels(cls, entity_models):
+        """
+        Blocks for the descriptors of all configurations, the same descriptor of
+        different configurations shares its block
+        """
+        counts = {}
+        for entity_model in entity_models:
+            for (_, descriptor_type), count in entity_model.counts.items():
+                counts[descriptor_type] = max(counts.get(descriptor_type, 0), count)
+        return cls(counts)
+
+    def __contains__(self, key):
+        return key in self.offsets
+
+    def index(self, descriptor_type, descriptor_index, counter):
+        """
+        Index of counter in array, raises KeyError if the descriptor has no counters
+        """
+        self.valid[(descriptor_type, descriptor_index)] |= 1 << counter
+        return self.offsets[(descriptor_type, descriptor_index)]+counter
+
+    def increment(self, index, n=1):
+        self.array[index] += n
+
+    def pointer(self, index):
+        """
+        uint32_t * of the counter for the native side
+        """
+        return ctypes.pointer(ctypes.c_uint32.from_buffer(self.array, index*ctypes.sizeof(ctypes.c_uint32)))
+
+    def snapshot(self, descriptor_type, descriptor_index):
+        """
+        Returns (counters_valid, the 32 counters in network byte order) or None if the descriptor has no counters
+        """
+        offset = self.offsets.get((descriptor_type, descriptor_index))
+        if offset is None:
+            return None
+        size = ctypes.sizeof(ctypes.c_uint32)
+        counters = array('I', ctypes.string_at(ctypes.addressof(self.array)+offset*size, COUNTERS*size))
+        if sys.byteorder == 'little':
+            counters.byteswap()
+        return self.valid[(descriptor_type, descriptor_index)], counters.tobytes()
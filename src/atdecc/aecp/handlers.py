@@ -0,0 +1,64 @@
+import struct
+
+
+class AEMCommandHandler:
+    """
+    Handler of an AEM command_type.
+
+    handler is the name of a method of the EntityModelEntityStateMachine,
+    or a callable handler(command, payload) returning (response, response_payload).
+    None means the command is known but not implemented.
+    command is the struct of the command payload, response_size the size of the response payload
+    (None if it is variable), used for correctly sized NOT_IMPLEMENTED responses.
+    slow handlers run on the worker pool of the state machine, concurrently with other handlers.
+    """
+    __slots__ = ('command_type', 'handler', 'command', 'response_size', 'slow')
+
+    def __init__(self, command_type, handler=None, command_format="!", response_size=None, slow=False):
+        self.command_type = command_type
+        self.handler = handler
+        self.command = struct.Struct(command_format)
+        self.response_size = response_size
+        self.slow = slow
+
+    def notImplementedPayload(self, payload):
+        """
+        The payload of a NOT_IMPLEMENTED response: the command payload, sized as a response
+        """
+        payload = payload or bytes()
+        if self.response_size is None:
+            return payload
+        return payload[:self.response_size].ljust(self.response_size, b'\0')
+
+
+class AEMCommandRegistry:
+    """
+    AEM command_type -> AEMCommandHandler
+
+    Vendor extensions register handlers on the registry of a state machine (or on the default registry),
+    without subclassing it.
+    """
+
+    def __init__(self, handlers=()):
+        self.handlers = {handler.command_type: handler for handler in handlers}
+
+    def register(self, command_type, handler=None, command_format="!", response_size=None, slow=False):
+        self.handlers[command_type] = AEMCommandHandler(command_type, handler, command_format, response_size, slow)
+
+    def unregister(self, command_type):
+        self.handlers.pop(command_type, None)
+
+    def get(self, command_type):
+        return self.handlers.get(command_type)
+
+    def copy(self):
+        return AEMCommandRegistry(self.handlers.values())
+
+    def __contains__(self, command_type):
+        return command_type in self.handlers
+
+    def __iter__(self):
+        return iter(self.handlers.values())
+
+    def __len__(self):
+        return len(self.handlers)
@@ -0,0 +1,34 @@
+from .. import atdecc_api as at
+
+
+class OwnershipView:
+    """
+    Read view of the acquire and lock state of the ATDECC Entity (IEEE 1722.1-2021, 7.4.1 and 7.4.2).
+
+    The EntityModelEntityStateMachine is the only writer, it publishes a new snapshot
+    on every change. Readers on other threads (e.g. the ACMP state machines) use
+    the current snapshot without locking, replacing the snapshot is a single assignment.
+    Acquiring or locking the ENTITY descriptor applies to all descriptors.
+    """
+
+    def __init__(self):
+        self.snapshot = {} # (descriptor_type, descriptor_index) -> (acquired_by, locked_by)
+
+    def publish(self, descriptor_type, descriptor_index, acquired_by=0, locked_by=0):
+        snapshot = dict(self.snapshot)
+        if acquired_by or locked_by:
+            snapshot[(descriptor_type, descriptor_index)] = (acquired_by, locked_by)
+        else:
+            snapshot.pop((descriptor_type, descriptor_index), None)
+        self.snapshot = snapshot
+
+    def isAcquiredOrLockedByOther(self, controller_id, descriptor_type, descriptor_index):
+        """
+        Returns True if the descriptor (or the entity) is acquired or locked by a controller other than controller_id
+        """
+        snapshot = self.snapshot
+        for key in ((at.JDKSAVDECC_DESCRIPTOR_ENTITY, 0), (descriptor_type, descriptor_index)):
+            owners = snapshot.get(key)
+            if owners is not None and any(owner and owner != controller_id for owner in owners):
+                return True
+        return False
@@ -0,0 +1,38 @@
+from collections import OrderedDict
+import time
+
+
+class ResponseCache:
+    """
+    Bounded LRU of recent AEM responses, keyed by (controller_entity_id, sequence_id, command_type).
+
+    A controller retransmits a command if the response got lost (IEEE 1722.1-2021, 9.2.1.2.4).
+    A duplicate received within window seconds is answered with the cached response
+    instead of executing the command again.
+    """
+
+    def __init__(self, maxsize=256, window=2., clock=time.monotonic):
+        self.maxsize = maxsize
+        self.window = window
+        self.clock = clock
+        self.entries = OrderedDict() # key -> (time, response, response_payload)
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        """
+        Returns (response, response_payload) of a duplicate command, or None
+        """
+        entry = self.entries.get(key)
+        if entry is None or self.clock()-entry[0] > self.window:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return entry[1], entry[2]
+
+    def put(self, key, response, response_payload):
+        self.entries[key] = (self.clock(), response, response_payload)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
@@ -0,0 +1,156 @@
+from threading import Lock
+import struct
+import time
+
+from .. import atdecc_api as at
+from ..util import *
+
+# u bit of the command_type, set in unsolicited responses
+UNSOLICITED = 0x8000
+
+
+class UnsolicitedNotifications:
+    """
+    Controllers registered for unsolicited notifications (IEEE 1722.1-2021, 7.5)
+    and the fan-out of state changes to them.
+
+    notify() may be called from any thread (e.g. the ACMP listener). A change is encoded once
+    as a response template, changes of the same (command_type, descriptor_type, descriptor_index)
+    within holdoff seconds are coalesced and only the latest state is sent.
+    flush() sends the pending templates to every subscriber in one batch, patching
+    controller_entity_id and the sequence_id of the subscriber.
+
+    Every command of a subscriber refreshes its registration, a subscriber that has not
+    sent a command for timeout seconds has stopped responding and is expired.
+    """
+
+    def __init__(self, entity_id, timeout=10., holdoff=0.02, clock=time.monotonic):
+        self.entity_id = entity_id
+        self.timeout = timeout
+        self.holdoff = holdoff
+        self.clock = clock
+        self.wakeup = None # called when a change is pending, e.g. Event.set of the state machine
+        self.subscribers = {} # controller_entity_id -> [sequence_id, last seen]
+        self.lock = Lock()
+        self.pending = {} # (command_type, descriptor_type, descriptor_index) -> [template, payload, exclude]
+        self.deadline = None # time the pending changes are sent
+        self.sent = 0
+
+    def add(self, controller_entity_id):
+        subscriber = self.subscribers.get(controller_entity_id)
+        if subscriber is None:
+            self.subscribers[controller_entity_id] = [0, self.clock()]
+        else:
+            subscriber[1] = self.clock()
+
+    def remove(self, controller_entity_id):
+        """
+        Raises KeyError if the controller is not registered
+        """
+        del self.subscribers[controller_entity_id]
+
+    def replace(self, controller_entity_ids):
+        self.subscribers = {}
+        for controller_entity_id in controller_entity_ids:
+            self.add(controller_entity_id)
+
+    def touch(self, controller_entity_id):
+        subscriber = self.subscribers.get(controller_entity_id)
+        if subscriber is not None:
+            subscriber[1] = self.clock()
+
+    def __contains__(self, controller_entity_id):
+        return controller_entity_id in self.subscribers
+
+    def __iter__(self):
+        return iter(list(self.subscribers))
+
+    def __len__(self):
+        return len(self.subscribers)
+
+    def expire(self, ct):
+        """
+        Remove the subscribers not seen for timeout seconds, returns their entity IDs
+        """
+        expired = [
+            controller_entity_id
+            for controller_entity_id, (_, seen) in self.subscribers.items()
+            if ct-seen > self.timeout
+        ]
+        for controller_entity_id in expired:
+            del self.subscribers[controller_entity_id]
+        return expired
+
+    def template(self, command_type):
+        return at.struct_jdksavdecc_aecpdu_aem(
+            aecpdu_header=at.struct_jdksavdecc_aecpdu_common(
+                header=at.struct_jdksavdecc_aecpdu_common_control_header(
+                    message_type=at.JDKSAVDECC_AECP_MESSAGE_TYPE_AEM_RESPONSE,
+                    status=at.JDKSAVDECC_AEM_STATUS_SUCCESS,
+                    target_entity_id=uint64_to_eui64(self.entity_id),
+                ),
+            ),
+            command_type=command_type | UNSOLICITED,
+        )
+
+    def notify(self, command_type, payload, exclude=0):
+        """
+        Announce a state change as the response payload of command_type.
+        The payload starts with descriptor_type and descriptor_index, except for commands without them
+        (e.g. the ACQUIRE_ENTITY payload is taken as is).
+        exclude is the controller that caused the change, it gets the regular response instead.
+        """
+        if not self.subscribers:
+            return
+
+        if command_type == at.JDKSAVDECC_AEM_COMMAND_ACQUIRE_ENTITY:
+            key = (command_type,)+struct.unpack_from("!2H", payload, 16)
+        else:
+            key = (command_type,)+struct.unpack_from("!2H", payload)
+
+        with self.lock:
+            entry = self.pending.get(key)
+            if entry is None:
+                self.pending[key] = [self.template(command_type), payload, exclude]
+            else:
+                # coalesced, a controller only gets its own change back as a regular response
+                entry[1] = payload
+                if entry[2] != exclude:
+                    entry[2] = 0
+            if self.deadline is None:
+                self.deadline = self.clock()+self.holdoff
+
+        if self.wakeup is not None:
+            self.wakeup()
+
+    def nextDeadline(self):
+        """
+        Time of the next flush or expiry, None if there are neither pending changes nor subscribers
+        """
+        deadlines = [seen+self.timeout for _, seen in self.subscribers.values()]
+        if self.deadline is not None:
+            deadlines.append(self.deadline)
+        return min(deadlines, default=None)
+
+    def flush(self, send, ct):
+        """
+        Expire subscribers, then send the pending changes if they are due with send(response, payload)
+        """
+        self.expire(ct)
+
+        with self.lock:
+            if self.deadline is None or ct < self.deadline:
+                return
+            pending = list(self.pending.values())
+            self.pending.clear()
+            self.deadline = None
+
+        for template, payload, exclude in pending:
+            for controller_entity_id, subscriber in self.subscribers.items():
+                if controller_entity_id == exclude:
+                    continue
+                template.aecpdu_header.controller_entity_id = uint64_to_eui64(controller_entity_id)
+                template.aecpdu_header.sequence_id = subscriber[0]
+                subscriber[0] = (subscriber[0]+1) & 0xffff
+                send(template, payload)
+                self.sent += 1
@@ -1,4 +1,4 @@
-from inspect import signature
+from inspect import signature, Parameter
 
 from .. import atdecc_api as at
 from ..aem.descriptors import *
@@ -12,54 +12,92 @@ class AEMCommand:
     pass
 
 
+class AEMDescriptorRegistration:
+    """
+    What the factory needs to create a descriptor of a registered class, computed once at registration
+    """
+    __slots__ = ('descriptor_class', 'parameters', 'config_key', 'constructor')
+
+    def __init__(self, descriptor_class):
+        self.descriptor_class = descriptor_class
+        self.parameters = AEMDescriptorFactory.parameters(descriptor_class)
+        self.config_key = descriptor_class.__name__ # section in the config
+        self.constructor = descriptor_class
+
+
 class AEMDescriptorFactory:
-    registry = {}
+    registry = {} # descriptor_type -> descriptor class
+    registrations = {} # descriptor_type -> AEMDescriptorRegistration
 
     @staticmethod
     def register(descriptor_type, descriptor_class):
         AEMDescriptorFactory.registry[descriptor_type] = descriptor_class
+        AEMDescriptorFactory.registrations[descriptor_type] = AEMDescriptorRegistration(descriptor_class)
+
+    @staticmethod
+    def registerSubclasses(base=AEMDescriptor):
+        """
+        Register all subclasses of base which define a descriptor_type
+        """
+        for descriptor_class in base.__subclasses__():
+            if 'descriptor_type' in vars(descriptor_class):
+                AEMDescriptorFactory.register(descriptor_class.descriptor_type, descriptor_class)
+            AEMDescriptorFactory.registerSubclasses(descriptor_class)
+
+    @staticmethod
+    def registration(descriptor_type):
+        """
+        Returns the AEMDescriptorRegistration of descriptor_type,
+        subclasses defined after the import of this module are registered on demand
+        """
+        registration = AEMDescriptorFactory.registrations.get(descriptor_type)
+        if registration is None:
+            AEMDescriptorFactory.registerSubclasses()
+            registration = AEMDescriptorFactory.registrations.get(descriptor_type)
+            if registration is None:
+                raise ValueError(f"No descriptor class registered for type {descriptor_type}")
+        return registration
+
+    @staticmethod
+    def descriptorClass(descriptor_type):
+        try:
+            return AEMDescriptorFactory.registration(descriptor_type).descriptor_class
+        except ValueError:
+            return None
+
+    @staticmethod
+    def parameters(descriptor_class):
+        """
+        Names of the constructor parameters of descriptor_class and its parent classes
+        """
+        parameters = set()
+        for cls in descriptor_class.__mro__:
+            if cls is object or '__init__' not in vars(cls):
+                continue
+            parameters.update(
+                name for name, parameter in signature(cls.__init__).parameters.items()
+                if parameter.kind in (Parameter.POSITIONAL_OR_KEYWORD, Parameter.KEYWORD_ONLY)
+            )
+        parameters.discard('self')
+        return frozenset(parameters)
 
     @staticmethod
     def create_descriptor(descriptor_type, descriptor_index, entity_info, config):
-        descriptor_class = AEMDescriptorFactory.registry.get(descriptor_type)
+        registration = AEMDescriptorFactory.registration(descriptor_type)
+        parameters = registration.parameters
 
-        if not descriptor_class:
-            raise ValueError(f"No descriptor class registered for type {descriptor_type}")
+        descriptor_config = config.get(registration.config_key) or {}
 
-        descriptor_config = {}
+        # filter kwargs, the config overrides the entity_info
+        kwargs = {'descriptor_index': descriptor_index}
+        kwargs.update((k, v) for k, v in vars(entity_info).items() if k in parameters)
+        kwargs.update((k, v) for k, v in descriptor_config.items() if k in parameters)
 
-        try:
-            descriptor_config = config[descriptor_class.__name__]
-        except KeyError:
-            pass
-
-        kwargs = {**vars(entity_info), **descriptor_config}
-        init_sig = signature(descriptor_class.__init__)
-        base_init_sig = None
-
-        # check if the immediate parent class isn't object
-        if descriptor_class.__bases__ != (object,):
-            base_init_sig = signature(descriptor_class.__base__.__init__)
-
-        init_parameters = {**init_sig.parameters, **base_init_sig.parameters}
-
-        # filter kwargs
-        allowed_kwargs = {'descriptor_index': descriptor_index, **{k: v for k, v in kwargs.items() if k in init_parameters}}
-
-        return descriptor_class(**allowed_kwargs)
-
-# TODO can we iterate over all existing subclasses of AEMDescriptor?
-AEMDescriptorFactory.register(at.JDKSAVDECC_DESCRIPTOR_ENTITY, AEMDescriptor_ENTITY)
-AEMDescriptorFactory.register(at.JDKSAVDECC_DESCRIPTOR_CONFIGURATION, AEMDescriptor_CONFIGURATION)
-AEMDescriptorFactory.register(at.JDKSAVDECC_DESCRIPTOR_AUDIO_UNIT, AEMDescriptor_AUDIO_UNIT)
-AEMDescriptorFactory.register(at.JDKSAVDECC_DESCRIPTOR_STREAM_INPUT, AEMDescriptor_STREAM_INPUT)
-AEMDescriptorFactory.register(at.JDKSAVDECC_DESCRIPTOR_STREAM_OUTPUT, AEMDescriptor_STREAM_OUTPUT)
-AEMDescriptorFactory.register(at.JDKSAVDECC_DESCRIPTOR_JACK_INPUT, AEMDescriptor_JACK_INPUT)
-AEMDescriptorFactory.register(at.JDKSAVDECC_DESCRIPTOR_JACK_OUTPUT, AEMDescriptor_JACK_OUTPUT)
-AEMDescriptorFactory.register(at.JDKSAVDECC_DESCRIPTOR_AVB_INTERFACE, AEMDescriptor_AVB_INTERFACE)
-AEMDescriptorFactory.register(at.JDKSAVDECC_DESCRIPTOR_CLOCK_SOURCE, AEMDescriptor_CLOCK_SOURCE)
-AEMDescriptorFactory.register(at.JDKSAVDECC_DESCRIPTOR_STREAM_PORT_INPUT, AEMDescriptor_STREAM_PORT_INPUT)
-AEMDescriptorFactory.register(at.JDKSAVDECC_DESCRIPTOR_STREAM_PORT_OUTPUT, AEMDescriptor_STREAM_PORT_OUTPUT)
-AEMDescriptorFactory.register(at.JDKSAVDECC_DESCRIPTOR_AUDIO_CLUSTER, AEMDescriptor_AUDIO_CLUSTER)
-AEMDescriptorFactory.register(at.JDKSAVDECC_DESCRIPTOR_AUDIO_MAP, AEMDescriptor_AUDIO_MAP)
-AEMDescriptorFactory.register(at.JDKSAVDECC_DESCRIPTOR_CLOCK_DOMAIN, AEMDescriptor_CLOCK_DOMAIN)
+        return registration.constructor(**kwargs)
+
+AEMDescriptorFactory.registerSubclasses(AEMDescriptor)
+
+# the cache and the model use the factory
+from ..aem.cache import DescriptorCache
+from ..aem.audiomap import AudioMappings
+from ..aem.model import EntityModel, EntityModelError
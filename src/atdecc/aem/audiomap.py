@@ -0,0 +1,123 @@
+from array import array
+import struct
+import sys
+
+from .. import atdecc_api as at
+
+# the AECP control_data_length is at most 524 bytes (IEEE 1722.1-2021, 9.2.1.1),
+# minus the AEM header (controller_entity_id, sequence_id, command_type)
+# and the GET_AUDIO_MAP response header (IEEE 1722.1-2021, 7.4.44)
+MAPPINGS_PER_PAGE = (524-12-12)//8
+
+
+def encode_mappings(mappings):
+    """
+    array('H') of the mappings (mapping_stream_index, mapping_stream_channel,
+    mapping_cluster_offset, mapping_cluster_channel) in network byte order
+    """
+    encoded = array('H', (value for mapping in mappings for value in mapping))
+    if sys.byteorder == 'little':
+        encoded.byteswap()
+    return encoded
+
+
+class AudioMappings:
+    """
+    The audio mappings of the STREAM_PORT_INPUT and STREAM_PORT_OUTPUT descriptors,
+    initially the mappings of their AUDIO_MAP descriptors.
+
+    The mappings of a port are split into pages of at most perPage mappings,
+    each page an array('H') already in network byte order, so that a GET_AUDIO_MAP
+    response is the page plus a header. ADD_AUDIO_MAPPINGS fills up the last page,
+    REMOVE_AUDIO_MAPPINGS only touches the pages of the removed mappings.
+    A mapping exists at most once per port.
+    """
+
+    portTypes = (
+        at.JDKSAVDECC_DESCRIPTOR_STREAM_PORT_INPUT,
+        at.JDKSAVDECC_DESCRIPTOR_STREAM_PORT_OUTPUT,
+    )
+
+    def __init__(self, perPage=MAPPINGS_PER_PAGE):
+        self.perPage = perPage
+        self.pages = {} # (descriptor_type, descriptor_index) -> [array('H')]
+        self.index = {} # (descriptor_type, descriptor_index) -> {mapping: page}
+
+    @classmethod
+    def fromInstances(cls, instances, configuration_index=0, perPage=MAPPINGS_PER_PAGE):
+        """
+        Mapping tables of the ports in instances {(configuration_index, descriptor_type, descriptor_index): AEMDescriptor}
+        """
+        mappings = cls(perPage)
+        for (index, descriptor_type, descriptor_index), instance in instances.items():
+            if index != configuration_index or descriptor_type not in cls.portTypes:
+                continue
+            d = instance.descriptor
+            port = []
+            for map_index in range(d.base_map, d.base_map+d.number_of_maps):
+                audio_map = instances.get((configuration_index, at.JDKSAVDECC_DESCRIPTOR_AUDIO_MAP, map_index))
+                if audio_map is not None:
+                    port += struct.iter_unpack("!4H", audio_map.data)
+            mappings.addPort(descriptor_type, descriptor_index)
+            mappings.add(descriptor_type, descriptor_index, port)
+        return mappings
+
+    def addPort(self, descriptor_type, descriptor_index):
+        self.pages[(descriptor_type, descriptor_index)] = [array('H')]
+        self.index[(descriptor_type, descriptor_index)] = {}
+
+    def __contains__(self, port):
+        return port in self.pages
+
+    def mappings(self, descriptor_type, descriptor_index):
+        """
+        Number of mappings of the port
+        """
+        return len(self.index[(descriptor_type, descriptor_index)])
+
+    def numberOfMaps(self, descriptor_type, descriptor_index):
+        return len(self.pages[(descriptor_type, descriptor_index)])
+
+    def page(self, descriptor_type, descriptor_index, map_index):
+        """
+        Returns (number_of_maps, number_of_mappings, mappings) of the page map_index,
+        mappings are encoded in network byte order. Raises IndexError for an unknown page.
+        """
+        pages = self.pages[(descriptor_type, descriptor_index)]
+        page = pages[map_index]
+        return len(pages), len(page)//4, page.tobytes()
+
+    def add(self, descriptor_type, descriptor_index, mappings):
+        """
+        Add the mappings [(stream_index, stream_channel, cluster_offset, cluster_channel)], existing ones are skipped
+        """
+        pages = self.pages[(descriptor_type, descriptor_index)]
+        index = self.index[(descriptor_type, descriptor_index)]
+        for mapping in mappings:
+            mapping = tuple(mapping)
+            if mapping in index:
+                continue
+            page = pages[-1]
+            if len(page) >= 4*self.perPage:
+                page = array('H')
+                pages.append(page)
+            page.extend(encode_mappings((mapping,)))
+            index[mapping] = page
+
+    def remove(self, descriptor_type, descriptor_index, mappings):
+        """
+        Remove the mappings, unknown ones are skipped. Emptied pages are dropped.
+        """
+        pages = self.pages[(descriptor_type, descriptor_index)]
+        index = self.index[(descriptor_type, descriptor_index)]
+        for mapping in mappings:
+            page = index.pop(tuple(mapping), None)
+            if page is None:
+                continue
+            encoded = encode_mappings((mapping,))
+            for offset in range(0, len(page), 4):
+                if page[offset:offset+4] == encoded:
+                    del page[offset:offset+4]
+                    break
+            if not page and len(pages) > 1:
+                pages[:] = [p for p in pages if p is not page]
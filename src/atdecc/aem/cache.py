@@ -0,0 +1,46 @@
+import copy
+
+
+class DescriptorCache:
+    """
+    Encoded descriptors for READ_DESCRIPTOR, keyed by (configuration_index, descriptor_type, descriptor_index).
+
+    An entry keeps the values it was built from: the EntityInfo fields which are
+    constructor parameters of the descriptor class, and the config section of the class.
+    It is only rebuilt if one of these has changed, e.g. the ENTITY descriptor
+    on a new available_index, but not the STREAM_INPUT descriptors.
+    """
+
+    def __init__(self, factory):
+        self.factory = factory # AEMDescriptorFactory
+        self.entries = {} # key -> (entity_info values, config section, encoded descriptor)
+        self.dependencies = {} # descriptor_type -> (EntityInfo fields, config key)
+
+    def clear(self):
+        self.entries.clear()
+
+    def dependenciesOf(self, descriptor_type, entity_info):
+        dependencies = self.dependencies.get(descriptor_type)
+        if dependencies is None:
+            registration = self.factory.registration(descriptor_type)
+            fields = tuple(field for field in vars(entity_info) if field in registration.parameters)
+            dependencies = self.dependencies[descriptor_type] = (fields, registration.config_key)
+        return dependencies
+
+    def get(self, configuration_index, descriptor_type, descriptor_index, entity_info, config):
+        """
+        Returns the encoded descriptor, raises ValueError for an unknown descriptor_type
+        """
+        fields, configKey = self.dependenciesOf(descriptor_type, entity_info)
+        values = tuple(getattr(entity_info, field) for field in fields)
+        section = config.get(configKey)
+
+        key = (configuration_index, descriptor_type, descriptor_index)
+        entry = self.entries.get(key)
+        if entry is not None and entry[0] == values and entry[1] == section:
+            return entry[2]
+
+        encoded = self.factory.create_descriptor(descriptor_type, descriptor_index, entity_info, config).encode()
+        # the config section is copied, it may be changed in place
+        self.entries[key] = (values, copy.deepcopy(section), encoded)
+        return encoded
@@ -0,0 +1,201 @@
+from types import MappingProxyType
+import struct
+
+from .. import atdecc_api as at
+from ..util import *
+from ..aem import AEMDescriptorFactory
+from ..aem.cache import DescriptorCache
+from ..aem.audiomap import AudioMappings
+
+
+class EntityModelError(ValueError):
+    """
+    The entity model configuration is malformed, errors lists all problems found
+    """
+
+    def __init__(self, errors):
+        super(EntityModelError, self).__init__("Invalid entity model:\n  "+"\n  ".join(errors))
+        self.errors = errors
+
+
+class EntityModel:
+    """
+    The compiled ATDECC Entity Model (IEEE 1722.1-2021, section 7).
+
+    descriptors is a read-only mapping of
+    (configuration_index, descriptor_type, descriptor_index) to the encoded descriptor.
+    counts is a read-only mapping of (configuration_index, descriptor_type) to the number of descriptors.
+
+    Some descriptors contain EntityInfo fields (e.g. available_index in the ENTITY descriptor),
+    current() returns a model with these descriptors rebuilt if the fields have changed.
+
+    audioMappings are the paged AudioMappings of the stream ports, they are changed in place
+    by ADD/REMOVE_AUDIO_MAPPINGS and shared by the models returned by current().
+
+    A model holds a single configuration, configurationIndex. The ENTITY descriptor is part of
+    every model, with the current_configuration of the model, see compileConfigurations.
+    """
+
+    def __init__(self, descriptors, counts, entity_info, config, cache, audioMappings=None, configurationIndex=0):
+        self.descriptors = MappingProxyType(descriptors)
+        self.counts = MappingProxyType(counts)
+        self.config = config
+        self.cache = cache
+        self.configurationIndex = configurationIndex
+        self.audioMappings = AudioMappings() if audioMappings is None else audioMappings
+        self.entityFields = tuple(sorted({
+            field
+            for descriptor_type in {descriptor_type for _, descriptor_type, _ in descriptors}
+            for field in cache.dependenciesOf(descriptor_type, entity_info)[0]
+        }))
+        self.entityValues = self.values(entity_info)
+
+    def values(self, entity_info):
+        return tuple(getattr(entity_info, field) for field in self.entityFields)
+
+    def get(self, configuration_index, descriptor_type, descriptor_index):
+        return self.descriptors.get((configuration_index, descriptor_type, descriptor_index))
+
+    def current(self, entity_info):
+        """
+        Returns this model, or a new one if EntityInfo fields of descriptors have changed
+        """
+        if self.values(entity_info) == self.entityValues:
+            return self
+        # only the changed descriptors are built, the others are served by the cache
+        descriptors = {
+            key: self.cache.get(*key, entity_info, self.config)
+            for key in self.descriptors
+        }
+        return EntityModel(descriptors, dict(self.counts), entity_info, self.config, self.cache, self.audioMappings, self.configurationIndex)
+
+    @staticmethod
+    def descriptorKeys(config, configuration_index=0):
+        """
+        Returns the counts {(configuration_index, descriptor_type): count} of the configuration
+        """
+        configuration = config.get('AEMDescriptor_CONFIGURATION') or {}
+        counts = {
+            (configuration_index, at.JDKSAVDECC_DESCRIPTOR_ENTITY): 1,
+            (configuration_index, at.JDKSAVDECC_DESCRIPTOR_CONFIGURATION): 1,
+        }
+        for descriptor_type, count in (configuration.get('descriptor_counts') or {}).items():
+            counts[(configuration_index, int(descriptor_type))] = int(count)
+        return counts
+
+    @staticmethod
+    def configurations(config):
+        """
+        Returns the config of every configuration.
+
+        The optional 'configurations' list of config holds the sections of each configuration
+        (e.g. its AEMDescriptor_CONFIGURATION with the descriptor_counts), the keys of a section
+        override the ones of the same section at the top level. Without the list, config is the
+        only configuration. The ENTITY section gets configurations_count and current_configuration.
+        """
+        overrides = config.get('configurations') or [{}]
+        configurations = []
+        for configuration_index, override in enumerate(overrides):
+            configuration = {key: section for key, section in config.items() if key != 'configurations'}
+            for key, section in (override or {}).items():
+                configuration[key] = {**(configuration.get(key) or {}), **(section or {})}
+            configuration['AEMDescriptor_ENTITY'] = {
+                **(configuration.get('AEMDescriptor_ENTITY') or {}),
+                'configurations_count': len(overrides),
+                'current_configuration': configuration_index,
+            }
+            configurations.append(configuration)
+        return configurations
+
+    @classmethod
+    def compileConfigurations(cls, entity_info, config, cache=None):
+        """
+        Returns the compiled models of all configurations of config, indexed by configuration_index.
+        Raises EntityModelError listing the problems of all configurations.
+        """
+        if cache is None:
+            cache = DescriptorCache(AEMDescriptorFactory)
+
+        configurations = cls.configurations(config)
+        models = []
+        errors = []
+        for configuration_index, configuration in enumerate(configurations):
+            try:
+                models.append(cls.compile(entity_info, configuration, cache, configuration_index))
+            except EntityModelError as e:
+                if len(configurations) > 1:
+                    errors += [f"CONFIGURATION {configuration_index}: {error}" for error in e.errors]
+                else:
+                    errors += e.errors
+        if errors:
+            raise EntityModelError(errors)
+        return models
+
+    @classmethod
+    def compile(cls, entity_info, config, cache=None, configuration_index=0):
+        """
+        Instantiate and encode every descriptor of the configuration and check their cross-references.
+        Raises EntityModelError listing all problems.
+
+        The CONFIGURATION descriptor of the model has the descriptor_index configuration_index.
+        """
+        if cache is None:
+            cache = DescriptorCache(AEMDescriptorFactory)
+
+        errors = []
+        counts = cls.descriptorKeys(config, configuration_index)
+        instances = {} # (configuration_index, descriptor_type, descriptor_index) -> AEMDescriptor
+
+        for (configuration_index, descriptor_type), count in counts.items():
+            descriptor_class = AEMDescriptorFactory.descriptorClass(descriptor_type)
+            if not descriptor_class:
+                errors.append(f"No descriptor class registered for type {descriptor_type:#06x}")
+                continue
+            if descriptor_type == at.JDKSAVDECC_DESCRIPTOR_CONFIGURATION:
+                indices = range(configuration_index, configuration_index+count)
+            else:
+                indices = range(count)
+            for descriptor_index in indices:
+                try:
+                    instances[(configuration_index, descriptor_type, descriptor_index)] = \
+                        AEMDescriptorFactory.create_descriptor(descriptor_type, descriptor_index, entity_info, config)
+                except Exception as e:
+                    errors.append(f"{descriptor_class.__name__} {descriptor_index}: {e}")
+
+        errors += cls.checkReferences(instances, counts)
+        if errors:
+            raise EntityModelError(errors)
+
+        descriptors = {
+            key: cache.get(*key, entity_info, config)
+            for key in instances
+        }
+        return cls(descriptors, counts, entity_info, config, cache,
+                   AudioMappings.fromInstances(instances, configuration_index), configuration_index)
+
+    @staticmethod
+    def checkReferences(instances, counts):
+        errors = []
+
+        def checkRange(name, configuration_index, descriptor_type, base, number):
+            count = counts.get((configuration_index, descriptor_type), 0)
+            if number and base+number > count:
+                errors.append(f"{name}: {api_enum('JDKSAVDECC_DESCRIPTOR_', descriptor_type)} {base}..{base+number-1} out of {count}")
+
+        for (configuration_index, descriptor_type, descriptor_index), instance in instances.items():
+            d = instance.descriptor
+            name = f"{type(instance).__name__} {descriptor_index}"
+
+            if descriptor_type in (at.JDKSAVDECC_DESCRIPTOR_STREAM_PORT_INPUT, at.JDKSAVDECC_DESCRIPTOR_STREAM_PORT_OUTPUT):
+                checkRange(name, configuration_index, at.JDKSAVDECC_DESCRIPTOR_AUDIO_CLUSTER, d.base_cluster, d.number_of_clusters)
+                checkRange(name, configuration_index, at.JDKSAVDECC_DESCRIPTOR_AUDIO_MAP, d.base_map, d.number_of_maps)
+
+            elif descriptor_type == at.JDKSAVDECC_DESCRIPTOR_CLOCK_DOMAIN:
+                clock_sources = struct.unpack_from("!%dH"%d.clock_sources_count, instance.data)
+                for clock_source in clock_sources:
+                    checkRange(name, configuration_index, at.JDKSAVDECC_DESCRIPTOR_CLOCK_SOURCE, clock_source, 1)
+                if d.clock_source_index not in clock_sources:
+                    errors.append(f"{name}: clock_source_index {d.clock_source_index} not in clock_sources {list(clock_sources)}")
+
+        return errors
+
@@ -1,6 +1,7 @@
 #!/usr/bin/env python3
 
 import ctypes
+import socket
 import struct
 import time
 import logging
@@ -15,7 +16,7 @@ import yaml
 
 
 from . import atdecc_api as av
-from .atdecc_api import ATDECC_create, ATDECC_destroy, ATDECC_send
+from .atdecc_api import ATDECC_create, ATDECC_destroy, ATDECC_send, ATDECC_set_counters
 
 from .pdu import *
 from .pdu_print import *
@@ -23,6 +24,7 @@ from .aem import *
 from .adp import *
 from .acmp import *
 from .aecp import *
+from .link import LinkMonitor, GrandmasterMonitor, PtpManagementClient
 
 class jdksInterface:
     handles = {}
@@ -53,6 +55,17 @@ class jdksInterface:
         del self.handles[self.handle.value]  # unregister instance
         self.handle.value = None
     
+    def attach_counters(self, counters, avb_interface_index=0):
+        """
+        Let the native worker count the frames sent and received in the CounterBlocks
+        of the AVB_INTERFACE avb_interface_index
+        """
+        frames_tx = counters.index(av.JDKSAVDECC_DESCRIPTOR_AVB_INTERFACE, avb_interface_index, AVB_INTERFACE_FRAMES_TX)
+        frames_rx = counters.index(av.JDKSAVDECC_DESCRIPTOR_AVB_INTERFACE, avb_interface_index, AVB_INTERFACE_FRAMES_RX)
+        self.counters = counters # the worker writes to the array, keep it alive
+        res = ATDECC_set_counters(self.handle, counters.pointer(frames_tx), counters.pointer(frames_rx))
+        assert res == 0
+
     def send_adp(self, msg, entity):
         pdu = entity.get_adpdu()
 #        logging.debug("ATDECC_send_adp: %s", adpdu_str(pdu))
@@ -138,7 +151,7 @@ class Interface(jdksInterface):
 
 class AVDECC:
 
-    def __init__(self, intf, entity_info, config, discover=False):
+    def __init__(self, intf, entity_info, config, discover=False, cache=None, ptp=None, journal=None):
         self.intf = Interface(intf)
         
         # generate entity_id from MAC
@@ -164,17 +177,58 @@ class AVDECC:
                         interface_state_machines=(adv_intf_sm,),
                         )
         self.state_machines.append(adv_sm)
+        # responses to ENTITY_DISCOVER are delayed like regular advertisements
+        adv_intf_sm.randomDeviceDelay = adv_sm.randomDeviceDelay
+
+        # link state and gPTP grandmaster updates for the InterfaceStateMachine
+        if hasattr(socket, 'AF_NETLINK'):
+            self.state_machines.append(LinkMonitor(intf, adv_intf_sm.setLinkState))
+        if ptp is not None:
+            self.state_machines.append(GrandmasterMonitor(PtpManagementClient(ptp), adv_intf_sm.setGrandmasterID))
+
+        # create DiscoveryStateMachine
+        if discover:
+            self.discovery = DiscoveryStateMachine(
+                            interfaces=(self.intf,),
+                            cache=None if cache is None else EntityCache(cache),
+                            )
+            self.discovery.performDiscover()
+            self.state_machines.append(self.discovery)
+
+        # acquire state of the entity model, read by ACMP
+        ownership = OwnershipView()
+        # unsolicited notifications of the entity model, connection changes are announced by ACMP
+        notifications = UnsolicitedNotifications(self.entity_info.entity_id)
 
         # create ACMPListenerStateMachine
         acmp_sm = ACMPListenerStateMachine(
                         entity_info=self.entity_info,
                         interfaces=(self.intf,),
+                        journal=None if journal is None else ConnectionJournal(journal),
+                        ownership=ownership,
+                        notifications=notifications,
                         )
         self.state_machines.append(acmp_sm)
 
+        # create ACMPTalkerStateMachine
+        if self.entity_info.talker_stream_sources > 0:
+            acmp_talker_sm = ACMPTalkerStateMachine(
+                            entity_info=self.entity_info,
+                            interfaces=(self.intf,),
+                            ownership=ownership,
+                            )
+            self.state_machines.append(acmp_talker_sm)
+
         # create EntityModelEntityStateMachine
-        aem_sm = EntityModelEntityStateMachine(entity_info=self.entity_info, interfaces=(self.intf,), config=config)
+        aem_sm = EntityModelEntityStateMachine(entity_info=self.entity_info, interfaces=(self.intf,), config=config, ownership=ownership, notifications=notifications)
         self.state_machines.append(aem_sm)
+        # SET_CONFIGURATION is advertised by ADP
+        aem_sm.configurationChanged = adv_intf_sm.setConfigurationIndex
+
+        # GET_COUNTERS of the AVB_INTERFACE
+        if (av.JDKSAVDECC_DESCRIPTOR_AVB_INTERFACE, 0) in aem_sm.counters:
+            self.intf.attach_counters(aem_sm.counters)
+            adv_intf_sm.attachCounters(aem_sm.counters)
 
     def __enter__(self):
         logging.debug("Starting threads")
@@ -1,4 +1,5 @@
 #include <thread>
+#include <atomic>
 #include <string>
 #include <iostream>
 #include <iomanip>
@@ -167,6 +168,14 @@ public:
 };
 
 
+static inline void _count(const std::atomic<uint32_t *> &counter)
+{
+  uint32_t *c = counter.load(std::memory_order_relaxed);
+  if(c)
+    __atomic_fetch_add(c, 1, __ATOMIC_RELAXED);
+}
+
+
 class atdecc_frame_t:
   public atdecc_msg_t
 {
@@ -268,14 +277,16 @@ protected:
           if(have) {
             if(msg->tp == ATDECC_THREAD_JOIN)
               ending = true;
-            else
-              msg->send(&net);
+            else if(msg->send(&net) == 0)
+              _count(frames_tx);
             
             delete msg;
           }
           
           // try to receive
           bool recvd = !ending && (avdecc_cmd_process_incoming_raw_once(this, &net, 0, _process) > 0);
+          if(recvd)
+            _count(frames_rx);
           
           if(!have && !recvd)
             // nothing done: yield execution (maybe we could even sleep)
@@ -296,7 +307,9 @@ public:
     adp_cb(_adp_cb), 
     acmp_cb(_acmp_cb),
     aecp_aem_cb(_aecp_aem_cb),
-    workerthr(NULL)
+    workerthr(NULL),
+    frames_tx(NULL),
+    frames_rx(NULL)
   {
     bzero(&adpdu, sizeof(adpdu));
     bzero(&acmpdu, sizeof(acmpdu));
@@ -331,6 +344,10 @@ public:
   struct jdksavdecc_adpdu adpdu;
   struct jdksavdecc_acmpdu acmpdu;
   struct jdksavdecc_aecpdu_aem aecpdu_aem;
+
+  // counters owned by the Python side, see ATDECC_set_counters
+  std::atomic<uint32_t *> frames_tx;
+  std::atomic<uint32_t *> frames_rx;
 };
 
 
@@ -357,3 +374,11 @@ ATDECC_C_API int ATDECC_C_CALL_CONVENTION ATDECC_send(ATDECC_HANDLE handle, cons
   atdecc->send.push(m);
   return 0;  
 }
+
+ATDECC_C_API int ATDECC_C_CALL_CONVENTION ATDECC_set_counters(ATDECC_HANDLE handle, uint32_t *frames_tx, uint32_t *frames_rx)
+{
+  auto atdecc = static_cast<atdecc_t *>(handle);
+  atdecc->frames_tx.store(frames_tx);
+  atdecc->frames_rx.store(frames_rx);
+  return 0;
+}
@@ -46,3 +46,6 @@ ATDECC_C_API int ATDECC_C_CALL_CONVENTION ATDECC_create(ATDECC_HANDLE *handle, c
 ATDECC_C_API int ATDECC_C_CALL_CONVENTION ATDECC_destroy(ATDECC_HANDLE handle);
 
 ATDECC_C_API int ATDECC_C_CALL_CONVENTION ATDECC_send(ATDECC_HANDLE handle, const struct jdksavdecc_frame *frame);
+
+// counters incremented atomically by the worker for every frame sent and received, NULL to stop counting
+ATDECC_C_API int ATDECC_C_CALL_CONVENTION ATDECC_set_counters(ATDECC_HANDLE handle, uint32_t *frames_tx, uint32_t *frames_rx);
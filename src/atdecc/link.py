@@ -0,0 +1,247 @@
+import os
+import errno
+import socket
+import select
+import struct
+import logging
+from threading import Thread, Event, Lock
+
+# rtnetlink, see linux/netlink.h, linux/rtnetlink.h, linux/if_link.h
+NETLINK_ROUTE = 0
+RTMGRP_LINK = 1
+NLMSG_ERROR = 2
+NLMSG_DONE = 3
+RTM_NEWLINK = 16
+RTM_DELLINK = 17
+RTM_GETLINK = 18
+NLM_F_REQUEST = 0x1
+NLM_F_DUMP = 0x300
+IFLA_IFNAME = 3
+IFLA_OPERSTATE = 16
+IFF_UP = 0x1
+IFF_RUNNING = 0x40
+IF_OPER_UNKNOWN = 0
+IF_OPER_UP = 6
+
+nlmsghdr = struct.Struct('=IHHII') # len, type, flags, seq, pid
+ifinfomsg = struct.Struct('=BxHiII') # family, type, index, flags, change
+rtattr = struct.Struct('=HH') # len, type
+
+
+def _align(n):
+    return (n+3) & ~3
+
+
+def parse_link_messages(data):
+    """
+    Parse rtnetlink messages.
+    Yields (ifname, up) for RTM_NEWLINK and RTM_DELLINK messages.
+    """
+    offset = 0
+    while offset+nlmsghdr.size <= len(data):
+        msg_len, msg_type, _, _, _ = nlmsghdr.unpack_from(data, offset)
+        if msg_len < nlmsghdr.size or offset+msg_len > len(data):
+            break
+        end = offset+msg_len
+
+        if msg_type in (RTM_NEWLINK, RTM_DELLINK):
+            _, _, _, flags, _ = ifinfomsg.unpack_from(data, offset+nlmsghdr.size)
+            ifname = None
+            operstate = None
+            pos = offset+nlmsghdr.size+ifinfomsg.size
+            while pos+rtattr.size <= end:
+                rta_len, rta_type = rtattr.unpack_from(data, pos)
+                if rta_len < rtattr.size:
+                    break
+                payload = data[pos+rtattr.size:pos+rta_len]
+                if rta_type == IFLA_IFNAME:
+                    ifname = payload.split(b'\0', 1)[0].decode()
+                elif rta_type == IFLA_OPERSTATE:
+                    operstate = payload[0]
+                pos += _align(rta_len)
+
+            up = msg_type == RTM_NEWLINK and bool(flags & IFF_UP) and bool(flags & IFF_RUNNING) and \
+                 operstate in (None, IF_OPER_UNKNOWN, IF_OPER_UP)
+            if ifname is not None:
+                yield ifname, up
+
+        offset += _align(msg_len)
+
+
+class LinkMonitor(Thread):
+    """
+    Event driven link state monitor for a network interface.
+
+    Listens to rtnetlink link notifications and calls callback(up)
+    whenever the state of the interface changes.
+    The current state is requested once at start.
+    """
+
+    def __init__(self, ifname, callback, sock=None):
+        super(LinkMonitor, self).__init__(daemon=True)
+        self.ifname = ifname
+        self.callback = callback
+        self.linkIsUp = None
+        self.ownSocket = sock is None
+        if sock is None:
+            sock = socket.socket(socket.AF_NETLINK, socket.SOCK_RAW, NETLINK_ROUTE)
+            sock.bind((0, RTMGRP_LINK))
+        self.sock = sock
+        # self-pipe to interrupt select on termination
+        self.wakeup_r, self.wakeup_w = os.pipe()
+        self.wakeupLock = Lock() # the pipe is closed by the ending thread
+        self.doTerminate = False
+
+    def performTerminate(self):
+        with self.wakeupLock:
+            if self.wakeup_w is not None and not self.doTerminate:
+                os.write(self.wakeup_w, b'\0')
+            self.doTerminate = True
+
+    def requestLinks(self):
+        req = nlmsghdr.pack(nlmsghdr.size+ifinfomsg.size, RTM_GETLINK, NLM_F_REQUEST | NLM_F_DUMP, 1, 0) + \
+              ifinfomsg.pack(socket.AF_UNSPEC, 0, 0, 0, 0)
+        self.sock.send(req)
+
+    def handleMessages(self, data):
+        for ifname, up in parse_link_messages(data):
+            if ifname == self.ifname and up != self.linkIsUp:
+                logging.debug("Link %s is %s", ifname, "up" if up else "down")
+                self.linkIsUp = up
+                self.callback(up)
+
+    def run(self):
+        logging.debug("LinkMonitor: Starting thread")
+
+        if self.ownSocket:
+            self.requestLinks()
+
+        while True:
+            readable, _, _ = select.select([self.sock, self.wakeup_r], [], [])
+            if self.wakeup_r in readable:
+                break
+            try:
+                data = self.sock.recv(65536)
+            except OSError as e:
+                logging.warning("LinkMonitor: %s", e)
+                if e.errno == errno.ENOBUFS and self.ownSocket:
+                    # notifications have been lost, query the current state again
+                    self.requestLinks()
+                continue
+            if not data:
+                break
+            self.handleMessages(data)
+
+        if self.ownSocket:
+            self.sock.close()
+        with self.wakeupLock:
+            os.close(self.wakeup_r)
+            os.close(self.wakeup_w)
+            self.wakeup_r = self.wakeup_w = None
+
+        logging.debug("LinkMonitor: Ending thread")
+
+
+class PtpManagementClient:
+    """
+    Grandmaster ID source querying a local linuxptp ptp4l over its
+    management unix domain socket (like `pmc -u 'GET PARENT_DATA_SET'`).
+
+    IEEE 1588-2019, section 15 (management messages)
+    """
+
+    MANAGEMENT = 0xd
+    ACTION_GET = 0
+    ACTION_RESPONSE = 2
+    TLV_MANAGEMENT = 0x0001
+    PARENT_DATA_SET = 0x2002
+    header = struct.Struct('!BBHBxH8x4x8sHHBb') # 34 bytes PTP common header
+    management = struct.Struct('!8sHBBBxHHH') # target port, hops, action, TLV
+    GM_OFFSET = 24 # grandmasterIdentity within the PARENT_DATA_SET
+
+    def __init__(self, path='/var/run/ptp4l', domain=0, timeout=0.5, local=None):
+        self.path = path
+        self.domain = domain
+        self.timeout = timeout
+        self.sequenceID = 0
+        self.local = local or f"/var/run/atdecc.{os.getpid()}" # our socket, ptp4l replies here
+
+    def request(self):
+        self.sequenceID = (self.sequenceID+1) & 0xffff
+        length = self.header.size+self.management.size
+        return self.header.pack(
+                self.MANAGEMENT, 2, length, self.domain, 0,
+                b'\0'*8, 0, self.sequenceID, 0x04, 0x7f) + \
+            self.management.pack(
+                b'\xff'*8, 0xffff, 0, 0, self.ACTION_GET,
+                self.TLV_MANAGEMENT, 2, self.PARENT_DATA_SET)
+
+    def parse(self, data):
+        """
+        Return the grandmasterIdentity from a PARENT_DATA_SET response, or None
+        """
+        if len(data) < self.header.size+self.management.size+self.GM_OFFSET+8:
+            return None
+        if data[0] & 0x0f != self.MANAGEMENT:
+            return None
+        _, _, _, _, action, tlv_type, _, management_id = self.management.unpack_from(data, self.header.size)
+        if action & 0x0f != self.ACTION_RESPONSE or tlv_type != self.TLV_MANAGEMENT or \
+           management_id != self.PARENT_DATA_SET:
+            return None
+        offset = self.header.size+self.management.size+self.GM_OFFSET
+        return int.from_bytes(data[offset:offset+8], 'big')
+
+    def __call__(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        try:
+            try:
+                os.unlink(self.local) # stale from a previous run
+            except FileNotFoundError:
+                pass
+            sock.bind(self.local)
+            sock.settimeout(self.timeout)
+            sock.sendto(self.request(), self.path)
+            return self.parse(sock.recv(1024))
+        except OSError as e:
+            logging.debug("PTP management: %s", e)
+            return None
+        finally:
+            sock.close()
+            try:
+                os.unlink(self.local)
+            except OSError:
+                pass
+
+
+class GrandmasterMonitor(Thread):
+    """
+    Calls callback(gm_id) whenever the grandmaster ID returned by source changes.
+    source is a callable returning the current grandmaster ID as int (or None if unknown),
+    e.g. a PtpManagementClient.
+    """
+
+    def __init__(self, source, callback, interval=1):
+        super(GrandmasterMonitor, self).__init__(daemon=True)
+        self.source = source
+        self.callback = callback
+        self.interval = interval
+        self.grandmasterID = None
+        self.event = Event()
+        self.doTerminate = False
+
+    def performTerminate(self):
+        self.doTerminate = True
+        self.event.set()
+
+    def run(self):
+        logging.debug("GrandmasterMonitor: Starting thread")
+
+        while not self.doTerminate:
+            gm = self.source()
+            if gm is not None and gm != self.grandmasterID:
+                logging.debug("Grandmaster ID %016x", gm)
+                self.grandmasterID = gm
+                self.callback(gm)
+            self.event.wait(self.interval)
+
+        logging.debug("GrandmasterMonitor: Ending thread")
@@ -1,5 +1,6 @@
 import struct
 import netifaces
+from threading import Lock
 
 from . import atdecc_api as at
 
@@ -184,3 +185,20 @@ def intf_to_ip(intf):
     """
     addrs = netifaces.ifaddresses(intf)
     return addrs[netifaces.AF_INET][0]['addr']
+
+
+class SequenceIDAllocator:
+    """
+    Thread safe allocator of 16 bit sequence IDs,
+    increasing monotonically and wrapping around.
+    """
+
+    def __init__(self, start=0):
+        self.lock = Lock()
+        self.sequenceID = start & 0xffff
+
+    def allocate(self):
+        with self.lock:
+            sequenceID = self.sequenceID
+            self.sequenceID = (sequenceID+1) & 0xffff
+            return sequenceID
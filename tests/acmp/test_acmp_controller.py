@@ -0,0 +1,224 @@
+import pytest
+from unittest.mock import Mock
+from threading import Thread, Lock
+from queue import Queue, Empty
+import asyncio
+import time
+
+from atdecc.acmp import ACMPController
+import atdecc.atdecc_api as at
+from atdecc.util import *
+
+
+class SimulatedListeners:
+    """
+    Interface answering ACMP commands for a population of listeners
+    {listener_entity_id: listener_stream_sinks} from a separate thread
+    """
+
+    def __init__(self, listeners):
+        self.listeners = listeners
+        self.connections = {}
+        self.acmp_cbs = []
+        self.commands = Queue()
+        self.lock = Lock()
+        self.outstanding = 0
+        self.maxOutstanding = 0
+        self.sent = 0
+        self.doTerminate = False
+        self.thread = Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def register_acmp_cb(self, cb):
+        self.acmp_cbs.append(cb)
+
+    def unregister_acmp_cb(self, cb):
+        self.acmp_cbs.remove(cb)
+
+    def send_acmp(self, pdu, message_type, status):
+        with self.lock:
+            self.sent += 1
+            self.outstanding += 1
+            self.maxOutstanding = max(self.maxOutstanding, self.outstanding)
+        self.commands.put((type(pdu).from_buffer_copy(pdu), message_type))
+
+    def answer(self, command, message_type):
+        listener_entity_id = eui64_to_uint64(command.listener_entity_id)
+        key = (listener_entity_id, command.listener_unique_id)
+        response = type(command).from_buffer_copy(command)
+        response.header.message_type = message_type+1
+        status = at.JDKSAVDECC_ACMP_STATUS_SUCCESS
+        if command.listener_unique_id >= self.listeners.get(listener_entity_id, 0):
+            status = at.JDKSAVDECC_ACMP_STATUS_LISTENER_UNKNOWN_ID
+        elif message_type == at.JDKSAVDECC_ACMP_MESSAGE_TYPE_CONNECT_RX_COMMAND:
+            self.connections[key] = (eui64_to_uint64(command.talker_entity_id), command.talker_unique_id)
+        elif message_type == at.JDKSAVDECC_ACMP_MESSAGE_TYPE_DISCONNECT_RX_COMMAND:
+            self.connections.pop(key, None)
+        elif message_type == at.JDKSAVDECC_ACMP_MESSAGE_TYPE_GET_RX_STATE_COMMAND:
+            talker = self.connections.get(key)
+            response.connection_count = 0 if talker is None else 1
+            if talker is not None:
+                response.talker_entity_id = uint64_to_eui64(talker[0])
+                response.talker_unique_id = talker[1]
+        response.header.status = status
+        return response
+
+    def run(self):
+        while not self.doTerminate:
+            try:
+                command, message_type = self.commands.get(timeout=0.1)
+            except Empty:
+                continue
+            response = self.answer(command, message_type)
+            with self.lock:
+                self.outstanding -= 1
+            for cb in self.acmp_cbs:
+                cb(response)
+
+    def terminate(self):
+        self.doTerminate = True
+        self.thread.join()
+
+
+class TestACMPController:
+
+    def test_connect(self):
+        listeners = SimulatedListeners({100: 2})
+        controller = ACMPController(1, [listeners])
+        controller.start()
+
+        response = controller.connect(50, 0, 100, 1).result(timeout=1)
+
+        assert at.JDKSAVDECC_ACMP_MESSAGE_TYPE_CONNECT_RX_RESPONSE == response.header.message_type
+        assert at.JDKSAVDECC_ACMP_STATUS_SUCCESS == response.header.status
+        assert listeners.connections == {(100, 1): (50, 0)}
+
+        response = controller.getRxState(100, 1).result(timeout=1)
+        assert 1 == response.connection_count
+        assert 50 == eui64_to_uint64(response.talker_entity_id)
+
+        # unknown sink
+        response = controller.connect(50, 0, 100, 2).result(timeout=1)
+        assert at.JDKSAVDECC_ACMP_STATUS_LISTENER_UNKNOWN_ID == response.header.status
+
+        response = controller.disconnect(50, 0, 100, 1).result(timeout=1)
+        assert at.JDKSAVDECC_ACMP_STATUS_SUCCESS == response.header.status
+        assert listeners.connections == {}
+
+        controller.performTerminate()
+        listeners.terminate()
+
+    def test_connect_async(self):
+        listeners = SimulatedListeners({100: 8})
+        controller = ACMPController(1, [listeners])
+        controller.start()
+
+        async def connect_all():
+            return await asyncio.gather(*(controller.connect_async(50, i, 100, i) for i in range(8)))
+
+        responses = asyncio.run(connect_all())
+
+        assert [r.header.status for r in responses] == [at.JDKSAVDECC_ACMP_STATUS_SUCCESS]*8
+        assert [r.listener_unique_id for r in responses] == list(range(8))
+
+        controller.performTerminate()
+        listeners.terminate()
+
+    def test_window(self):
+        intf = Mock()
+        controller = ACMPController(1, [intf], window=4)
+
+        futures = controller.connect_many((50, 0, 100, i) for i in range(10))
+        controller.processRequests()
+        controller.fillWindow()
+
+        # only the window is inflight
+        assert 4 == intf.send_acmp.call_count
+        assert 4 == len(controller.inflight)
+
+        # a response frees a slot
+        command = intf.send_acmp.call_args_list[0][0][0]
+        response = type(command).from_buffer_copy(command)
+        response.header.message_type = at.JDKSAVDECC_ACMP_MESSAGE_TYPE_CONNECT_RX_RESPONSE
+        controller.acmp_cb(response)
+        controller.processResponses()
+        controller.fillWindow()
+
+        assert futures[0].done()
+        assert 5 == intf.send_acmp.call_count
+        # commands are sent in submission order
+        assert [call[0][0].listener_unique_id for call in intf.send_acmp.call_args_list] == list(range(5))
+
+    def test_timeout(self):
+        intf = Mock()
+        clock = Mock(return_value=100.)
+        controller = ACMPController(1, [intf], clock=clock)
+
+        future = controller.connect(50, 0, 100, 0)
+        controller.processRequests()
+        controller.fillWindow()
+        deadline = 100. + at.JDKSAVDECC_ACMP_TIMEOUT_CONNECT_RX_COMMAND_MS/1000.
+        assert controller.nextTimeout() == deadline
+
+        controller.processTimeouts(deadline-0.001)
+        assert 1 == intf.send_acmp.call_count
+
+        # retry
+        clock.return_value = deadline
+        controller.processTimeouts(deadline)
+        assert 2 == intf.send_acmp.call_count
+        assert not future.done()
+
+        retryDeadline = deadline + at.JDKSAVDECC_ACMP_TIMEOUT_CONNECT_RX_COMMAND_MS/1000.
+        controller.processTimeouts(retryDeadline)
+        assert 2 == intf.send_acmp.call_count
+        with pytest.raises(TimeoutError):
+            future.result(timeout=0)
+        assert not controller.inflight
+
+    def test_ignore_unsolicited(self):
+        intf = Mock()
+        controller = ACMPController(1, [intf])
+
+        future = controller.connect(50, 0, 100, 0)
+        controller.processRequests()
+        controller.fillWindow()
+        command = intf.send_acmp.call_args[0][0]
+
+        # response for another controller
+        response = type(command).from_buffer_copy(command)
+        response.header.message_type = at.JDKSAVDECC_ACMP_MESSAGE_TYPE_CONNECT_RX_RESPONSE
+        response.controller_entity_id = uint64_to_eui64(2)
+        controller.acmp_cb(response)
+        # response for another sink with the same sequence id
+        response = type(command).from_buffer_copy(command)
+        response.header.message_type = at.JDKSAVDECC_ACMP_MESSAGE_TYPE_CONNECT_RX_RESPONSE
+        response.listener_unique_id = 1
+        controller.acmp_cb(response)
+        controller.processResponses()
+
+        assert not future.done()
+
+    ### benchmarks
+
+    def test_connect_many_benchmark(self):
+        # routing matrix of 64 listeners with 8 sinks each
+        listeners = SimulatedListeners({100+i: 8 for i in range(64)})
+        controller = ACMPController(1, [listeners], window=32)
+        controller.start()
+
+        matrix = [(50+l%4, s, 100+l, s) for l in range(64) for s in range(8)]
+
+        t0 = time.perf_counter()
+        futures = controller.connect_many(matrix)
+        responses = [f.result(timeout=10) for f in futures]
+        elapsed = time.perf_counter()-t0
+
+        controller.performTerminate()
+        listeners.terminate()
+
+        assert all(r.header.status == at.JDKSAVDECC_ACMP_STATUS_SUCCESS for r in responses)
+        assert len(listeners.connections) == 512
+        assert listeners.sent == 512
+        assert listeners.maxOutstanding <= 32
+        assert elapsed < 5.
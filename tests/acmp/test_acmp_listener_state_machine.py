@@ -1,10 +1,12 @@
 import pytest
 from unittest.mock import patch, Mock, ANY
 import time
+import ctypes
 
 from atdecc.adp import EntityInfo
-from atdecc.acmp import ACMPListenerStateMachine
+from atdecc.acmp import ACMPListenerStateMachine, inflightKey
 from atdecc.acmp.struct import *
+from atdecc.aecp import OwnershipView, UnsolicitedNotifications
 from atdecc import Interface, jdksInterface
 import atdecc.atdecc_api as at
 from atdecc.util import *
@@ -12,11 +14,13 @@ from atdecc.util import *
 class TestACMPListenerStateMachine:
 
     def test_valid_listener_unique(self):
-        ei = EntityInfo(entity_id=42)
+        ei = EntityInfo(entity_id=42, listener_stream_sinks=2)
         alsm = ACMPListenerStateMachine(ei, [])
 
-        assert alsm.validListenerUnique(42)
-        assert not alsm.validListenerUnique(43)
+        assert alsm.validListenerUnique(0)
+        assert alsm.validListenerUnique(1)
+        assert not alsm.validListenerUnique(2)
+        assert not alsm.validListenerUnique(42)
 
     def test_listener_is_connected(self):
         ei = EntityInfo(entity_id=42)
@@ -31,7 +35,7 @@ class TestACMPListenerStateMachine:
             listener_unique_id=0
         )
 
-        # listenerStreamInfos is empty
+        # listenerStreamInfos is not sized for listener_unique_id
         assert not alsm.listenerIsConnected(command)
 
         # connected is TRUE and talker_entity_id/talker_unique_id DOES NOT MATCH talker_entity_id/talker_unique_id in the command
@@ -97,7 +101,7 @@ class TestACMPListenerStateMachine:
             listener_unique_id=0
         )
 
-        # listenerStreamInfos is empty
+        # listenerStreamInfos is not sized for listener_unique_id
         assert not alsm.listenerIsConnectedTo(command)
 
         alsm.listenerStreamInfos = {
@@ -176,7 +180,7 @@ class TestACMPListenerStateMachine:
 
         return_value = alsm.txCommand(at.JDKSAVDECC_ACMP_MESSAGE_TYPE_CONNECT_TX_COMMAND, command, False)
 
-        inflightCommand = alsm.inflight[0]
+        inflightCommand = alsm.inflight[inflightKey(command)]
 
         assert return_value
         assert not inflightCommand.retried
@@ -211,18 +215,18 @@ class TestACMPListenerStateMachine:
         intf.send_acmp = Mock()
 
         # initially the inflight list contains one entry
-        alsm.inflight = [
+        alsm.addInflight(
             struct_acmp_inflight_command(
                 timeout=int(time.time()*1000) + at.JDKSAVDECC_ACMP_TIMEOUT_CONNECT_TX_COMMAND_MS,
                 retried=False,
                 command=command,
                 original_sequence_id=13
             )
-        ]
+        )
         
         return_value = alsm.txCommand(at.JDKSAVDECC_ACMP_MESSAGE_TYPE_CONNECT_TX_COMMAND, command, True)
 
-        inflightCommand = alsm.inflight[0]
+        inflightCommand = alsm.inflight[inflightKey(command)]
 
         assert return_value
         assert inflightCommand.retried
@@ -318,7 +322,7 @@ class TestACMPListenerStateMachine:
         intf.send_acmp.assert_called_with(response, at.JDKSAVDECC_ACMP_MESSAGE_TYPE_CONNECT_RX_RESPONSE, at.JDKSAVDECC_ACMP_STATUS_CONTROLLER_NOT_AUTHORIZED)
 
     def test_connect_listener(self):
-        ei = EntityInfo(entity_id=42)
+        ei = EntityInfo(entity_id=42, listener_stream_sinks=2)
         alsm = ACMPListenerStateMachine(ei, [])
 
         response = at.struct_jdksavdecc_acmpdu (
@@ -343,7 +347,7 @@ class TestACMPListenerStateMachine:
         assert response == returned_response
 
     def test_disconnect_listener(self):
-        ei = EntityInfo(entity_id=42)
+        ei = EntityInfo(entity_id=42, listener_stream_sinks=2)
         alsm = ACMPListenerStateMachine(ei, [])
 
         response = at.struct_jdksavdecc_acmpdu (
@@ -372,6 +376,81 @@ class TestACMPListenerStateMachine:
         assert at.JDKSAVDECC_ACMP_STATUS_SUCCESS == status
         assert response == returned_response
 
+    def test_stream_info_notification(self):
+        ei = EntityInfo(entity_id=42, listener_stream_sinks=2)
+        notifications = UnsolicitedNotifications(42)
+        notifications.add(43)
+        alsm = ACMPListenerStateMachine(ei, [], notifications=notifications)
+
+        response = at.struct_jdksavdecc_acmpdu (
+            header = at.struct_jdksavdecc_acmpdu_common_control_header(
+                message_type=at.JDKSAVDECC_ACMP_MESSAGE_TYPE_CONNECT_RX_RESPONSE,
+                stream_id=uint64_to_eui64(0x1234),
+            ),
+            talker_entity_id=uint64_to_eui64(44),
+            talker_unique_id=0,
+            listener_unique_id=1
+        )
+
+        alsm.connectListener(response)
+
+        _, payload, _ = notifications.pending[(at.JDKSAVDECC_AEM_COMMAND_GET_STREAM_INFO, at.JDKSAVDECC_DESCRIPTOR_STREAM_INPUT, 1)]
+        assert 48 == len(payload)
+        _, _, flags, _, stream_id = struct.unpack_from("!2HLQQ", payload)
+        assert flags & (1<<26) # CONNECTED
+        assert 0x1234 == stream_id
+
+        # the disconnect replaces the pending connect
+        alsm.disconnectListener(response)
+
+        assert 1 == len(notifications.pending)
+        _, payload, _ = notifications.pending[(at.JDKSAVDECC_AEM_COMMAND_GET_STREAM_INFO, at.JDKSAVDECC_DESCRIPTOR_STREAM_INPUT, 1)]
+        assert 0 == struct.unpack_from("!L", payload, 4)[0]
+
+    def test_listener_stream_table(self):
+        # 64 sinks, all connected and disconnected in place
+        ei = EntityInfo(entity_id=42, listener_stream_sinks=64)
+        intf = Interface("eth0")
+        alsm = ACMPListenerStateMachine(ei, [intf])
+        intf.send_acmp = Mock()
+
+        assert len(alsm.listenerStreamInfos) == 64
+        addresses = [ctypes.addressof(info) for info in alsm.listenerStreamInfos]
+
+        for i in range(64):
+            alsm.connectListener(at.struct_jdksavdecc_acmpdu (
+                header = at.struct_jdksavdecc_acmpdu_common_control_header(
+                    message_type=at.JDKSAVDECC_ACMP_MESSAGE_TYPE_CONNECT_TX_RESPONSE
+                ),
+                talker_entity_id=uint64_to_eui64(43),
+                talker_unique_id=i,
+                listener_unique_id=i
+            ))
+
+        response, status = alsm.getState(at.struct_jdksavdecc_acmpdu(listener_unique_id=63))
+        assert at.JDKSAVDECC_ACMP_STATUS_SUCCESS == status
+        assert 1 == response.connection_count
+        assert 63 == response.talker_unique_id
+
+        for i in range(64):
+            alsm.disconnectListener(at.struct_jdksavdecc_acmpdu(listener_unique_id=i))
+
+        assert not any(info.connected for info in alsm.listenerStreamInfos)
+        # records are not reallocated
+        assert addresses == [ctypes.addressof(info) for info in alsm.listenerStreamInfos]
+
+        # sinks beyond the table are unknown
+        command = at.struct_jdksavdecc_acmpdu (
+            header = at.struct_jdksavdecc_acmpdu_common_control_header(
+                message_type=at.JDKSAVDECC_ACMP_MESSAGE_TYPE_CONNECT_RX_COMMAND
+            ),
+            talker_entity_id=uint64_to_eui64(43),
+            listener_entity_id=uint64_to_eui64(42),
+            listener_unique_id=64
+        )
+        alsm._handleConnectRxCommand(command)
+        intf.send_acmp.assert_called_with(command, at.JDKSAVDECC_ACMP_MESSAGE_TYPE_CONNECT_RX_RESPONSE, at.JDKSAVDECC_ACMP_STATUS_LISTENER_UNKNOWN_ID)
+
     def test_cancel_timeout(self):
         ei = EntityInfo(entity_id=42)
         alsm = ACMPListenerStateMachine(ei, [])
@@ -386,18 +465,18 @@ class TestACMPListenerStateMachine:
             listener_unique_id=0
         )
 
-        alsm.inflight = [
+        alsm.addInflight(
             struct_acmp_inflight_command(
                 timeout=at.JDKSAVDECC_ACMP_TIMEOUT_CONNECT_TX_COMMAND_MS,
                 retried=False,
                 command=command,
                 original_sequence_id=0
-            ) 
-        ]
+            )
+        )
 
         alsm.cancelTimeout(command)
 
-        assert 0 == alsm.inflight[0].timeout
+        assert 0 == alsm.inflight[inflightKey(command)].timeout
 
         # commandResponse is a response for the command entry within inflight
         response = at.struct_jdksavdecc_acmpdu (
@@ -409,18 +488,18 @@ class TestACMPListenerStateMachine:
             listener_unique_id=0
         )
 
-        alsm.inflight = [
+        alsm.addInflight(
             struct_acmp_inflight_command(
                 timeout=at.JDKSAVDECC_ACMP_TIMEOUT_CONNECT_RX_COMMAND_MS,
                 retried=False,
                 command=command,
                 original_sequence_id=0
-            ) 
-        ]
+            )
+        )
 
         alsm.cancelTimeout(response)
 
-        assert 0 == alsm.inflight[0].timeout
+        assert 0 == alsm.inflight[inflightKey(command)].timeout
 
     def test_remove_inflight(self):
         ei = EntityInfo(entity_id=42)
@@ -436,14 +515,14 @@ class TestACMPListenerStateMachine:
             listener_unique_id=0
         )
 
-        alsm.inflight = [
+        alsm.addInflight(
             struct_acmp_inflight_command(
                 timeout=at.JDKSAVDECC_ACMP_TIMEOUT_CONNECT_TX_COMMAND_MS,
                 retried=False,
                 command=command,
                 original_sequence_id=0
             )
-        ]
+        )
 
         alsm.removeInflight(command)
 
@@ -459,14 +538,14 @@ class TestACMPListenerStateMachine:
             listener_unique_id=0
         )
 
-        alsm.inflight = [
+        alsm.addInflight(
             struct_acmp_inflight_command(
                 timeout=at.JDKSAVDECC_ACMP_TIMEOUT_CONNECT_RX_COMMAND_MS,
                 retried=False,
                 command=command,
                 original_sequence_id=0
-            ) 
-        ]
+            )
+        )
 
         alsm.removeInflight(response)
 
@@ -521,6 +600,42 @@ class TestACMPListenerStateMachine:
         # TODO see comment in implementation
         assert not alsm.listenerIsAcquiredOrLockedByOther(command)
 
+    def test_connect_rx_command_acquired_by_other(self):
+        ei = EntityInfo(entity_id=42, listener_stream_sinks=2)
+        intf = Interface("eth0")
+        ownership = OwnershipView()
+        alsm = ACMPListenerStateMachine(ei, [intf], ownership=ownership)
+        intf.send_acmp = Mock()
+
+        # the entity is acquired by controller 44
+        ownership.publish(at.JDKSAVDECC_DESCRIPTOR_ENTITY, 0, acquired_by=44)
+
+        command = at.struct_jdksavdecc_acmpdu (
+            header = at.struct_jdksavdecc_acmpdu_common_control_header(
+                message_type=at.JDKSAVDECC_ACMP_MESSAGE_TYPE_CONNECT_RX_COMMAND
+            ),
+            controller_entity_id=uint64_to_eui64(43),
+            talker_entity_id=uint64_to_eui64(50),
+            talker_unique_id=0,
+            listener_entity_id=uint64_to_eui64(42),
+            listener_unique_id=0,
+            sequence_id=13
+        )
+
+        alsm._handleConnectRxCommand(command)
+
+        # rejected without a talker transaction
+        intf.send_acmp.assert_called_once_with(command, at.JDKSAVDECC_ACMP_MESSAGE_TYPE_CONNECT_RX_RESPONSE, at.JDKSAVDECC_ACMP_STATUS_CONTROLLER_NOT_AUTHORIZED)
+        assert not alsm.inflight
+        assert not alsm.listenerStreamInfos[0].pending_connection
+
+        # the acquiring controller connects
+        command.controller_entity_id = uint64_to_eui64(44)
+        alsm._handleConnectRxCommand(command)
+
+        intf.send_acmp.assert_called_with(ANY, at.JDKSAVDECC_ACMP_MESSAGE_TYPE_CONNECT_TX_COMMAND, at.JDKSAVDECC_ACMP_STATUS_SUCCESS)
+        assert alsm.listenerStreamInfos[0].pending_connection
+
     ### test state machine paths/conditions
 
     # currentTime >= inflight[x].timeout && inflight[x].command.message_type == CONNECT_TX_COMMAND
@@ -540,14 +655,14 @@ class TestACMPListenerStateMachine:
 
         alsm._handleConnectTxTimeout = Mock()
 
-        alsm.inflight = [
+        alsm.addInflight(
             struct_acmp_inflight_command(
                 timeout=int(alsm.currentTime)-1,
                 retried=False,
                 command=command,
                 original_sequence_id=13
             )
-        ]
+        )
 
         alsm.start()
         alsm.event.set()
@@ -574,14 +689,14 @@ class TestACMPListenerStateMachine:
             sequence_id=13
         )
 
-        alsm.inflight = [
+        alsm.addInflight(
             struct_acmp_inflight_command(
                 timeout=int(alsm.currentTime)-1,
                 retried=False,
                 command=command,
                 original_sequence_id=13
             )
-        ]
+        )
 
         alsm._handleDisconnectTxTimeout = Mock()
 
@@ -607,7 +722,7 @@ class TestACMPListenerStateMachine:
 
         alsm.rcvdCmdResp.put(at.struct_jdksavdecc_acmpdu (
             header = at.struct_jdksavdecc_acmpdu_common_control_header(
-                message_type=at.JDKSAVDECC_ACMP_MESSAGE_TYPE_CONNECT_TX_COMMAND
+                message_type=at.JDKSAVDECC_ACMP_MESSAGE_TYPE_CONNECT_RX_COMMAND
             ),
             talker_entity_id=uint64_to_eui64(43),
             talker_unique_id=0,
@@ -615,7 +730,6 @@ class TestACMPListenerStateMachine:
             listener_unique_id=0,
             sequence_id=13
         ))
-        alsm.rcvdConnectRXCmd = True
 
         alsm.event.set()
 
@@ -638,7 +752,7 @@ class TestACMPListenerStateMachine:
 
         alsm.rcvdCmdResp.put(at.struct_jdksavdecc_acmpdu (
             header = at.struct_jdksavdecc_acmpdu_common_control_header(
-                message_type=at.JDKSAVDECC_ACMP_MESSAGE_TYPE_CONNECT_TX_COMMAND
+                message_type=at.JDKSAVDECC_ACMP_MESSAGE_TYPE_CONNECT_TX_RESPONSE
             ),
             talker_entity_id=uint64_to_eui64(43),
             talker_unique_id=0,
@@ -646,7 +760,6 @@ class TestACMPListenerStateMachine:
             listener_unique_id=0,
             sequence_id=13
         ))
-        alsm.rcvdConnectTXResp = True
 
         alsm.event.set()
 
@@ -669,7 +782,7 @@ class TestACMPListenerStateMachine:
 
         alsm.rcvdCmdResp.put(at.struct_jdksavdecc_acmpdu (
             header = at.struct_jdksavdecc_acmpdu_common_control_header(
-                message_type=at.JDKSAVDECC_ACMP_MESSAGE_TYPE_CONNECT_TX_COMMAND
+                message_type=at.JDKSAVDECC_ACMP_MESSAGE_TYPE_GET_RX_STATE_COMMAND
             ),
             talker_entity_id=uint64_to_eui64(43),
             talker_unique_id=0,
@@ -677,7 +790,6 @@ class TestACMPListenerStateMachine:
             listener_unique_id=0,
             sequence_id=13
         ))
-        alsm.rcvdGetRXState = True
 
         alsm.event.set()
 
@@ -700,7 +812,7 @@ class TestACMPListenerStateMachine:
 
         alsm.rcvdCmdResp.put(at.struct_jdksavdecc_acmpdu (
             header = at.struct_jdksavdecc_acmpdu_common_control_header(
-                message_type=at.JDKSAVDECC_ACMP_MESSAGE_TYPE_DISCONNECT_TX_COMMAND
+                message_type=at.JDKSAVDECC_ACMP_MESSAGE_TYPE_DISCONNECT_RX_COMMAND
             ),
             talker_entity_id=uint64_to_eui64(43),
             talker_unique_id=0,
@@ -708,7 +820,6 @@ class TestACMPListenerStateMachine:
             listener_unique_id=0,
             sequence_id=13
         ))
-        alsm.rcvdDisconnectRXCmd = True
 
         alsm.event.set()
 
@@ -739,7 +850,6 @@ class TestACMPListenerStateMachine:
             listener_unique_id=0,
             sequence_id=13
         ))
-        alsm.rcvdDisconnectTXResp = True
 
         alsm.event.set()
 
@@ -752,6 +862,49 @@ class TestACMPListenerStateMachine:
     
     
 
+    def test_connect_storm(self):
+        # a controller restoring 64 streams, interleaved with state queries
+        ei = EntityInfo(entity_id=42)
+        alsm = ACMPListenerStateMachine(ei, [])
+
+        connected = []
+        alsm._handleConnectRxCommand = Mock(side_effect=lambda cmd: connected.append(cmd.listener_unique_id))
+        alsm._handleGetRxState = Mock()
+
+        for i in range(64):
+            for message_type in (at.JDKSAVDECC_ACMP_MESSAGE_TYPE_CONNECT_RX_COMMAND, at.JDKSAVDECC_ACMP_MESSAGE_TYPE_GET_RX_STATE_COMMAND):
+                alsm.acmp_cb(at.struct_jdksavdecc_acmpdu (
+                    header = at.struct_jdksavdecc_acmpdu_common_control_header(
+                        message_type=message_type
+                    ),
+                    talker_entity_id=uint64_to_eui64(43),
+                    talker_unique_id=i,
+                    listener_entity_id=uint64_to_eui64(42),
+                    listener_unique_id=i,
+                    sequence_id=i
+                ))
+
+        # not for us
+        alsm.acmp_cb(at.struct_jdksavdecc_acmpdu (
+            header = at.struct_jdksavdecc_acmpdu_common_control_header(
+                message_type=at.JDKSAVDECC_ACMP_MESSAGE_TYPE_CONNECT_RX_COMMAND
+            ),
+            listener_entity_id=uint64_to_eui64(44),
+            listener_unique_id=99
+        ))
+
+        alsm.start()
+
+        # this is an antipattern, have to research time travel functionality in pytest
+        time.sleep(0.5)
+
+        alsm.performTerminate()
+
+        # every command is handled once, in order
+        assert connected == list(range(64))
+        assert alsm._handleGetRxState.call_count == 64
+        assert alsm.rcvdCmdResp.empty()
+
     ### test state machine handlers
 
     def test_connect_tx_timeout_handler(self):
@@ -1123,3 +1276,219 @@ class TestACMPListenerStateMachine:
             alsm.cancelTimeout.assert_called_with(command)
             alsm.removeInflight.assert_called_with(command)
             alsm.txResponse.assert_called_with(at.JDKSAVDECC_ACMP_MESSAGE_TYPE_DISCONNECT_RX_RESPONSE, command, at.JDKSAVDECC_ACMP_STATUS_SUCCESS)
+
+    ### benchmarks
+
+    def test_inflight_benchmark(self):
+        # 1000 concurrent pending connects, answered in reverse order
+        ei = EntityInfo(entity_id=42)
+        alsm = ACMPListenerStateMachine(ei, [])
+
+        commands = [
+            at.struct_jdksavdecc_acmpdu (
+                header = at.struct_jdksavdecc_acmpdu_common_control_header(
+                    message_type=at.JDKSAVDECC_ACMP_MESSAGE_TYPE_CONNECT_RX_COMMAND
+                ),
+                controller_entity_id=uint64_to_eui64(1),
+                talker_entity_id=uint64_to_eui64(100+i//8),
+                talker_unique_id=i%8,
+                listener_entity_id=uint64_to_eui64(42),
+                listener_unique_id=i,
+                sequence_id=i
+            )
+            for i in range(1000)
+        ]
+
+        t0 = time.perf_counter()
+        for command in commands:
+            assert alsm.txCommand(at.JDKSAVDECC_ACMP_MESSAGE_TYPE_CONNECT_TX_COMMAND, command, False)
+        assert len(alsm.inflight) == 1000
+
+        for command in reversed(commands):
+            assert alsm.findMatchingInflightIndex(command) is not None
+            alsm.cancelTimeout(command)
+            alsm.removeInflight(command)
+        elapsed = time.perf_counter()-t0
+
+        assert not alsm.inflight
+        # cancelled entries are not reported as expired
+        assert alsm.expiredInflights(float('inf')) == []
+        assert elapsed < 1.
+
+    ### sequence ids
+
+    def test_sequence_id_allocator(self):
+        allocator = SequenceIDAllocator(start=0xfffe)
+
+        assert [allocator.allocate() for _ in range(4)] == [0xfffe, 0xffff, 0, 1]
+
+    def test_sequence_id_correlation(self):
+        ei = EntityInfo(entity_id=42, listener_stream_sinks=1)
+        intf = Interface("eth0")
+        alsm = ACMPListenerStateMachine(ei, [intf])
+        intf.send_acmp = Mock()
+
+        def command(sequence_id):
+            return at.struct_jdksavdecc_acmpdu (
+                header = at.struct_jdksavdecc_acmpdu_common_control_header(
+                    message_type=at.JDKSAVDECC_ACMP_MESSAGE_TYPE_CONNECT_RX_COMMAND
+                ),
+                controller_entity_id=uint64_to_eui64(1),
+                talker_entity_id=uint64_to_eui64(43),
+                talker_unique_id=0,
+                listener_entity_id=uint64_to_eui64(42),
+                listener_unique_id=0,
+                sequence_id=sequence_id
+            )
+
+        # two overlapping operations on the same stream
+        first = command(100)
+        alsm.txCommand(at.JDKSAVDECC_ACMP_MESSAGE_TYPE_CONNECT_TX_COMMAND, first, False)
+        second = command(200)
+        alsm.txCommand(at.JDKSAVDECC_ACMP_MESSAGE_TYPE_CONNECT_TX_COMMAND, second, False)
+
+        # listener sequence ids are used towards the talker
+        assert first.sequence_id != second.sequence_id
+
+        def response(sequence_id):
+            r = command(sequence_id)
+            r.header.message_type = at.JDKSAVDECC_ACMP_MESSAGE_TYPE_CONNECT_TX_RESPONSE
+            return r
+
+        # a late response for the first command does not match the second one
+        assert alsm.findMatchingInflightIndex(response(first.sequence_id)) is None
+        alsm._handleConnectTxResponse(response(first.sequence_id))
+        assert len(alsm.inflight) == 1
+
+        # the response for the second command restores the controller's sequence id
+        alsm._handleConnectTxResponse(response(second.sequence_id))
+        assert not alsm.inflight
+        intf.send_acmp.assert_called_with(ANY, at.JDKSAVDECC_ACMP_MESSAGE_TYPE_CONNECT_RX_RESPONSE, at.JDKSAVDECC_ACMP_STATUS_SUCCESS)
+        assert 200 == intf.send_acmp.call_args[0][0].sequence_id
+
+    ### timeouts
+
+    def test_timeout_deadlines(self):
+        ei = EntityInfo(entity_id=42)
+        intf = Interface("eth0")
+        clock = Mock(return_value=100.)
+        alsm = ACMPListenerStateMachine(ei, [intf], clock=clock)
+
+        command = at.struct_jdksavdecc_acmpdu (
+            header = at.struct_jdksavdecc_acmpdu_common_control_header(
+                message_type=at.JDKSAVDECC_ACMP_MESSAGE_TYPE_CONNECT_RX_COMMAND
+            ),
+            talker_entity_id=uint64_to_eui64(43),
+            talker_unique_id=0,
+            listener_entity_id=uint64_to_eui64(42),
+            listener_unique_id=0,
+            sequence_id=13
+        )
+        alsm.listenerStreamInfos = {
+            0: struct_acmp_listener_stream_info(pending_connection=True)
+        }
+
+        intf.send_acmp = Mock()
+
+        assert alsm.nextTimeout() is None
+        assert alsm.txCommand(at.JDKSAVDECC_ACMP_MESSAGE_TYPE_CONNECT_TX_COMMAND, command, False)
+
+        deadline = 100. + at.JDKSAVDECC_ACMP_TIMEOUT_CONNECT_TX_COMMAND_MS/1000.
+        inflightCommand = alsm.inflight[inflightKey(command)]
+        assert inflightCommand.timeout == deadline
+        assert alsm.nextTimeout() == deadline
+        # the inflight entry holds the transmitted message type
+        assert inflightCommand.command.header.message_type == at.JDKSAVDECC_ACMP_MESSAGE_TYPE_CONNECT_TX_COMMAND
+
+        # 1 ms before the deadline nothing happens
+        clock.return_value = deadline-0.001
+        alsm.processTimeouts(alsm.currentTime)
+        assert intf.send_acmp.call_count == 1
+
+        # at the deadline the command is retried
+        clock.return_value = deadline
+        alsm.processTimeouts(alsm.currentTime)
+        assert intf.send_acmp.call_count == 2
+        intf.send_acmp.assert_called_with(ANY, at.JDKSAVDECC_ACMP_MESSAGE_TYPE_CONNECT_TX_COMMAND, at.JDKSAVDECC_ACMP_STATUS_SUCCESS)
+        assert inflightCommand.retried
+        retryDeadline = deadline + at.JDKSAVDECC_ACMP_TIMEOUT_CONNECT_TX_COMMAND_MS/1000.
+        assert alsm.nextTimeout() == retryDeadline
+
+        clock.return_value = retryDeadline-0.001
+        alsm.processTimeouts(alsm.currentTime)
+        assert intf.send_acmp.call_count == 2
+
+        # the retry times out, the controller is answered
+        clock.return_value = retryDeadline
+        alsm.processTimeouts(alsm.currentTime)
+        assert intf.send_acmp.call_count == 3
+        intf.send_acmp.assert_called_with(ANY, at.JDKSAVDECC_ACMP_MESSAGE_TYPE_CONNECT_RX_RESPONSE, at.JDKSAVDECC_ACMP_STATUS_LISTENER_TALKER_TIMEOUT)
+        assert not alsm.listenerStreamInfos[0].pending_connection
+        assert not alsm.inflight
+        assert alsm.nextTimeout() is None
+
+    def test_cancelled_timeout(self):
+        ei = EntityInfo(entity_id=42)
+        intf = Interface("eth0")
+        clock = Mock(return_value=100.)
+        alsm = ACMPListenerStateMachine(ei, [intf], clock=clock)
+
+        command = at.struct_jdksavdecc_acmpdu (
+            header = at.struct_jdksavdecc_acmpdu_common_control_header(
+                message_type=at.JDKSAVDECC_ACMP_MESSAGE_TYPE_DISCONNECT_RX_COMMAND
+            ),
+            talker_entity_id=uint64_to_eui64(43),
+            talker_unique_id=0,
+            listener_entity_id=uint64_to_eui64(42),
+            listener_unique_id=0,
+            sequence_id=13
+        )
+
+        intf.send_acmp = Mock()
+
+        assert alsm.txCommand(at.JDKSAVDECC_ACMP_MESSAGE_TYPE_DISCONNECT_TX_COMMAND, command, False)
+        alsm.cancelTimeout(command)
+        assert alsm.nextTimeout() is None
+
+        clock.return_value = 200.
+        alsm.processTimeouts(alsm.currentTime)
+        assert intf.send_acmp.call_count == 1
+
+    def test_wakeup_at_deadline(self):
+        ei = EntityInfo(entity_id=42)
+        alsm = ACMPListenerStateMachine(ei, [])
+        # without a pending timeout the thread would sleep much longer
+        alsm.maxWait = 10
+
+        command = at.struct_jdksavdecc_acmpdu (
+            header = at.struct_jdksavdecc_acmpdu_common_control_header(
+                message_type=at.JDKSAVDECC_ACMP_MESSAGE_TYPE_CONNECT_TX_COMMAND
+            ),
+            talker_entity_id=uint64_to_eui64(43),
+            talker_unique_id=0,
+            listener_unique_id=0,
+            sequence_id=13
+        )
+
+        called = []
+        alsm._handleConnectTxTimeout = Mock(side_effect=lambda infl: called.append(alsm.currentTime))
+
+        t0 = alsm.currentTime
+        alsm.addInflight(
+            struct_acmp_inflight_command(
+                timeout=t0+0.05,
+                retried=False,
+                command=command,
+                original_sequence_id=13
+            )
+        )
+
+        alsm.start()
+
+        # this is an antipattern, have to research time travel functionality in pytest
+        time.sleep(0.5)
+
+        alsm.performTerminate()
+
+        assert len(called) == 1
+        assert t0+0.05 <= called[0] < t0+0.3
@@ -0,0 +1,183 @@
+import pytest
+from unittest.mock import patch, Mock, ANY
+import time
+
+from atdecc.adp import EntityInfo
+from atdecc.acmp import ACMPTalkerStateMachine
+from atdecc.acmp.talker import TalkerStreamInfo
+from atdecc import Interface
+import atdecc.atdecc_api as at
+from atdecc.util import *
+
+def tx_command(message_type, listener_entity_id=43, listener_unique_id=0, talker_unique_id=0, connection_count=0):
+    return at.struct_jdksavdecc_acmpdu (
+        header = at.struct_jdksavdecc_acmpdu_common_control_header(
+            message_type=message_type
+        ),
+        controller_entity_id=uint64_to_eui64(1),
+        talker_entity_id=uint64_to_eui64(42),
+        talker_unique_id=talker_unique_id,
+        listener_entity_id=uint64_to_eui64(listener_entity_id),
+        listener_unique_id=listener_unique_id,
+        connection_count=connection_count,
+        sequence_id=13
+    )
+
+class TestACMPTalkerStateMachine:
+
+    def test_valid_talker_unique(self):
+        ei = EntityInfo(entity_id=42, talker_stream_sources=2)
+        atsm = ACMPTalkerStateMachine(ei, [])
+
+        assert atsm.validTalkerUnique(0)
+        assert atsm.validTalkerUnique(1)
+        assert not atsm.validTalkerUnique(2)
+
+    def test_talker_stream_info(self):
+        info = TalkerStreamInfo()
+
+        assert info.addListener((43, 0))
+        assert info.addListener((44, 0))
+        assert info.addListener((45, 1))
+        # already connected
+        assert not info.addListener((44, 0))
+        assert 3 == info.connection_count
+
+        assert info.removeListener((43, 0))
+        assert not info.removeListener((43, 0))
+        assert 2 == info.connection_count
+        assert sorted(info.connected_listeners) == [(44, 0), (45, 1)]
+        for index, listener in enumerate(info.connected_listeners):
+            assert info.listenerPositions[listener] == index
+
+    def test_connect_tx_command_handler(self):
+        ei = EntityInfo(entity_id=42, talker_stream_sources=1)
+        intf = Interface("eth0")
+        atsm = ACMPTalkerStateMachine(ei, [intf])
+        intf.send_acmp = Mock()
+
+        atsm._handleConnectTxCommand(tx_command(at.JDKSAVDECC_ACMP_MESSAGE_TYPE_CONNECT_TX_COMMAND))
+
+        intf.send_acmp.assert_called_with(ANY, at.JDKSAVDECC_ACMP_MESSAGE_TYPE_CONNECT_TX_RESPONSE, at.JDKSAVDECC_ACMP_STATUS_SUCCESS)
+        response = intf.send_acmp.call_args[0][0]
+        assert 1 == response.connection_count
+        assert atsm.talkerStreamInfos[0].stream_id == eui64_to_uint64(response.header.stream_id)
+
+        # unknown stream source
+        command = tx_command(at.JDKSAVDECC_ACMP_MESSAGE_TYPE_CONNECT_TX_COMMAND, talker_unique_id=1)
+        atsm._handleConnectTxCommand(command)
+
+        intf.send_acmp.assert_called_with(command, at.JDKSAVDECC_ACMP_MESSAGE_TYPE_CONNECT_TX_RESPONSE, at.JDKSAVDECC_ACMP_STATUS_TALKER_UNKNOWN_ID)
+
+        # acquired by another controller
+        with patch('atdecc.acmp.ACMPTalkerStateMachine.talkerIsAcquiredOrLockedByOther') as MockedIsAcquired:
+            MockedIsAcquired.return_value = True
+
+            command = tx_command(at.JDKSAVDECC_ACMP_MESSAGE_TYPE_CONNECT_TX_COMMAND, listener_entity_id=44)
+            atsm._handleConnectTxCommand(command)
+
+            intf.send_acmp.assert_called_with(command, at.JDKSAVDECC_ACMP_MESSAGE_TYPE_CONNECT_TX_RESPONSE, at.JDKSAVDECC_ACMP_STATUS_CONTROLLER_NOT_AUTHORIZED)
+            assert 1 == atsm.talkerStreamInfos[0].connection_count
+
+    def test_disconnect_tx_command_handler(self):
+        ei = EntityInfo(entity_id=42, talker_stream_sources=1)
+        intf = Interface("eth0")
+        atsm = ACMPTalkerStateMachine(ei, [intf])
+        intf.send_acmp = Mock()
+
+        atsm._handleConnectTxCommand(tx_command(at.JDKSAVDECC_ACMP_MESSAGE_TYPE_CONNECT_TX_COMMAND))
+        atsm._handleDisconnectTxCommand(tx_command(at.JDKSAVDECC_ACMP_MESSAGE_TYPE_DISCONNECT_TX_COMMAND))
+
+        intf.send_acmp.assert_called_with(ANY, at.JDKSAVDECC_ACMP_MESSAGE_TYPE_DISCONNECT_TX_RESPONSE, at.JDKSAVDECC_ACMP_STATUS_SUCCESS)
+        assert 0 == intf.send_acmp.call_args[0][0].connection_count
+        assert 0 == atsm.talkerStreamInfos[0].connection_count
+
+    def test_get_tx_state_handler(self):
+        ei = EntityInfo(entity_id=42, talker_stream_sources=1)
+        intf = Interface("eth0")
+        atsm = ACMPTalkerStateMachine(ei, [intf])
+        intf.send_acmp = Mock()
+
+        atsm._handleConnectTxCommand(tx_command(at.JDKSAVDECC_ACMP_MESSAGE_TYPE_CONNECT_TX_COMMAND, listener_entity_id=43))
+        atsm._handleConnectTxCommand(tx_command(at.JDKSAVDECC_ACMP_MESSAGE_TYPE_CONNECT_TX_COMMAND, listener_entity_id=44))
+        atsm._handleGetTxState(tx_command(at.JDKSAVDECC_ACMP_MESSAGE_TYPE_GET_TX_STATE_COMMAND))
+
+        intf.send_acmp.assert_called_with(ANY, at.JDKSAVDECC_ACMP_MESSAGE_TYPE_GET_TX_STATE_RESPONSE, at.JDKSAVDECC_ACMP_STATUS_SUCCESS)
+        assert 2 == intf.send_acmp.call_args[0][0].connection_count
+
+    def test_get_tx_connection_handler(self):
+        ei = EntityInfo(entity_id=42, talker_stream_sources=1)
+        intf = Interface("eth0")
+        atsm = ACMPTalkerStateMachine(ei, [intf])
+        intf.send_acmp = Mock()
+
+        atsm._handleConnectTxCommand(tx_command(at.JDKSAVDECC_ACMP_MESSAGE_TYPE_CONNECT_TX_COMMAND, listener_entity_id=43, listener_unique_id=3))
+
+        atsm._handleGetTxConnection(tx_command(at.JDKSAVDECC_ACMP_MESSAGE_TYPE_GET_TX_CONNECTION_COMMAND, listener_entity_id=0, connection_count=0))
+
+        intf.send_acmp.assert_called_with(ANY, at.JDKSAVDECC_ACMP_MESSAGE_TYPE_GET_TX_CONNECTION_RESPONSE, at.JDKSAVDECC_ACMP_STATUS_SUCCESS)
+        response = intf.send_acmp.call_args[0][0]
+        assert 43 == eui64_to_uint64(response.listener_entity_id)
+        assert 3 == response.listener_unique_id
+
+        atsm._handleGetTxConnection(tx_command(at.JDKSAVDECC_ACMP_MESSAGE_TYPE_GET_TX_CONNECTION_COMMAND, listener_entity_id=0, connection_count=1))
+
+        intf.send_acmp.assert_called_with(ANY, at.JDKSAVDECC_ACMP_MESSAGE_TYPE_GET_TX_CONNECTION_RESPONSE, at.JDKSAVDECC_ACMP_STATUS_NO_SUCH_CONNECTION)
+
+    def test_dispatch(self):
+        ei = EntityInfo(entity_id=42, talker_stream_sources=1)
+        atsm = ACMPTalkerStateMachine(ei, [])
+
+        atsm._handleConnectTxCommand = Mock()
+        atsm._handleGetTxConnection = Mock()
+
+        atsm.acmp_cb(tx_command(at.JDKSAVDECC_ACMP_MESSAGE_TYPE_CONNECT_TX_COMMAND))
+        atsm.acmp_cb(tx_command(at.JDKSAVDECC_ACMP_MESSAGE_TYPE_GET_TX_CONNECTION_COMMAND))
+        # listener messages are not for the talker
+        atsm.acmp_cb(tx_command(at.JDKSAVDECC_ACMP_MESSAGE_TYPE_CONNECT_RX_COMMAND))
+
+        atsm.start()
+
+        # this is an antipattern, have to research time travel functionality in pytest
+        time.sleep(0.5)
+
+        atsm.performTerminate()
+
+        atsm._handleConnectTxCommand.assert_called_once()
+        atsm._handleGetTxConnection.assert_called_once()
+
+    ### load
+
+    def test_connect_256_listeners(self):
+        ei = EntityInfo(entity_id=42, talker_stream_sources=1)
+        intf = Interface("eth0")
+        atsm = ACMPTalkerStateMachine(ei, [intf])
+        intf.send_acmp = Mock()
+
+        listeners = [(100+i//4, i%4) for i in range(256)]
+
+        t0 = time.perf_counter()
+        for listener_entity_id, listener_unique_id in listeners:
+            atsm._handleConnectTxCommand(tx_command(at.JDKSAVDECC_ACMP_MESSAGE_TYPE_CONNECT_TX_COMMAND, listener_entity_id, listener_unique_id))
+        elapsed = time.perf_counter()-t0
+
+        talkerInfo = atsm.talkerStreamInfos[0]
+        assert 256 == talkerInfo.connection_count
+        assert 256 == intf.send_acmp.call_args[0][0].connection_count
+
+        # every connection can be read back by index
+        connections = set()
+        for index in range(256):
+            atsm._handleGetTxConnection(tx_command(at.JDKSAVDECC_ACMP_MESSAGE_TYPE_GET_TX_CONNECTION_COMMAND, 0, 0, connection_count=index))
+            response = intf.send_acmp.call_args[0][0]
+            assert at.JDKSAVDECC_ACMP_STATUS_SUCCESS == intf.send_acmp.call_args[0][2]
+            connections.add((eui64_to_uint64(response.listener_entity_id), response.listener_unique_id))
+        assert connections == set(listeners)
+
+        # disconnect every other listener
+        for listener_entity_id, listener_unique_id in listeners[::2]:
+            atsm._handleDisconnectTxCommand(tx_command(at.JDKSAVDECC_ACMP_MESSAGE_TYPE_DISCONNECT_TX_COMMAND, listener_entity_id, listener_unique_id))
+
+        assert 128 == talkerInfo.connection_count
+        assert set(talkerInfo.connected_listeners) == set(listeners[1::2])
+        assert elapsed < 1.
@@ -0,0 +1,126 @@
+import pytest
+from unittest.mock import Mock, ANY
+import time
+
+from atdecc.adp import EntityInfo
+from atdecc.acmp import ACMPListenerStateMachine, ConnectionJournal, inflightKey
+from atdecc.acmp.struct import *
+from atdecc import Interface
+import atdecc.atdecc_api as at
+from atdecc.util import *
+
+def connect_tx_response(listener_unique_id, talker_entity_id=43, talker_unique_id=0):
+    return at.struct_jdksavdecc_acmpdu (
+        header = at.struct_jdksavdecc_acmpdu_common_control_header(
+            message_type=at.JDKSAVDECC_ACMP_MESSAGE_TYPE_CONNECT_TX_RESPONSE,
+            stream_id=uint64_to_eui64(0x1122334455660000+talker_unique_id)
+        ),
+        controller_entity_id=uint64_to_eui64(1),
+        talker_entity_id=uint64_to_eui64(talker_entity_id),
+        talker_unique_id=talker_unique_id,
+        listener_entity_id=uint64_to_eui64(42),
+        listener_unique_id=listener_unique_id,
+        stream_dest_mac=uint64_to_eui48(0x91e0f0000001),
+        stream_vlan_id=2
+    )
+
+class TestConnectionJournal:
+
+    def test_save_load(self, tmp_path):
+        journal = ConnectionJournal(str(tmp_path / 'connections.bin'))
+        ei = EntityInfo(entity_id=42, listener_stream_sinks=4)
+        alsm = ACMPListenerStateMachine(ei, [])
+
+        alsm.connectListener(connect_tx_response(1, talker_unique_id=5))
+        alsm.connectListener(connect_tx_response(3))
+
+        journal.save(alsm.listenerStreamInfos)
+        loaded = journal.load()
+
+        assert [listener_unique_id for listener_unique_id, _ in loaded] == [1, 3]
+        listener_unique_id, info = loaded[0]
+        assert info.connected
+        assert 43 == eui64_to_uint64(info.talker_entity_id)
+        assert 5 == info.talker_unique_id
+        assert 1 == eui64_to_uint64(info.controller_entity_id)
+        assert 0x1122334455660005 == eui64_to_uint64(info.stream_id)
+        assert 0x91e0f0000001 == eui48_to_uint64(info.stream_dest_mac)
+        assert 2 == info.stream_vlan_id
+        assert not (tmp_path / 'connections.bin.tmp').exists()
+
+    def test_load_missing(self, tmp_path):
+        assert ConnectionJournal(str(tmp_path / 'connections.bin')).load() == []
+
+    def test_load_invalid(self, tmp_path):
+        path = tmp_path / 'connections.bin'
+        path.write_bytes(b'garbage')
+        assert ConnectionJournal(str(path)).load() == []
+
+    def test_journal_on_change(self, tmp_path):
+        journal = ConnectionJournal(str(tmp_path / 'connections.bin'))
+        ei = EntityInfo(entity_id=42, listener_stream_sinks=2)
+        alsm = ACMPListenerStateMachine(ei, [], journal=journal)
+
+        alsm.connectListener(connect_tx_response(0))
+        assert [listener_unique_id for listener_unique_id, _ in journal.load()] == [0]
+
+        alsm.connectListener(connect_tx_response(1))
+        assert [listener_unique_id for listener_unique_id, _ in journal.load()] == [0, 1]
+
+        alsm.disconnectListener(connect_tx_response(0))
+        assert [listener_unique_id for listener_unique_id, _ in journal.load()] == [1]
+
+    def test_unwritable(self, tmp_path):
+        journal = ConnectionJournal(str(tmp_path / 'missing' / 'connections.bin'))
+        ei = EntityInfo(entity_id=42, listener_stream_sinks=2)
+        alsm = ACMPListenerStateMachine(ei, [], journal=journal)
+
+        alsm.connectListener(connect_tx_response(0))
+
+        # the journal is disabled, the connection is made
+        assert alsm.journal is None
+        assert alsm.listenerStreamInfos[0].connected
+
+    def test_fast_connect(self, tmp_path):
+        journal = ConnectionJournal(str(tmp_path / 'connections.bin'))
+        ei = EntityInfo(entity_id=42, listener_stream_sinks=8)
+        previous = ACMPListenerStateMachine(ei, [], journal=journal)
+        for listener_unique_id in range(8):
+            previous.connectListener(connect_tx_response(listener_unique_id, talker_unique_id=listener_unique_id))
+
+        # restart
+        intf = Interface("eth0")
+        intf.send_acmp = Mock()
+        alsm = ACMPListenerStateMachine(ei, [intf], journal=journal)
+
+        alsm.start()
+
+        # this is an antipattern, have to research time travel functionality in pytest
+        time.sleep(0.5)
+
+        # all streams are reconnecting in parallel
+        assert 8 == intf.send_acmp.call_count
+        assert 8 == len(alsm.inflight)
+        for listener_unique_id in range(8):
+            info = alsm.listenerStreamInfos[listener_unique_id]
+            assert info.pending_connection
+            assert listener_unique_id == info.talker_unique_id
+        command = intf.send_acmp.call_args[0][0]
+        assert at.JDKSAVDECC_ACMP_MESSAGE_TYPE_CONNECT_TX_COMMAND == intf.send_acmp.call_args[0][1]
+        assert command.flags & at.JDKSAVDECC_ACMP_FLAG_FAST_CONNECT
+
+        # the talker answers with the sequence_id of each command
+        for call in list(intf.send_acmp.call_args_list):
+            command = call[0][0]
+            response = connect_tx_response(command.listener_unique_id, talker_unique_id=command.talker_unique_id)
+            response.sequence_id = command.sequence_id
+            alsm.acmp_cb(response)
+
+        # this is an antipattern, have to research time travel functionality in pytest
+        time.sleep(0.5)
+
+        alsm.performTerminate()
+
+        assert not alsm.inflight
+        assert all(info.connected and not info.pending_connection for info in alsm.listenerStreamInfos)
+        assert 8 == len(journal.load())
@@ -0,0 +1,135 @@
+import pytest
+from unittest.mock import Mock
+from threading import Thread, Lock
+from queue import Queue, Empty
+import concurrent.futures
+
+from atdecc.adp import EntityInfo
+from atdecc.acmp import ConnectionSnapshot
+import atdecc.atdecc_api as at
+from atdecc.util import *
+
+
+class SimulatedController:
+    """
+    Answers getRxState from a separate thread for the connections {(listener_entity_id, listener_unique_id): (talker_entity_id, talker_unique_id)}
+    """
+
+    def __init__(self, connections, failing=()):
+        self.connections = connections
+        self.failing = set(failing)
+        self.commands = Queue()
+        self.lock = Lock()
+        self.polled = []
+        self.outstanding = {} # listener_entity_id -> outstanding commands
+        self.maxOutstanding = 0
+        self.maxPerEntity = 0
+        self.thread = Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def getRxState(self, listener_entity_id, listener_unique_id):
+        future = concurrent.futures.Future()
+        with self.lock:
+            self.polled.append((listener_entity_id, listener_unique_id))
+            self.outstanding[listener_entity_id] = self.outstanding.get(listener_entity_id, 0)+1
+            self.maxPerEntity = max(self.maxPerEntity, self.outstanding[listener_entity_id])
+            self.maxOutstanding = max(self.maxOutstanding, sum(self.outstanding.values()))
+        self.commands.put((listener_entity_id, listener_unique_id, future))
+        return future
+
+    def run(self):
+        while True:
+            listener_entity_id, listener_unique_id, future = self.commands.get()
+            with self.lock:
+                self.outstanding[listener_entity_id] -= 1
+            if (listener_entity_id, listener_unique_id) in self.failing:
+                future.set_exception(TimeoutError())
+                continue
+            response = at.struct_jdksavdecc_acmpdu(
+                listener_entity_id=uint64_to_eui64(listener_entity_id),
+                listener_unique_id=listener_unique_id,
+            )
+            response.header.message_type = at.JDKSAVDECC_ACMP_MESSAGE_TYPE_GET_RX_STATE_RESPONSE
+            response.header.status = at.JDKSAVDECC_ACMP_STATUS_SUCCESS
+            talker = self.connections.get((listener_entity_id, listener_unique_id))
+            if talker is not None:
+                response.talker_entity_id = uint64_to_eui64(talker[0])
+                response.talker_unique_id = talker[1]
+                response.connection_count = 1
+            future.set_result(response)
+
+
+def discovery(*entity_infos):
+    discovery = Mock()
+    discovery.entities = {entity_info.entity_id: (entity_info, 0) for entity_info in entity_infos}
+    return discovery
+
+
+class TestConnectionSnapshot:
+
+    def test_snapshot_connections(self):
+        listeners = [EntityInfo(entity_id=100+i, listener_stream_sinks=16) for i in range(8)]
+        talker = EntityInfo(entity_id=50, talker_stream_sources=8)
+        connections = {(100+i, i): (50, i) for i in range(8)}
+        controller = SimulatedController(connections)
+        snapshot = ConnectionSnapshot(controller, discovery(talker, *listeners), window=8, perEntity=2)
+
+        matrix = snapshot.snapshot_connections()
+
+        # every sink of every listener, none of the talker
+        assert len(matrix) == 8*16
+        assert len(controller.polled) == 8*16
+        assert {key: value for key, value in matrix.items() if value is not None} == connections
+        assert controller.maxOutstanding <= 8
+        assert controller.maxPerEntity <= 2
+
+    def test_incremental(self):
+        listeners = [EntityInfo(entity_id=100+i, listener_stream_sinks=4) for i in range(4)]
+        connections = {}
+        controller = SimulatedController(connections)
+        snapshot = ConnectionSnapshot(controller, discovery(*listeners))
+
+        matrix = snapshot.snapshot_connections()
+        assert len(controller.polled) == 16
+        assert all(value is None for value in matrix.values())
+
+        # nothing changed
+        controller.polled.clear()
+        assert snapshot.snapshot_connections() == matrix
+        assert controller.polled == []
+
+        # only the entity with a new available_index is polled again
+        connections[(101, 2)] = (50, 3)
+        listeners[1].available_index += 1
+        matrix = snapshot.snapshot_connections()
+        assert sorted(controller.polled) == [(101, i) for i in range(4)]
+        assert matrix[(101, 2)] == (50, 3)
+        assert len(matrix) == 16
+
+        # polling a subset
+        controller.polled.clear()
+        listeners[2].available_index += 1
+        listeners[3].available_index += 1
+        snapshot.snapshot_connections([102])
+        assert sorted(controller.polled) == [(102, i) for i in range(4)]
+
+    def test_departed_and_failed(self):
+        listeners = [EntityInfo(entity_id=100+i, listener_stream_sinks=2) for i in range(2)]
+        controller = SimulatedController({}, failing=[(101, 1)])
+        snapshot = ConnectionSnapshot(controller, discovery(*listeners))
+
+        matrix = snapshot.snapshot_connections()
+        # the failed sink is missing
+        assert sorted(matrix) == [(100, 0), (100, 1), (101, 0)]
+
+        # the entity with a failed sink is polled again
+        controller.polled.clear()
+        controller.failing.clear()
+        matrix = snapshot.snapshot_connections()
+        assert sorted(controller.polled) == [(101, 0), (101, 1)]
+        assert sorted(matrix) == [(100, 0), (100, 1), (101, 0), (101, 1)]
+
+        # departed entities are removed from the matrix
+        del snapshot.discovery.entities[100]
+        matrix = snapshot.snapshot_connections()
+        assert sorted(matrix) == [(101, 0), (101, 1)]
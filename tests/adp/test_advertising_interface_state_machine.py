@@ -3,6 +3,8 @@ from unittest.mock import patch, Mock
 import time
 
 from atdecc.adp import EntityInfo, InterfaceStateMachine
+from atdecc.aecp import CounterBlocks
+from atdecc.aecp.counters import *
 from atdecc.util import *
 
 class TestAdvertisingInterfaceStateMachine:
@@ -40,3 +42,111 @@ class TestAdvertisingInterfaceStateMachine:
         assert not aism.doAdvertise
 
         aism.performTerminate()
+
+    def test_coalesce_advertise(self):
+        ei = EntityInfo(entity_id=42, entity_model_id=0)
+        aism = InterfaceStateMachine(ei, [], randomDeviceDelay=lambda: 100)
+        aism.lastLinkIsUp = True # to avoid advertising when link goes up
+        aism.advertisedConfigurationIndex = 0 # to avoid advertising when config changes
+        aism.txEntityAvailable = Mock()
+
+        aism.start()
+
+        for i in range(10):
+            aism.performAdvertise(randomDelay=True)
+
+        # this is an antipattern, have to research time travel functionality in pytest
+        time.sleep(0.5)
+
+        aism.txEntityAvailable.assert_called_once()
+        assert aism.advertisesRequested == 10
+        assert aism.advertisesSent == 1
+
+        aism.performTerminate()
+        aism.join()
+
+    def test_min_advertise_interval(self):
+        ei = EntityInfo(entity_id=42, entity_model_id=0)
+        aism = InterfaceStateMachine(ei, [], minAdvertiseInterval=0.5)
+        aism.lastLinkIsUp = True # to avoid advertising when link goes up
+        aism.advertisedConfigurationIndex = 0 # to avoid advertising when config changes
+        aism.txEntityAvailable = Mock()
+
+        aism.start()
+
+        aism.performAdvertise()
+        time.sleep(0.1)
+        assert aism.txEntityAvailable.call_count == 1
+
+        aism.performAdvertise()
+        time.sleep(0.1)
+        assert aism.txEntityAvailable.call_count == 1
+
+        # this is an antipattern, have to research time travel functionality in pytest
+        time.sleep(0.5)
+        assert aism.txEntityAvailable.call_count == 2
+        assert aism.advertisesSent == 2
+
+        aism.performTerminate()
+        aism.join()
+
+    def test_startup_advertise(self):
+        # link up and configuration change at startup result in a single advertisement
+        ei = EntityInfo(entity_id=42, entity_model_id=0)
+        aism = InterfaceStateMachine(ei, [])
+        aism.txEntityAvailable = Mock()
+
+        aism.start()
+        aism.event.set()
+
+        # this is an antipattern, have to research time travel functionality in pytest
+        time.sleep(0.5)
+
+        aism.txEntityAvailable.assert_called_once()
+        assert not aism.doAdvertise
+
+        aism.performTerminate()
+        aism.join()
+
+    def test_configuration_change(self):
+        ei = EntityInfo(entity_id=42, entity_model_id=0)
+        aism = InterfaceStateMachine(ei, [])
+        aism.lastLinkIsUp = True # to avoid advertising when link goes up
+        aism.advertisedConfigurationIndex = 0 # to avoid advertising at startup
+        aism.txEntityAvailable = Mock()
+
+        aism.start()
+
+        aism.setConfigurationIndex(1)
+
+        # this is an antipattern, have to research time travel functionality in pytest
+        time.sleep(0.5)
+
+        aism.txEntityAvailable.assert_called_once()
+        assert 1 == ei.current_configuration_index
+        assert 1 == aism.advertisedConfigurationIndex
+
+        aism.performTerminate()
+        aism.join()
+
+    def test_counters(self):
+        ei = EntityInfo(entity_id=42, entity_model_id=0)
+        aism = InterfaceStateMachine(ei, [])
+        counters = CounterBlocks({at.JDKSAVDECC_DESCRIPTOR_AVB_INTERFACE: 1})
+        aism.attachCounters(counters)
+
+        # link changes, repeated states are not counted
+        aism.setLinkState(False)
+        aism.setLinkState(False)
+        aism.setLinkState(True)
+        # the first grandmaster is not a change
+        aism.setGrandmasterID(100)
+        aism.setGrandmasterID(100)
+        aism.setGrandmasterID(101)
+
+        counters_valid, block = counters.snapshot(at.JDKSAVDECC_DESCRIPTOR_AVB_INTERFACE, 0)
+        block = struct.unpack("!32L", block)
+        assert 1 == block[AVB_INTERFACE_LINK_UP]
+        assert 1 == block[AVB_INTERFACE_LINK_DOWN]
+        assert 1 == block[AVB_INTERFACE_GPTP_GM_CHANGED]
+        assert counters_valid == (1 << AVB_INTERFACE_LINK_UP) | (1 << AVB_INTERFACE_LINK_DOWN) | (1 << AVB_INTERFACE_GPTP_GM_CHANGED)
@@ -152,3 +152,37 @@ class TestDiscoveryInterfaceStateMachine:
         dism.performAdvertise.assert_called()
 
         dism.performTerminate()
+
+    def test_discover_burst(self):
+        ei = EntityInfo(entity_id=42, entity_model_id=0)
+        dism = InterfaceStateMachine(ei, [])
+        dism.lastLinkIsUp = True # to avoid advertising when link goes up
+        dism.advertisedConfigurationIndex = 0 # to avoid advertising when config changes
+        dism.performAdvertise = Mock()
+
+        # queued before the thread runs, as under sustained traffic
+        for i in range(100):
+            dism.adp_cb(
+                at.struct_jdksavdecc_adpdu(
+                    header = at.struct_jdksavdecc_adpdu_common_control_header(
+                        message_type=at.JDKSAVDECC_ADP_MESSAGE_TYPE_ENTITY_DISCOVER,
+                        valid_time=31,
+                        entity_id=uint64_to_eui64((0, 42, 41)[i%3]),
+                    )
+                )
+            )
+
+        # discovers for other entities are not queued
+        assert dism.rcvdDiscover.qsize() == 67
+        assert dism.rcvdDiscoverHighWater == 67
+
+        dism.start()
+
+        # this is an antipattern, have to research time travel functionality in pytest
+        time.sleep(0.5)
+
+        dism.performAdvertise.assert_called_once()
+        assert dism.rcvdDiscover.empty()
+
+        dism.performTerminate()
+        dism.join()
@@ -1,8 +1,11 @@
 import pytest
 from unittest.mock import patch, Mock
 import time
+from threading import Thread
 
-from atdecc.adp import EntityInfo, DiscoveryStateMachine, GlobalStateMachine
+from queue import Empty
+
+from atdecc.adp import EntityInfo, DiscoveryStateMachine, GlobalStateMachine, DiscoveryEvent
 from atdecc.util import *
 
 class TestDiscoveryStateMachine:
@@ -165,3 +168,198 @@ class TestDiscoveryStateMachine:
         dsm.removeEntity.assert_called()
         dsm.performTerminate()
         dsm.join()
+
+    def test_subscribe_events(self):
+        dsm = DiscoveryStateMachine([])
+        sub = dsm.subscribe()
+
+        ei = EntityInfo(entity_id=42)
+        dsm.addEntity(ei)
+        assert sub.get_nowait() == (DiscoveryEvent.ADDED, ei)
+
+        # a plain re-advertisement is not an update
+        ei2 = EntityInfo(entity_id=42)
+        ei2.available_index = 1
+        dsm.updateEntity(ei2)
+        with pytest.raises(Empty):
+            sub.get_nowait()
+
+        ei3 = EntityInfo(entity_id=42, current_configuration_index=1)
+        ei3.available_index = 2
+        dsm.updateEntity(ei3)
+        assert sub.get_nowait() == (DiscoveryEvent.UPDATED, ei3)
+
+        dsm.removeEntity(uint64_to_eui64(42))
+        assert sub.get_nowait() == (DiscoveryEvent.REMOVED, ei3)
+
+        dsm.unsubscribe(sub)
+        dsm.addEntity(ei)
+        assert sub.qsize() == 0
+
+    def test_subscribe_existing_entities(self):
+        dsm = DiscoveryStateMachine([])
+        ei = EntityInfo(entity_id=42)
+        dsm.entities = {
+            42: (ei, ei.valid_time)
+        }
+
+        sub = dsm.subscribe()
+        assert sub.get_nowait() == (DiscoveryEvent.ADDED, ei)
+
+    def test_subscribe_filter(self):
+        dsm = DiscoveryStateMachine([])
+        by_id = dsm.subscribe(entity_ids=[1])
+        by_caps = dsm.subscribe(capabilities=0x8)
+        by_model = dsm.subscribe(entity_model_id=7)
+
+        dsm.addEntity(EntityInfo(entity_id=1))
+        dsm.addEntity(EntityInfo(entity_id=2, entity_capabilities=0x18))
+        dsm.addEntity(EntityInfo(entity_id=3, entity_model_id=7, entity_capabilities=0x10))
+
+        assert [ei.entity_id for _, ei in [by_id.get_nowait()]] == [1]
+        assert by_id.qsize() == 0
+        assert by_caps.get_nowait()[1].entity_id == 2
+        assert by_caps.qsize() == 0
+        assert by_model.get_nowait()[1].entity_id == 3
+        assert by_model.qsize() == 0
+
+    def test_subscribe_coalescing(self):
+        dsm = DiscoveryStateMachine([])
+        sub = dsm.subscribe()
+
+        # ADDED followed by UPDATED is still ADDED, with the latest info
+        dsm.addEntity(EntityInfo(entity_id=1))
+        ei = EntityInfo(entity_id=1, entity_model_id=1)
+        dsm.updateEntity(ei)
+        assert sub.qsize() == 1
+        assert sub.get_nowait() == (DiscoveryEvent.ADDED, ei)
+
+        # ADDED followed by REMOVED is never seen
+        dsm.addEntity(EntityInfo(entity_id=2))
+        dsm.removeEntity(uint64_to_eui64(2))
+        assert sub.qsize() == 0
+
+        # REMOVED followed by ADDED is an UPDATED
+        dsm.removeEntity(uint64_to_eui64(1))
+        dsm.addEntity(ei)
+        assert sub.get_nowait() == (DiscoveryEvent.UPDATED, ei)
+
+    def test_subscribe_overflow(self):
+        dsm = DiscoveryStateMachine([])
+        sub = dsm.subscribe(maxsize=2)
+
+        for i in range(1, 5):
+            dsm.addEntity(EntityInfo(entity_id=i))
+
+        assert sub.qsize() == 2
+        assert sub.dropped == 2
+        assert sub.resync
+        assert sub.get_nowait()[1].entity_id == 3
+        assert sub.get_nowait()[1].entity_id == 4
+
+    def test_subscribe_overflow_keeps_removed(self):
+        dsm = DiscoveryStateMachine([])
+        for i in range(1, 3):
+            dsm.addEntity(EntityInfo(entity_id=i))
+        sub = dsm.subscribe(maxsize=2)
+        sub.get_nowait()
+        sub.get_nowait()
+
+        dsm.removeEntity(uint64_to_eui64(2))
+        dsm.addEntity(EntityInfo(entity_id=3))
+        dsm.addEntity(EntityInfo(entity_id=4))
+
+        events = []
+        while sub.qsize():
+            event, entity_info = sub.get_nowait()
+            events.append((event, entity_info.entity_id))
+        assert (DiscoveryEvent.REMOVED, 2) in events
+        assert sub.resync
+
+    def test_subscribe_timeout_removal(self):
+        dsm = DiscoveryStateMachine([])
+        ei = EntityInfo(entity_id=42)
+        dsm.entities = {
+            42: (ei, 0)
+        }
+        sub = dsm.subscribe()
+        sub.get_nowait()
+
+        dsm.start()
+        event, entity_info = sub.get(timeout=2)
+        dsm.performTerminate()
+        dsm.join()
+
+        assert event == DiscoveryEvent.REMOVED
+        assert entity_info == ei
+        assert dsm.entities == {}
+
+    def test_subscribe_concurrent(self):
+        # events racing with subscribe are neither lost nor duplicated
+        dsm = DiscoveryStateMachine([])
+
+        def churn():
+            for i in range(1, 2001):
+                dsm.addEntity(EntityInfo(entity_id=i))
+
+        t = Thread(target=churn)
+        t.start()
+        sub = dsm.subscribe(maxsize=10000)
+        t.join()
+
+        seen = set()
+        while sub.qsize():
+            event, entity_info = sub.get_nowait()
+            assert event == DiscoveryEvent.ADDED
+            seen.add(entity_info.entity_id)
+        assert seen == set(dsm.entities)
+
+    def test_initial_discover(self):
+        # a discover requested before start is sent right away
+        dsm = DiscoveryStateMachine([])
+        dsm.txDiscover = Mock()
+        dsm.performDiscover()
+
+        dsm.start()
+        time.sleep(0.1)
+
+        dsm.txDiscover.assert_called_once_with(0)
+
+        dsm.performTerminate()
+        dsm.join()
+
+    def test_tx_discover(self):
+        intf = Mock()
+        dsm = DiscoveryStateMachine([intf])
+        dsm.txDiscover(42)
+
+        msg, target = intf.send_adp.call_args[0]
+        assert msg == at.JDKSAVDECC_ADP_MESSAGE_TYPE_ENTITY_DISCOVER
+        assert target.entity_id == 42
+        adpdu = target.get_adpdu()
+        assert adpdu.header.valid_time == 0
+        assert adpdu.available_index == 0
+        assert adpdu.entity_capabilities == 0
+
+
+    def test_subscribe_overflow_bounded(self):
+        dsm = DiscoveryStateMachine([])
+        for i in range(1, 5):
+            dsm.addEntity(EntityInfo(entity_id=i))
+        sub = dsm.subscribe(maxsize=2)
+        sub.get_nowait()
+        sub.get_nowait()
+
+        for i in range(1, 5):
+            dsm.removeEntity(uint64_to_eui64(i))
+
+        assert sub.qsize() == 2
+        assert sub.resync
+
+    def test_update_unknown_entity(self):
+        dsm = DiscoveryStateMachine([])
+        sub = dsm.subscribe()
+        ei = EntityInfo(entity_id=42)
+
+        dsm.updateEntity(ei)
+        assert sub.get_nowait() == (DiscoveryEvent.ADDED, ei)
@@ -0,0 +1,167 @@
+import pytest
+from unittest.mock import Mock
+import time
+
+from atdecc.adp import EntityInfo, EntityCache, DiscoveryStateMachine, DiscoveryEvent
+from atdecc.util import *
+
+class TestEntityCache:
+
+    def test_save_load(self, tmp_path):
+        cache = EntityCache(str(tmp_path / 'entities.bin'))
+        entities = [EntityInfo(entity_id=i, entity_model_id=3, listener_stream_sinks=2) for i in range(1, 4)]
+        entities[0].available_index = 9
+
+        cache.save(entities)
+        loaded = cache.load()
+
+        assert [vars(ei) for ei in loaded] == [vars(ei) for ei in entities]
+        assert not (tmp_path / 'entities.bin.tmp').exists()
+
+    def test_load_missing(self, tmp_path):
+        cache = EntityCache(str(tmp_path / 'entities.bin'))
+        assert cache.load() == []
+
+    def test_load_invalid(self, tmp_path):
+        path = tmp_path / 'entities.bin'
+        path.write_bytes(b'garbage')
+        assert EntityCache(str(path)).load() == []
+
+    def test_load_outdated(self, tmp_path):
+        cache = EntityCache(str(tmp_path / 'entities.bin'), max_age=60)
+        cache.save([EntityInfo(entity_id=1)], now=time.time()-61)
+        assert cache.load() == []
+
+    def test_warm_start(self, tmp_path):
+        cache = EntityCache(str(tmp_path / 'entities.bin'))
+        cache.save([EntityInfo(entity_id=i) for i in range(1, 41)])
+
+        dsm = DiscoveryStateMachine([], cache=cache, discoverBatch=16)
+        dsm.txDiscover = Mock()
+        sub = dsm.subscribe()
+
+        dsm.loadCache()
+        assert len(dsm.entities) == 40
+        assert sub.qsize() == 40
+        assert not dsm.isConfirmed(1)
+
+        # rate limited batches
+        dsm.txPendingDiscovers(ct=0)
+        assert dsm.txDiscover.call_count == 16
+        dsm.txPendingDiscovers(ct=0)
+        assert dsm.txDiscover.call_count == 16
+        dsm.txPendingDiscovers(ct=1)
+        assert dsm.txDiscover.call_count == 32
+
+    def test_confirm_and_expire(self, tmp_path):
+        cache = EntityCache(str(tmp_path / 'entities.bin'))
+        # confirm deadline is valid_time/5 + confirmTimeout = 0.9 s after the discover
+        cache.save([EntityInfo(entity_id=1, valid_time=2), EntityInfo(entity_id=2, valid_time=2)])
+
+        dsm = DiscoveryStateMachine([], cache=cache, confirmTimeout=0.5, discoverInterval=0.01)
+        dsm.txDiscover = Mock()
+        sub = dsm.subscribe()
+        dsm.start()
+
+        dsm.rcvdADP.put((at.JDKSAVDECC_ADP_MESSAGE_TYPE_ENTITY_AVAILABLE, EntityInfo(entity_id=1)))
+        dsm.event.set()
+
+        # this is an antipattern, have to research time travel functionality in pytest
+        time.sleep(1.5)
+        dsm.performTerminate()
+        dsm.join()
+
+        assert dsm.isConfirmed(1)
+        assert not dsm.haveEntity(2)
+        assert dsm.txDiscover.call_count == 2
+
+        # the unconsumed ADDED of the expired entity has been coalesced away
+        assert sub.qsize() == 1
+        event, entity_info = sub.get_nowait()
+        assert event == DiscoveryEvent.ADDED
+        assert entity_info.entity_id == 1
+
+        # written on termination
+        assert [ei.entity_id for ei in cache.load()] == [1]
+
+    def test_confirm_deadline_starts_with_discover(self, tmp_path):
+        cache = EntityCache(str(tmp_path / 'entities.bin'))
+        cache.save([EntityInfo(entity_id=i) for i in range(1, 1001)])
+
+        dsm = DiscoveryStateMachine([], cache=cache, confirmTimeout=2, discoverBatch=16, discoverInterval=0.05)
+        dsm.txDiscover = Mock()
+        dsm.loadCache()
+
+        ct = 0
+        while dsm.pendingDiscovers:
+            dsm.txPendingDiscovers(ct)
+            ct += 0.05
+
+        assert dsm.txDiscover.call_count == 1000
+        # the last batch has just been sent and has not expired yet
+        _, timeout = dsm.entities[1000]
+        assert timeout > ct
+
+    def test_unwritable_cache(self, tmp_path):
+        for path in (tmp_path / 'missing' / 'entities.bin', tmp_path):
+            cache = EntityCache(str(path))
+            assert cache.load() == []
+
+            dsm = DiscoveryStateMachine([], cache=cache)
+            dsm.start()
+            dsm.rcvdADP.put((at.JDKSAVDECC_ADP_MESSAGE_TYPE_ENTITY_AVAILABLE, EntityInfo(entity_id=1)))
+            dsm.event.set()
+
+            # this is an antipattern, have to research time travel functionality in pytest
+            time.sleep(0.2)
+
+            assert dsm.is_alive()
+            assert dsm.cache is None
+            assert dsm.haveEntity(1)
+            dsm.performTerminate()
+            dsm.join()
+
+    def test_write_only_when_changed(self, tmp_path):
+        cache = EntityCache(str(tmp_path / 'entities.bin'))
+        cache.save([EntityInfo(entity_id=1)])
+        cache.save = Mock()
+
+        dsm = DiscoveryStateMachine([], cache=cache)
+        dsm.loadCache()
+        dsm.saveCache()
+        cache.save.assert_not_called()
+
+        dsm.addEntity(EntityInfo(entity_id=2))
+        dsm.saveCache()
+        dsm.saveCache()
+        cache.save.assert_called_once()
+
+    def test_confirm_deadline_covers_random_delay(self, tmp_path):
+        cache = EntityCache(str(tmp_path / 'entities.bin'))
+        cache.save([EntityInfo(entity_id=1, valid_time=62)])
+
+        dsm = DiscoveryStateMachine([], cache=cache, confirmTimeout=1)
+        dsm.txDiscover = Mock()
+        dsm.loadCache()
+        dsm.txPendingDiscovers(ct=0)
+
+        _, timeout = dsm.entities[1]
+        assert timeout == pytest.approx(62/5.+1)
+
+    def test_confirm_publishes_update(self, tmp_path):
+        cache = EntityCache(str(tmp_path / 'entities.bin'))
+        cache.save([EntityInfo(entity_id=1)])
+
+        dsm = DiscoveryStateMachine([], cache=cache)
+        sub = dsm.subscribe()
+        dsm.loadCache()
+        assert sub.get_nowait()[0] == DiscoveryEvent.ADDED
+
+        ei = EntityInfo(entity_id=1)
+        dsm.rcvdEntityInfo = ei
+        dsm.rcvdAvailable = True
+        dsm._handleRcvdEntityInfo(ct=0)
+
+        assert sub.get_nowait() == (DiscoveryEvent.UPDATED, ei)
+        assert dsm.isConfirmed(1)
+
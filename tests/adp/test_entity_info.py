@@ -14,3 +14,11 @@ class TestEntityInfo:
 
         entity = EntityInfo(valid_time=TOO_LONG_TIME)
         assert entity.get_adpdu().header.valid_time == VALID_TIME_MAX // 2
+
+    def test_from_adpdu(self):
+        entity = EntityInfo(valid_time=10, entity_id=42, entity_model_id=3, 
+                            listener_stream_sinks=2, gptp_grandmaster_id=7, current_configuration_index=1)
+        entity.available_index = 5
+
+        other = EntityInfo.from_adpdu(entity.get_adpdu())
+        assert vars(other) == vars(entity)
@@ -0,0 +1,156 @@
+import pytest
+from unittest.mock import Mock, patch
+import os
+import errno
+import socket
+import struct
+import time
+from threading import Thread
+
+from atdecc.adp import EntityInfo, InterfaceStateMachine
+from atdecc.link import *
+
+pytestmark = pytest.mark.skipif(not hasattr(socket, 'AF_NETLINK'), reason="rtnetlink is Linux only")
+
+
+def link_message(ifname, flags, msg_type=RTM_NEWLINK, operstate=None):
+    """
+    Build an rtnetlink link message as sent by the kernel
+    """
+    name = ifname.encode()+b'\0'
+    attrs = struct.pack('=HH', rtattr.size+len(name), IFLA_IFNAME)+name
+    attrs += b'\0'*((-len(attrs)) % 4)
+    if operstate is not None:
+        attrs += struct.pack('=HHBxxx', rtattr.size+1, IFLA_OPERSTATE, operstate)
+    body = ifinfomsg.pack(socket.AF_UNSPEC, 1, 2, flags, 0)+attrs
+    return nlmsghdr.pack(nlmsghdr.size+len(body), msg_type, 0, 0, 0)+body
+
+
+class TestLinkMonitor:
+
+    def test_parse(self):
+        data = link_message('eth0', IFF_UP | IFF_RUNNING, operstate=IF_OPER_UP) + \
+               link_message('eth1', IFF_UP) + \
+               link_message('eth0', IFF_UP | IFF_RUNNING, operstate=2) + \
+               link_message('eth2', IFF_UP | IFF_RUNNING, msg_type=RTM_DELLINK)
+        assert list(parse_link_messages(data)) == [
+            ('eth0', True), 
+            ('eth1', False), 
+            ('eth0', False), 
+            ('eth2', False),
+        ]
+
+    def test_link_state(self):
+        # fake netlink source
+        kernel, sock = socket.socketpair(socket.AF_UNIX, socket.SOCK_DGRAM)
+
+        ei = EntityInfo(entity_id=42, entity_model_id=0)
+        ism = InterfaceStateMachine(ei, [])
+        ism.linkIsUp = False
+        ism.lastLinkIsUp = False
+        ism.advertisedConfigurationIndex = 0 # to avoid advertising when config changes
+        ism.performAdvertise = Mock()
+
+        monitor = LinkMonitor('eth0', ism.setLinkState, sock=sock)
+        monitor.start()
+        ism.start()
+
+        kernel.send(link_message('eth1', IFF_UP | IFF_RUNNING))
+        kernel.send(link_message('eth0', IFF_UP | IFF_RUNNING))
+
+        # this is an antipattern, have to research time travel functionality in pytest
+        time.sleep(0.2)
+
+        assert ism.linkIsUp
+        assert ism.lastLinkIsUp
+        ism.performAdvertise.assert_called_once()
+
+        kernel.send(link_message('eth0', IFF_UP))
+        time.sleep(0.2)
+
+        assert not ism.linkIsUp
+        ism.performAdvertise.assert_called_once()
+
+        monitor.performTerminate()
+        monitor.join(1)
+        assert not monitor.is_alive()
+
+        ism.performTerminate()
+        ism.join()
+        kernel.close()
+        sock.close()
+
+    def test_terminate_after_end(self):
+        kernel, sock = socket.socketpair(socket.AF_UNIX, socket.SOCK_STREAM)
+        monitor = LinkMonitor('eth0', Mock(), sock=sock)
+        monitor.start()
+
+        # source closed, the thread ends by itself
+        kernel.close()
+        monitor.join(1)
+        assert not monitor.is_alive()
+
+        monitor.performTerminate()
+        sock.close()
+
+    def test_resync_on_overrun(self):
+        sock = Mock()
+        sock.recv.side_effect = [OSError(errno.ENOBUFS, "No buffer space available"), b'']
+        monitor = LinkMonitor('eth0', Mock(), sock=sock)
+        monitor.ownSocket = True
+        monitor.requestLinks = Mock()
+
+        with patch('atdecc.link.select.select', return_value=([sock], [], [])):
+            monitor.run()
+
+        # once at start, once after the overrun
+        assert monitor.requestLinks.call_count == 2
+
+
+class TestGrandmasterMonitor:
+
+    def test_ptp_management(self, tmp_path):
+        # ptp4l stand-in
+        server_path = str(tmp_path / 'ptp4l')
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        server.bind(server_path)
+        client = PtpManagementClient(server_path, local=str(tmp_path / 'pmc'))
+
+        def serve():
+            request, addr = server.recvfrom(1024)
+            response = bytearray(request)
+            response[PtpManagementClient.header.size+12] = PtpManagementClient.ACTION_RESPONSE
+            data = bytearray(32)
+            data[PtpManagementClient.GM_OFFSET:PtpManagementClient.GM_OFFSET+8] = (0x0011223344556677).to_bytes(8, 'big')
+            server.sendto(bytes(response)+bytes(data), addr)
+
+        t = Thread(target=serve)
+        t.start()
+        assert client() == 0x0011223344556677
+        t.join()
+        server.close()
+
+    def test_ptp_management_unavailable(self, tmp_path):
+        client = PtpManagementClient(str(tmp_path / 'ptp4l'), local=str(tmp_path / 'pmc'))
+        assert client() is None
+
+    def test_grandmaster_change(self):
+        ei = EntityInfo(entity_id=42, entity_model_id=0)
+        ism = InterfaceStateMachine(ei, [])
+        ism.currentGrandmasterID = 0
+        ism.advertisedGrandmasterID = 0
+
+        ids = iter([None, 1, 1, 2])
+        monitor = GrandmasterMonitor(lambda: next(ids, 2), ism.setGrandmasterID, interval=0.01)
+        ism.setGrandmasterID = Mock(wraps=ism.setGrandmasterID)
+        monitor.callback = ism.setGrandmasterID
+        monitor.start()
+
+        # this is an antipattern, have to research time travel functionality in pytest
+        time.sleep(0.2)
+        monitor.performTerminate()
+        monitor.join()
+
+        assert [c[0][0] for c in ism.setGrandmasterID.call_args_list] == [1, 2]
+        assert ism.currentGrandmasterID == 2
+        assert ei.gptp_grandmaster_id == 2
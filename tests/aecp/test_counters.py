@@ -0,0 +1,83 @@
+import pytest
+import struct
+import time
+
+from atdecc.aecp import CounterBlocks
+from atdecc.aecp.counters import *
+import atdecc.atdecc_api as at
+
+
+class TestCounterBlocks:
+
+    def test_blocks(self):
+        counters = CounterBlocks({
+            at.JDKSAVDECC_DESCRIPTOR_ENTITY: 1,
+            at.JDKSAVDECC_DESCRIPTOR_AVB_INTERFACE: 2,
+            at.JDKSAVDECC_DESCRIPTOR_STREAM_INPUT: 4,
+            # no counters
+            at.JDKSAVDECC_DESCRIPTOR_CLOCK_SOURCE: 1,
+        })
+
+        assert len(counters.array) == 7*32
+        assert (at.JDKSAVDECC_DESCRIPTOR_AVB_INTERFACE, 1) in counters
+        assert (at.JDKSAVDECC_DESCRIPTOR_AVB_INTERFACE, 2) not in counters
+        assert (at.JDKSAVDECC_DESCRIPTOR_CLOCK_SOURCE, 0) not in counters
+        assert counters.snapshot(at.JDKSAVDECC_DESCRIPTOR_CLOCK_SOURCE, 0) is None
+        with pytest.raises(KeyError):
+            counters.index(at.JDKSAVDECC_DESCRIPTOR_STREAM_INPUT, 4, STREAM_INPUT_FRAMES_RX)
+
+    def test_snapshot(self):
+        counters = CounterBlocks({at.JDKSAVDECC_DESCRIPTOR_AVB_INTERFACE: 2})
+
+        # nothing is counted yet
+        assert counters.snapshot(at.JDKSAVDECC_DESCRIPTOR_AVB_INTERFACE, 1) == (0, bytes(128))
+
+        link_up = counters.index(at.JDKSAVDECC_DESCRIPTOR_AVB_INTERFACE, 1, AVB_INTERFACE_LINK_UP)
+        frames_rx = counters.index(at.JDKSAVDECC_DESCRIPTOR_AVB_INTERFACE, 1, AVB_INTERFACE_FRAMES_RX)
+        counters.increment(link_up)
+        counters.array[frames_rx] += 0x01020304
+
+        counters_valid, block = counters.snapshot(at.JDKSAVDECC_DESCRIPTOR_AVB_INTERFACE, 1)
+        assert counters_valid == (1 << AVB_INTERFACE_LINK_UP) | (1 << AVB_INTERFACE_FRAMES_RX)
+        # network byte order
+        assert struct.unpack("!32L", block)[:4] == (1, 0, 0, 0x01020304)
+
+        # the other interface is untouched
+        assert counters.snapshot(at.JDKSAVDECC_DESCRIPTOR_AVB_INTERFACE, 0) == (0, bytes(128))
+
+        # a snapshot is a copy
+        counters.increment(link_up)
+        assert struct.unpack_from("!L", block)[0] == 1
+
+    def test_pointer(self):
+        counters = CounterBlocks({at.JDKSAVDECC_DESCRIPTOR_AVB_INTERFACE: 1})
+        frames_tx = counters.index(at.JDKSAVDECC_DESCRIPTOR_AVB_INTERFACE, 0, AVB_INTERFACE_FRAMES_TX)
+
+        # as the native side writes it
+        pointer = counters.pointer(frames_tx)
+        pointer[0] += 5
+
+        assert counters.array[frames_tx] == 5
+
+    ### benchmarks
+
+    def test_increment_benchmark(self):
+        counters = CounterBlocks({at.JDKSAVDECC_DESCRIPTOR_STREAM_INPUT: 64})
+        indices = [counters.index(at.JDKSAVDECC_DESCRIPTOR_STREAM_INPUT, i, STREAM_INPUT_FRAMES_RX) for i in range(64)]
+        array = counters.array
+
+        t0 = time.perf_counter()
+        for _ in range(1000):
+            for index in indices:
+                array[index] += 1
+        elapsed = time.perf_counter()-t0
+
+        t0 = time.perf_counter()
+        for _ in range(1000):
+            counters.snapshot(at.JDKSAVDECC_DESCRIPTOR_STREAM_INPUT, 63)
+        snapshotElapsed = time.perf_counter()-t0
+
+        assert counters.snapshot(at.JDKSAVDECC_DESCRIPTOR_STREAM_INPUT, 63)[1][44:48] == struct.pack("!L", 1000)
+        # 64000 increments, 1000 snapshots
+        assert elapsed < 1.
+        assert snapshotElapsed < 0.5
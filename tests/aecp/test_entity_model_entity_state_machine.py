@@ -1,10 +1,14 @@
 import pytest
 from unittest.mock import patch, Mock, ANY
 import time
+import copy
+from threading import Event
 import yaml
 
 from atdecc.adp import EntityInfo
-from atdecc.aecp import EntityModelEntityStateMachine
+from atdecc.aecp import EntityModelEntityStateMachine, OwnershipView
+from atdecc.aecp.counters import *
+from atdecc.aem import AEMDescriptorFactory
 from atdecc import Interface, jdksInterface
 import atdecc.atdecc_api as at
 from atdecc.util import *
@@ -129,6 +133,37 @@ class TestEntityModelEntityStateMachine:
         assert at.JDKSAVDECC_AEM_STATUS_SUCCESS == response.aecpdu_header.header.status
         assert 43 == emesm.owner_entity_id
 
+    def test_acquire_entity_publishes_ownership(self):
+        ei = EntityInfo(entity_id=42)
+        ownership = OwnershipView()
+        emesm = EntityModelEntityStateMachine(ei, [], "./tests/fixtures/config.yml", ownership=ownership)
+
+        def acquire(flags):
+            emesm.acquireEntity(at.struct_jdksavdecc_aecpdu_aem(
+                aecpdu_header=at.struct_jdksavdecc_aecpdu_common(
+                    header = at.struct_jdksavdecc_aecpdu_common_control_header(
+                        message_type=at.JDKSAVDECC_AECP_MESSAGE_TYPE_AEM_COMMAND,
+                        target_entity_id=uint64_to_eui64(42)
+                ),
+                    controller_entity_id=uint64_to_eui64(43),
+                    sequence_id=13
+                ),
+                command_type=at.JDKSAVDECC_AEM_COMMAND_ACQUIRE_ENTITY
+            ), struct.pack("!QQHH", flags, 43, at.JDKSAVDECC_DESCRIPTOR_ENTITY, 0))
+
+        assert not ownership.isAcquiredOrLockedByOther(44, at.JDKSAVDECC_DESCRIPTOR_STREAM_INPUT, 0)
+
+        acquire(0)
+
+        # acquiring the entity applies to all its stream inputs
+        assert ownership.isAcquiredOrLockedByOther(44, at.JDKSAVDECC_DESCRIPTOR_STREAM_INPUT, 0)
+        assert not ownership.isAcquiredOrLockedByOther(43, at.JDKSAVDECC_DESCRIPTOR_STREAM_INPUT, 0)
+
+        # RELEASE
+        acquire(0x8000000000)
+
+        assert not ownership.isAcquiredOrLockedByOther(44, at.JDKSAVDECC_DESCRIPTOR_STREAM_INPUT, 0)
+
     def test_lock_entity(self):
         ei = EntityInfo(entity_id=42)
         emesm = EntityModelEntityStateMachine(ei, [], "./tests/fixtures/config.yml")
@@ -360,33 +395,44 @@ class TestEntityModelEntityStateMachine:
     def test_unsolicited_response(self):
         ei = EntityInfo(entity_id=42)
         emesm = EntityModelEntityStateMachine(ei, [], "./tests/fixtures/config.yml")
-        
-        unsolicited = at.struct_jdksavdecc_aecpdu_aem(
-            header = at.struct_jdksavdecc_aecpdu_common_control_header(
-                message_type=at.JDKSAVDECC_AECP_MESSAGE_TYPE_AEM_COMMAND,
-                target_entity_id=uint64_to_eui64(42)
+        emesm.unsolicited_list = {44, 45}
+
+        sent = []
+        emesm.txResponse = Mock(side_effect=lambda response, payload=None: sent.append((
+            eui64_to_uint64(response.aecpdu_header.controller_entity_id),
+            response.aecpdu_header.sequence_id,
+            response.command_type,
+        )))
+
+        command = at.struct_jdksavdecc_aecpdu_aem(
+            aecpdu_header=at.struct_jdksavdecc_aecpdu_common(
+                header = at.struct_jdksavdecc_aecpdu_common_control_header(
+                    message_type=at.JDKSAVDECC_AECP_MESSAGE_TYPE_AEM_COMMAND,
+                    target_entity_id=uint64_to_eui64(42)
+                ),
+                controller_entity_id=uint64_to_eui64(43),
+                sequence_id=13
             ),
-            sequence_id=13,
             command_type=at.JDKSAVDECC_AEM_COMMAND_ACQUIRE_ENTITY
-            )
-
-        emesm.txResponse = Mock()
+        )
+        payload = struct.pack("!QQHH", 0, 0, at.JDKSAVDECC_DESCRIPTOR_ENTITY, 0)
 
         emesm.start()
+        try:
+            emesm.rcvdCommand.put((command, payload))
+            emesm.event.set()
 
-        emesm.unsolicited = unsolicited
-        emesm.unsolicitedSequenceID = 127
-
-        emesm.event.set()
-
-        # this is an antipattern, have to research time travel functionality in pytest
-        time.sleep(1)
+            # this is an antipattern, have to research time travel functionality in pytest
+            time.sleep(0.5)
+        finally:
+            emesm.performTerminate()
 
-        assert 128 == emesm.unsolicitedSequenceID
-        assert not emesm.unsolicited
-        emesm.txResponse.assert_called_with(unsolicited)
-
-        emesm.performTerminate()
+        # the response to the acquiring controller, then the notification of the registered ones
+        assert sent == [
+            (43, 13, at.JDKSAVDECC_AEM_COMMAND_ACQUIRE_ENTITY),
+            (44, 0, at.JDKSAVDECC_AEM_COMMAND_ACQUIRE_ENTITY | 0x8000),
+            (45, 0, at.JDKSAVDECC_AEM_COMMAND_ACQUIRE_ENTITY | 0x8000),
+        ]
 
 
     # RECEIVED_COMMAND
@@ -718,6 +764,120 @@ class TestEntityModelEntityStateMachine:
         assert at.JDKSAVDECC_AEM_STATUS_NOT_IMPLEMENTED == response.aecpdu_header.header.status
 
 
+    def test_audio_mappings_handlers(self, tmp_path):
+        config = yaml.safe_load(open("./tests/fixtures/config.yml", 'r'))
+        counts = config['AEMDescriptor_CONFIGURATION']['descriptor_counts']
+        counts[at.JDKSAVDECC_DESCRIPTOR_STREAM_PORT_INPUT] = 1
+        counts[at.JDKSAVDECC_DESCRIPTOR_AUDIO_CLUSTER] = 1
+        counts[at.JDKSAVDECC_DESCRIPTOR_AUDIO_MAP] = 1
+        config['AEMDescriptor_AUDIO_MAP']['number_of_mappings'] = 64
+        with open(tmp_path / "config.yml", 'w') as f:
+            yaml.safe_dump(config, f)
+
+        ei = EntityInfo(entity_id=42)
+        emesm = EntityModelEntityStateMachine(ei, [], str(tmp_path / "config.yml"))
+        port = (at.JDKSAVDECC_DESCRIPTOR_STREAM_PORT_INPUT, 0)
+
+        def get_audio_map(map_index):
+            response, resp_payload = emesm._handleGetAudioMap(self.aem_command(at.JDKSAVDECC_AEM_COMMAND_GET_AUDIO_MAP), struct.pack("!4H", *port, map_index, 0))
+            return response.aecpdu_header.header.status, struct.unpack_from("!6H", resp_payload), resp_payload[12:]
+
+        # 62+2 mappings
+        status, header, mappings = get_audio_map(1)
+        assert at.JDKSAVDECC_AEM_STATUS_SUCCESS == status
+        assert (*port, 1, 2, 2, 0) == header
+        assert list(struct.iter_unpack("!4H", mappings)) == [(0, 62, 0, 62), (0, 63, 0, 63)]
+
+        status, header, mappings = get_audio_map(2)
+        assert at.JDKSAVDECC_AEM_STATUS_BAD_ARGUMENTS == status
+        assert (*port, 2, 2, 0, 0) == header
+
+        # add to the last page, the response echoes the command
+        payload = struct.pack("!4H", *port, 2, 0)+struct.pack("!8H", 0, 64, 0, 64, 0, 65, 0, 65)
+        response, resp_payload = emesm._handleAddAudioMappings(self.aem_command(at.JDKSAVDECC_AEM_COMMAND_ADD_AUDIO_MAPPINGS), payload)
+        assert at.JDKSAVDECC_AEM_STATUS_SUCCESS == response.aecpdu_header.header.status
+        assert payload == resp_payload
+        assert (*port, 1, 2, 4, 0) == get_audio_map(1)[1]
+
+        payload = struct.pack("!4H", *port, 1, 0)+struct.pack("!4H", 0, 62, 0, 62)
+        response, resp_payload = emesm._handleRemoveAudioMappings(self.aem_command(at.JDKSAVDECC_AEM_COMMAND_REMOVE_AUDIO_MAPPINGS), payload)
+        assert at.JDKSAVDECC_AEM_STATUS_SUCCESS == response.aecpdu_header.header.status
+        status, header, mappings = get_audio_map(1)
+        assert (*port, 1, 2, 3, 0) == header
+        assert list(struct.iter_unpack("!4H", mappings)) == [(0, 63, 0, 63), (0, 64, 0, 64), (0, 65, 0, 65)]
+
+        # truncated mappings
+        payload = struct.pack("!4H", *port, 2, 0)+struct.pack("!4H", 0, 66, 0, 66)
+        response, resp_payload = emesm._handleAddAudioMappings(self.aem_command(at.JDKSAVDECC_AEM_COMMAND_ADD_AUDIO_MAPPINGS), payload)
+        assert at.JDKSAVDECC_AEM_STATUS_BAD_ARGUMENTS == response.aecpdu_header.header.status
+        assert 3 == get_audio_map(1)[1][4]
+
+        # unknown port
+        payload = struct.pack("!4H", at.JDKSAVDECC_DESCRIPTOR_STREAM_PORT_INPUT, 1, 0, 0)
+        response, resp_payload = emesm._handleAddAudioMappings(self.aem_command(at.JDKSAVDECC_AEM_COMMAND_ADD_AUDIO_MAPPINGS), payload)
+        assert at.JDKSAVDECC_AEM_STATUS_NO_SUCH_DESCRIPTOR == response.aecpdu_header.header.status
+
+
+    def test_configuration_handlers(self, tmp_path):
+        config = yaml.safe_load(open("./tests/fixtures/config.yml", 'r'))
+        config['configurations'] = [
+            {},
+            {'AEMDescriptor_CONFIGURATION': {'object_name': '64 in', 'descriptor_counts': {at.JDKSAVDECC_DESCRIPTOR_STREAM_INPUT: 8}}},
+        ]
+        with open(tmp_path / "config.yml", 'w') as f:
+            yaml.safe_dump(config, f)
+
+        ei = EntityInfo(entity_id=42)
+        emesm = EntityModelEntityStateMachine(ei, [], str(tmp_path / "config.yml"))
+        emesm.configurationChanged = Mock()
+        emesm.unsolicited_list = [43, 44]
+        models = list(emesm.entityModels)
+
+        def read_descriptor(configuration_index, descriptor_type, descriptor_index):
+            payload = struct.pack("!4H", configuration_index, 0, descriptor_type, descriptor_index)
+            response, resp_payload = emesm._handleReadDescriptor(self.aem_command(at.JDKSAVDECC_AEM_COMMAND_READ_DESCRIPTOR), payload)
+            return response.aecpdu_header.header.status, resp_payload
+
+        # descriptors of the other configuration can be read
+        assert at.JDKSAVDECC_AEM_STATUS_SUCCESS == read_descriptor(1, at.JDKSAVDECC_DESCRIPTOR_STREAM_INPUT, 7)[0]
+        assert at.JDKSAVDECC_AEM_STATUS_NO_SUCH_DESCRIPTOR == read_descriptor(0, at.JDKSAVDECC_DESCRIPTOR_STREAM_INPUT, 7)[0]
+        assert at.JDKSAVDECC_AEM_STATUS_NO_SUCH_DESCRIPTOR == read_descriptor(2, at.JDKSAVDECC_DESCRIPTOR_STREAM_INPUT, 0)[0]
+        status, resp_payload = read_descriptor(0, at.JDKSAVDECC_DESCRIPTOR_CONFIGURATION, 1)
+        assert resp_payload[4:] == models[1].get(1, at.JDKSAVDECC_DESCRIPTOR_CONFIGURATION, 1)
+
+        response, resp_payload = emesm._handleGetConfiguration(self.aem_command(at.JDKSAVDECC_AEM_COMMAND_GET_CONFIGURATION), bytes())
+        assert struct.pack("!2H", 0, 0) == resp_payload
+
+        # switched to the precompiled model, notified to ADP and the other controllers
+        payload = struct.pack("!2H", 0, 1)
+        response, resp_payload = emesm._handleSetConfiguration(self.aem_command(at.JDKSAVDECC_AEM_COMMAND_SET_CONFIGURATION), payload)
+        assert at.JDKSAVDECC_AEM_STATUS_SUCCESS == response.aecpdu_header.header.status
+        assert payload == resp_payload
+        assert emesm.entityModel is models[1]
+        emesm.configurationChanged.assert_called_once_with(1)
+        assert list(emesm.notifications.pending) == [(at.JDKSAVDECC_AEM_COMMAND_SET_CONFIGURATION, 0, 1)]
+        assert emesm.notifications.pending[(at.JDKSAVDECC_AEM_COMMAND_SET_CONFIGURATION, 0, 1)][1:] == [payload, 43]
+
+        response, resp_payload = emesm._handleGetConfiguration(self.aem_command(at.JDKSAVDECC_AEM_COMMAND_GET_CONFIGURATION), bytes())
+        assert struct.pack("!2H", 0, 1) == resp_payload
+        # the ENTITY descriptor of the current configuration
+        status, resp_payload = read_descriptor(0, at.JDKSAVDECC_DESCRIPTOR_ENTITY, 0)
+        assert resp_payload[4:] == models[1].get(1, at.JDKSAVDECC_DESCRIPTOR_ENTITY, 0)
+        assert at.JDKSAVDECC_AEM_STATUS_NO_SUCH_DESCRIPTOR == emesm._audioMappingsStatus(at.JDKSAVDECC_DESCRIPTOR_AUDIO_UNIT, 0)
+
+        # unknown configuration
+        response, resp_payload = emesm._handleSetConfiguration(self.aem_command(at.JDKSAVDECC_AEM_COMMAND_SET_CONFIGURATION), struct.pack("!2H", 0, 2))
+        assert at.JDKSAVDECC_AEM_STATUS_BAD_ARGUMENTS == response.aecpdu_header.header.status
+        assert struct.pack("!2H", 0, 1) == resp_payload
+
+        # acquired by another controller
+        emesm.owner_entity_id = 44
+        response, resp_payload = emesm._handleSetConfiguration(self.aem_command(at.JDKSAVDECC_AEM_COMMAND_SET_CONFIGURATION), struct.pack("!2H", 0, 0))
+        assert at.JDKSAVDECC_AEM_STATUS_ENTITY_ACQUIRED == response.aecpdu_header.header.status
+        assert emesm.entityModel is models[1]
+        emesm.configurationChanged.assert_called_once()
+
+
     def test_get_counters_handler(self):
         ei = EntityInfo(entity_id=42)
         emesm = EntityModelEntityStateMachine(ei, [], "./tests/fixtures/config.yml")
@@ -740,7 +900,38 @@ class TestEntityModelEntityStateMachine:
         response, resp_payload = emesm._handleGetCounters(command, payload)
         
         assert at.JDKSAVDECC_AECP_MESSAGE_TYPE_AEM_RESPONSE == response.aecpdu_header.header.message_type
+        assert at.JDKSAVDECC_AEM_STATUS_SUCCESS == response.aecpdu_header.header.status
+        assert 136 == len(resp_payload)
+
+        # counters of the AVB_INTERFACE
+        frames_rx = emesm.counters.index(at.JDKSAVDECC_DESCRIPTOR_AVB_INTERFACE, 0, AVB_INTERFACE_FRAMES_RX)
+        emesm.counters.array[frames_rx] += 3
+        payload = struct.pack("!2H", at.JDKSAVDECC_DESCRIPTOR_AVB_INTERFACE, 0)
+
+        response, resp_payload = emesm._handleGetCounters(command, payload)
+
+        assert at.JDKSAVDECC_AEM_STATUS_SUCCESS == response.aecpdu_header.header.status
+        descriptor_type, descriptor_index, counters_valid = struct.unpack_from("!2HL", resp_payload)
+        assert (at.JDKSAVDECC_DESCRIPTOR_AVB_INTERFACE, 0) == (descriptor_type, descriptor_index)
+        assert 1 << AVB_INTERFACE_FRAMES_RX == counters_valid
+        assert 3 == struct.unpack_from("!32L", resp_payload, 8)[AVB_INTERFACE_FRAMES_RX]
+
+        # a descriptor without counters
+        payload = struct.pack("!2H", at.JDKSAVDECC_DESCRIPTOR_CLOCK_DOMAIN, 0)
+        response, resp_payload = emesm._handleGetCounters(command, payload)
         assert at.JDKSAVDECC_AEM_STATUS_NOT_IMPLEMENTED == response.aecpdu_header.header.status
+        assert 136 == len(resp_payload)
+
+        # unknown descriptors
+        for descriptor_type, descriptor_index in [
+            (at.JDKSAVDECC_DESCRIPTOR_STREAM_INPUT, 1),
+            (at.JDKSAVDECC_DESCRIPTOR_PTP_PORT, 0),
+            (0x7fff, 0),
+        ]:
+            payload = struct.pack("!2H", descriptor_type, descriptor_index)
+            response, resp_payload = emesm._handleGetCounters(command, payload)
+            assert at.JDKSAVDECC_AEM_STATUS_NO_SUCH_DESCRIPTOR == response.aecpdu_header.header.status
+            assert 136 == len(resp_payload)
 
 
     def test_read_descriptor_handler(self):
@@ -768,3 +959,269 @@ class TestEntityModelEntityStateMachine:
         
         assert at.JDKSAVDECC_AECP_MESSAGE_TYPE_AEM_RESPONSE == response.aecpdu_header.header.message_type
         assert at.JDKSAVDECC_AEM_STATUS_SUCCESS == response.aecpdu_header.header.status
+
+    def test_read_descriptor_handler_unknown_descriptor_type(self):
+        ei = EntityInfo(entity_id=42)
+        emesm = EntityModelEntityStateMachine(ei, [], "./tests/fixtures/config.yml")
+        command = at.struct_jdksavdecc_aecpdu_aem(
+            aecpdu_header=at.struct_jdksavdecc_aecpdu_common(
+                header = at.struct_jdksavdecc_aecpdu_common_control_header(
+                    message_type=at.JDKSAVDECC_AECP_MESSAGE_TYPE_AEM_COMMAND,
+                    target_entity_id=uint64_to_eui64(42)
+            ),
+                controller_entity_id=uint64_to_eui64(43),
+                sequence_id=13
+            ),
+            command_type=at.JDKSAVDECC_AEM_COMMAND_READ_DESCRIPTOR
+        )
+
+        payload = struct.pack("!4H", 0, 0, at.JDKSAVDECC_DESCRIPTOR_PTP_PORT, 0)
+
+        response, resp_payload = emesm.processCommand(command, payload)
+
+        assert at.JDKSAVDECC_AECP_MESSAGE_TYPE_AEM_RESPONSE == response.aecpdu_header.header.message_type
+        assert at.JDKSAVDECC_AEM_STATUS_NO_SUCH_DESCRIPTOR == response.aecpdu_header.header.status
+        assert payload == resp_payload
+
+    def test_read_descriptor_handler_available_index(self):
+        ei = EntityInfo(entity_id=42)
+        emesm = EntityModelEntityStateMachine(ei, [], "./tests/fixtures/config.yml")
+        command = at.struct_jdksavdecc_aecpdu_aem(
+            aecpdu_header=at.struct_jdksavdecc_aecpdu_common(
+                header = at.struct_jdksavdecc_aecpdu_common_control_header(
+                    message_type=at.JDKSAVDECC_AECP_MESSAGE_TYPE_AEM_COMMAND,
+                    target_entity_id=uint64_to_eui64(42)
+            ),
+                controller_entity_id=uint64_to_eui64(43),
+                sequence_id=13
+            ),
+            command_type=at.JDKSAVDECC_AEM_COMMAND_READ_DESCRIPTOR
+        )
+        payload = struct.pack("!4H", 0, 0, at.JDKSAVDECC_DESCRIPTOR_ENTITY, 0)
+
+        # the ENTITY descriptor carries the current available_index
+        ei.available_index = 5
+        response, resp_payload = emesm._handleReadDescriptor(command, payload)
+
+        expected = AEMDescriptorFactory.create_descriptor(at.JDKSAVDECC_DESCRIPTOR_ENTITY, 0, ei, emesm.config).encode()
+        assert struct.pack("!2H", 0, 0)+expected == resp_payload
+
+    ### Test Command Dispatch
+
+    def aem_command(self, command_type):
+        return at.struct_jdksavdecc_aecpdu_aem(
+            aecpdu_header=at.struct_jdksavdecc_aecpdu_common(
+                header = at.struct_jdksavdecc_aecpdu_common_control_header(
+                    message_type=at.JDKSAVDECC_AECP_MESSAGE_TYPE_AEM_COMMAND,
+                    target_entity_id=uint64_to_eui64(42)
+            ),
+                controller_entity_id=uint64_to_eui64(43),
+                sequence_id=13
+            ),
+            command_type=command_type
+        )
+
+    def test_process_command_not_implemented(self):
+        ei = EntityInfo(entity_id=42)
+        emesm = EntityModelEntityStateMachine(ei, [], "./tests/fixtures/config.yml")
+
+        # GET_STREAM_FORMAT response is sized for the stream_format
+        command = self.aem_command(at.JDKSAVDECC_AEM_COMMAND_GET_STREAM_FORMAT)
+        response, resp_payload = emesm.processCommand(command, struct.pack("!2H", at.JDKSAVDECC_DESCRIPTOR_STREAM_INPUT, 0))
+
+        assert at.JDKSAVDECC_AECP_MESSAGE_TYPE_AEM_RESPONSE == response.aecpdu_header.header.message_type
+        assert at.JDKSAVDECC_AEM_STATUS_NOT_IMPLEMENTED == response.aecpdu_header.header.status
+        assert at.JDKSAVDECC_AEM_COMMAND_GET_STREAM_FORMAT == response.command_type
+        assert 13 == response.aecpdu_header.sequence_id
+        assert struct.pack("!2HQ", at.JDKSAVDECC_DESCRIPTOR_STREAM_INPUT, 0, 0) == resp_payload
+
+        # unknown command_types echo the command payload
+        command = self.aem_command(0x7ffe)
+        response, resp_payload = emesm.processCommand(command, bytes(range(6)))
+
+        assert at.JDKSAVDECC_AEM_STATUS_NOT_IMPLEMENTED == response.aecpdu_header.header.status
+        assert bytes(range(6)) == resp_payload
+
+    def test_vendor_handler(self):
+        ei = EntityInfo(entity_id=42)
+        emesm = EntityModelEntityStateMachine(ei, [], "./tests/fixtures/config.yml")
+        other = EntityModelEntityStateMachine(ei, [], "./tests/fixtures/config.yml")
+
+        def handler(command, payload):
+            response = copy.deepcopy(command)
+            response.aecpdu_header.header.message_type = at.JDKSAVDECC_AECP_MESSAGE_TYPE_AEM_RESPONSE
+            return response, payload[::-1]
+
+        emesm.handlers.register(0x7ffe, handler, "!2H", 4)
+        command = self.aem_command(0x7ffe)
+
+        response, resp_payload = emesm.processCommand(command, b'\x01\x02\x03\x04')
+        assert at.JDKSAVDECC_AEM_STATUS_SUCCESS == response.aecpdu_header.header.status
+        assert b'\x04\x03\x02\x01' == resp_payload
+
+        # only registered for this state machine
+        response, resp_payload = other.processCommand(command, b'\x01\x02\x03\x04')
+        assert at.JDKSAVDECC_AEM_STATUS_NOT_IMPLEMENTED == response.aecpdu_header.header.status
+
+    def test_retransmitted_command(self):
+        ei = EntityInfo(entity_id=42)
+        emesm = EntityModelEntityStateMachine(ei, [], "./tests/fixtures/config.yml")
+        emesm.owner_entity_id = 43
+        emesm.txResponse = Mock()
+
+        command = self.aem_command(at.JDKSAVDECC_AEM_COMMAND_ACQUIRE_ENTITY)
+        # RELEASE
+        payload = struct.pack("!QQHH", 0x8000000000, 43, at.JDKSAVDECC_DESCRIPTOR_ENTITY, 0)
+
+        emesm.handleCommand(command, payload)
+        response, resp_payload = emesm.txResponse.call_args[0]
+        assert at.JDKSAVDECC_AEM_STATUS_SUCCESS == response.aecpdu_header.header.status
+        assert 0 == emesm.owner_entity_id
+
+        # the retry is not executed again (that would answer BAD_ARGUMENTS)
+        emesm.acquireEntity = Mock()
+        emesm.handleCommand(command, payload)
+
+        emesm.acquireEntity.assert_not_called()
+        emesm.txResponse.assert_called_with(response, resp_payload)
+        assert 1 == emesm.responseCache.hits
+
+        # the next command of the controller is executed
+        command.aecpdu_header.sequence_id += 1
+        emesm.acquireEntity.return_value = [command, bytes()]
+        emesm.handleCommand(command, payload)
+        emesm.acquireEntity.assert_called()
+
+    def test_slow_commands(self):
+        # two controllers interleaving slow and fast commands
+        ei = EntityInfo(entity_id=42)
+        emesm = EntityModelEntityStateMachine(ei, [], "./tests/fixtures/config.yml")
+        sent = []
+        emesm.txResponse = Mock(side_effect=lambda response, payload=None: sent.append((
+            eui64_to_uint64(response.aecpdu_header.controller_entity_id),
+            response.command_type,
+            response.aecpdu_header.header.status,
+        )))
+
+        release = Event()
+        executed = []
+        def slow(command, payload):
+            release.wait(5)
+            executed.append(eui64_to_uint64(command.aecpdu_header.controller_entity_id))
+            response = copy.deepcopy(command)
+            response.aecpdu_header.header.message_type = at.JDKSAVDECC_AECP_MESSAGE_TYPE_AEM_RESPONSE
+            return response, payload
+        emesm.handlers.register(0x7ffe, slow, "!2H", 4, slow=True)
+
+        def command(controller_entity_id, sequence_id, command_type):
+            command = self.aem_command(command_type)
+            command.aecpdu_header.controller_entity_id = uint64_to_eui64(controller_entity_id)
+            command.aecpdu_header.sequence_id = sequence_id
+            return command
+
+        read_descriptor = struct.pack("!4H", 0, 0, at.JDKSAVDECC_DESCRIPTOR_ENTITY, 0)
+
+        def receive(command, payload):
+            emesm.rcvdCommand.put((command, payload))
+            emesm.event.set()
+
+        emesm.start()
+        try:
+            receive(command(43, 1, 0x7ffe), bytes(4))
+            receive(command(44, 1, at.JDKSAVDECC_AEM_COMMAND_READ_DESCRIPTOR), read_descriptor)
+            receive(command(44, 2, 0x7ffe), bytes(4))
+            receive(command(43, 2, at.JDKSAVDECC_AEM_COMMAND_READ_DESCRIPTOR), read_descriptor)
+            # retransmission of a command in progress
+            receive(command(43, 1, 0x7ffe), bytes(4))
+
+            # this is an antipattern, have to research time travel functionality in pytest
+            time.sleep(0.5)
+
+            # the fast commands are not blocked by the slow ones
+            assert sent == [
+                (43, 0x7ffe, at.JDKSAVDECC_AEM_STATUS_IN_PROGRESS),
+                (44, at.JDKSAVDECC_AEM_COMMAND_READ_DESCRIPTOR, at.JDKSAVDECC_AEM_STATUS_SUCCESS),
+                (44, 0x7ffe, at.JDKSAVDECC_AEM_STATUS_IN_PROGRESS),
+                (43, at.JDKSAVDECC_AEM_COMMAND_READ_DESCRIPTOR, at.JDKSAVDECC_AEM_STATUS_SUCCESS),
+                (43, 0x7ffe, at.JDKSAVDECC_AEM_STATUS_IN_PROGRESS),
+            ]
+
+            release.set()
+
+            # this is an antipattern, have to research time travel functionality in pytest
+            time.sleep(0.5)
+        finally:
+            release.set()
+            emesm.performTerminate()
+
+        assert sorted(sent[5:]) == [
+            (43, 0x7ffe, at.JDKSAVDECC_AEM_STATUS_SUCCESS),
+            (44, 0x7ffe, at.JDKSAVDECC_AEM_STATUS_SUCCESS),
+        ]
+        # executed once per command
+        assert sorted(executed) == [43, 44]
+        assert not emesm.inProgressCommands
+
+    ### benchmarks
+
+    def test_read_descriptor_benchmark(self):
+        # a controller enumerating all descriptors of the model, repeatedly
+        ei = EntityInfo(entity_id=42)
+        emesm = EntityModelEntityStateMachine(ei, [], "./tests/fixtures/config.yml")
+        command = at.struct_jdksavdecc_aecpdu_aem(
+            aecpdu_header=at.struct_jdksavdecc_aecpdu_common(
+                header = at.struct_jdksavdecc_aecpdu_common_control_header(
+                    message_type=at.JDKSAVDECC_AECP_MESSAGE_TYPE_AEM_COMMAND,
+                    target_entity_id=uint64_to_eui64(42)
+            ),
+                controller_entity_id=uint64_to_eui64(43),
+                sequence_id=13
+            ),
+            command_type=at.JDKSAVDECC_AEM_COMMAND_READ_DESCRIPTOR
+        )
+        descriptors = [
+            (descriptor_type, 0)
+            for descriptor_type in (
+                at.JDKSAVDECC_DESCRIPTOR_ENTITY,
+                at.JDKSAVDECC_DESCRIPTOR_CONFIGURATION,
+                at.JDKSAVDECC_DESCRIPTOR_AUDIO_UNIT,
+                at.JDKSAVDECC_DESCRIPTOR_STREAM_INPUT,
+                at.JDKSAVDECC_DESCRIPTOR_AVB_INTERFACE,
+                at.JDKSAVDECC_DESCRIPTOR_CLOCK_SOURCE,
+                at.JDKSAVDECC_DESCRIPTOR_CLOCK_DOMAIN,
+            )
+        ]*200
+        payloads = [struct.pack("!4H", 0, 0, descriptor_type, descriptor_index) for descriptor_type, descriptor_index in descriptors]
+
+        t0 = time.perf_counter()
+        for payload in payloads:
+            response, resp_payload = emesm._handleReadDescriptor(command, payload)
+            assert at.JDKSAVDECC_AEM_STATUS_SUCCESS == response.aecpdu_header.header.status
+        compiled = len(payloads)/(time.perf_counter()-t0)
+
+        # building every descriptor on request
+        t0 = time.perf_counter()
+        for descriptor_type, descriptor_index in descriptors:
+            AEMDescriptorFactory.create_descriptor(descriptor_type, descriptor_index, ei, emesm.config).encode()
+        uncached = len(descriptors)/(time.perf_counter()-t0)
+
+        print(f"READ_DESCRIPTOR: {compiled:.0f} responses/s, building the descriptors: {uncached:.0f} descriptors/s")
+        assert compiled > 2*uncached
+
+    def test_dispatch_benchmark(self):
+        # every registered command with a payload of the declared size
+        ei = EntityInfo(entity_id=42)
+        emesm = EntityModelEntityStateMachine(ei, [], "./tests/fixtures/config.yml")
+        commands = [
+            (self.aem_command(handler.command_type), bytes(handler.command.size))
+            for handler in emesm.handlers
+        ]*100
+
+        t0 = time.perf_counter()
+        for command, payload in commands:
+            response, resp_payload = emesm.processCommand(command, payload)
+            assert response.command_type == command.command_type
+        elapsed = time.perf_counter()-t0
+
+        print(f"AEM dispatch: {len(commands)/elapsed:.0f} commands/s over {len(emesm.handlers)} command types")
+        assert elapsed < 2.
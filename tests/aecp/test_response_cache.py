@@ -0,0 +1,48 @@
+import pytest
+from unittest.mock import Mock
+
+from atdecc.aecp import ResponseCache
+
+
+class TestResponseCache:
+
+    def test_get_put(self):
+        cache = ResponseCache()
+
+        assert cache.get((43, 1, 4)) is None
+        cache.put((43, 1, 4), 'response', b'payload')
+
+        assert cache.get((43, 1, 4)) == ('response', b'payload')
+        # other controller, sequence_id or command_type
+        assert cache.get((44, 1, 4)) is None
+        assert cache.get((43, 2, 4)) is None
+        assert cache.get((43, 1, 5)) is None
+
+        assert 1 == cache.hits
+        assert 4 == cache.misses
+
+    def test_window(self):
+        clock = Mock(return_value=100.)
+        cache = ResponseCache(window=2., clock=clock)
+        cache.put((43, 1, 4), 'response', b'payload')
+
+        clock.return_value = 102.
+        assert cache.get((43, 1, 4)) == ('response', b'payload')
+
+        # a new command reusing the sequence_id
+        clock.return_value = 102.1
+        assert cache.get((43, 1, 4)) is None
+
+    def test_lru(self):
+        cache = ResponseCache(maxsize=2)
+        cache.put((43, 1, 4), 'response1', b'')
+        cache.put((43, 2, 4), 'response2', b'')
+        # recently used
+        assert cache.get((43, 1, 4)) is not None
+
+        cache.put((43, 3, 4), 'response3', b'')
+
+        assert len(cache.entries) == 2
+        assert cache.get((43, 2, 4)) is None
+        assert cache.get((43, 1, 4)) is not None
+        assert cache.get((43, 3, 4)) is not None
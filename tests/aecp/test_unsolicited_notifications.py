@@ -0,0 +1,125 @@
+import pytest
+from unittest.mock import Mock
+import struct
+
+from atdecc.aecp import UnsolicitedNotifications
+from atdecc.aecp.unsolicited import UNSOLICITED
+import atdecc.atdecc_api as at
+from atdecc.util import *
+
+
+class Sent(list):
+    """
+    Records (controller_entity_id, sequence_id, command_type, payload) at send time,
+    the template is patched for every subscriber
+    """
+
+    def __call__(self, response, payload):
+        self.append((
+            eui64_to_uint64(response.aecpdu_header.controller_entity_id),
+            response.aecpdu_header.sequence_id,
+            response.command_type,
+            payload,
+        ))
+
+
+def stream_info(descriptor_index, flags):
+    return struct.pack("!2HL", at.JDKSAVDECC_DESCRIPTOR_STREAM_INPUT, descriptor_index, flags)
+
+
+class TestUnsolicitedNotifications:
+
+    def test_fan_out(self):
+        clock = Mock(return_value=100.)
+        notifications = UnsolicitedNotifications(42, holdoff=0.02, clock=clock)
+        notifications.add(43)
+        notifications.add(44)
+        sent = Sent()
+
+        notifications.notify(at.JDKSAVDECC_AEM_COMMAND_GET_STREAM_INFO, stream_info(0, 1))
+        notifications.notify(at.JDKSAVDECC_AEM_COMMAND_GET_STREAM_INFO, stream_info(1, 1))
+
+        # not due yet
+        notifications.flush(sent, 100.01)
+        assert sent == []
+        assert notifications.nextDeadline() == 100.02
+
+        notifications.flush(sent, 100.02)
+        command_type = at.JDKSAVDECC_AEM_COMMAND_GET_STREAM_INFO | UNSOLICITED
+        # per controller sequence IDs
+        assert sent == [
+            (43, 0, command_type, stream_info(0, 1)),
+            (44, 0, command_type, stream_info(0, 1)),
+            (43, 1, command_type, stream_info(1, 1)),
+            (44, 1, command_type, stream_info(1, 1)),
+        ]
+        assert notifications.nextDeadline() == 110.
+
+        sent.clear()
+        notifications.flush(sent, 100.04)
+        assert sent == []
+
+    def test_coalesce(self):
+        clock = Mock(return_value=100.)
+        notifications = UnsolicitedNotifications(42, clock=clock)
+        notifications.add(43)
+        notifications.add(44)
+        sent = Sent()
+
+        # rapid successive changes of the same descriptor
+        for flags in range(10):
+            notifications.notify(at.JDKSAVDECC_AEM_COMMAND_GET_STREAM_INFO, stream_info(0, flags), exclude=43)
+        notifications.flush(sent, 101.)
+
+        # only the latest state, not to the controller that caused the changes
+        assert [(eid, payload) for eid, _, _, payload in sent] == [(44, stream_info(0, 9))]
+
+        # changes caused by different controllers are sent to both
+        sent.clear()
+        notifications.notify(at.JDKSAVDECC_AEM_COMMAND_GET_STREAM_INFO, stream_info(0, 1), exclude=43)
+        notifications.notify(at.JDKSAVDECC_AEM_COMMAND_GET_STREAM_INFO, stream_info(0, 2), exclude=44)
+        notifications.flush(sent, 101.)
+        assert [(eid, seq) for eid, seq, _, _ in sent] == [(43, 0), (44, 1)]
+
+    def test_acquire_entity(self):
+        notifications = UnsolicitedNotifications(42)
+        notifications.add(44)
+        sent = Sent()
+
+        payload = struct.pack("!QQHH", 0, 43, at.JDKSAVDECC_DESCRIPTOR_ENTITY, 0)
+        notifications.notify(at.JDKSAVDECC_AEM_COMMAND_ACQUIRE_ENTITY, payload, exclude=43)
+        notifications.flush(sent, notifications.clock()+1)
+
+        assert sent == [(44, 0, at.JDKSAVDECC_AEM_COMMAND_ACQUIRE_ENTITY | UNSOLICITED, payload)]
+
+    def test_expire(self):
+        clock = Mock(return_value=100.)
+        notifications = UnsolicitedNotifications(42, timeout=10., clock=clock)
+        notifications.add(43)
+        clock.return_value = 105.
+        notifications.add(44)
+
+        # a command of 43 refreshes the registration
+        clock.return_value = 108.
+        notifications.touch(43)
+        # unknown controllers are not registered by a command
+        notifications.touch(45)
+
+        assert notifications.expire(115.) == []
+        assert notifications.expire(115.1) == [44]
+        assert list(notifications) == [43]
+        assert notifications.nextDeadline() == 118.
+
+        # no notifications without subscribers
+        notifications.expire(119.)
+        notifications.notify(at.JDKSAVDECC_AEM_COMMAND_GET_STREAM_INFO, stream_info(0, 1))
+        assert not notifications.pending
+        assert notifications.nextDeadline() is None
+
+    def test_remove(self):
+        notifications = UnsolicitedNotifications(42)
+        notifications.add(43)
+        notifications.remove(43)
+        with pytest.raises(KeyError):
+            notifications.remove(43)
+        assert 0 == len(notifications)
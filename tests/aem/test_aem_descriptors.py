@@ -1,10 +1,12 @@
 import pytest
 import yaml
+import time
 from unittest.mock import patch, Mock
 
 import atdecc.atdecc_api as at
 from atdecc.util import *
 from atdecc.aem import AEMDescriptorFactory
+from atdecc.aem.descriptors import *
 from atdecc.adp import EntityInfo
 
 class TestAEMDescriptors:
@@ -291,3 +293,61 @@ class TestAEMDescriptors:
         assert 0 == descriptor_clock_domain.descriptor.clock_source_index
         assert at.JDKSAVDECC_DESCRIPTOR_CLOCK_DOMAIN_OFFSET_CLOCK_SOURCES == descriptor_clock_domain.descriptor.clock_sources_offset
         assert 1 == descriptor_clock_domain.descriptor.clock_sources_count
+
+    def test_registration(self):
+        # every AEMDescriptor subclass with a descriptor_type is registered
+        assert AEMDescriptorFactory.registry[at.JDKSAVDECC_DESCRIPTOR_STREAM_PORT_INPUT] is AEMDescriptor_STREAM_PORT_INPUT
+        assert AEMDescriptorFactory.registry[at.JDKSAVDECC_DESCRIPTOR_AUDIO_MAP] is AEMDescriptor_AUDIO_MAP
+
+        # parameters of the whole class hierarchy
+        registration = AEMDescriptorFactory.registration(at.JDKSAVDECC_DESCRIPTOR_STREAM_INPUT)
+        assert {'descriptor_index', 'object_name', 'stream_formats', 'buffer_length'} <= registration.parameters
+        assert not {'self', 'args', 'kwds'} & registration.parameters
+        assert 'AEMDescriptor_STREAM_INPUT' == registration.config_key
+
+        with pytest.raises(ValueError):
+            AEMDescriptorFactory.registration(0xfffe)
+
+    def test_subclass_of_aem_descriptor(self):
+        # deriving from AEMDescriptor only, defined after the import
+        class AEMDescriptor_TEST(AEMDescriptor):
+            descriptor_type = 0xfffd
+            descriptor_struct = at.struct_jdksavdecc_descriptor_clock_source
+
+            def __init__(self, descriptor_index=0, object_name=None, entity_id=0):
+                super().__init__()
+                self.descriptor_index = descriptor_index
+                self.object_name = object_name
+                self.entity_id = entity_id
+
+        try:
+            descriptor = AEMDescriptorFactory.create_descriptor(0xfffd, 3, EntityInfo(entity_id=42), {'AEMDescriptor_TEST': {'object_name': 'test'}})
+
+            assert 3 == descriptor.descriptor_index
+            assert 'test' == descriptor.object_name
+            assert 42 == descriptor.entity_id
+        finally:
+            del AEMDescriptorFactory.registry[0xfffd]
+            del AEMDescriptorFactory.registrations[0xfffd]
+
+    ### benchmarks
+
+    def test_factory_overhead(self):
+        em = EntityInfo(entity_id=42)
+        config = self.config()
+        n = 2000
+
+        t0 = time.perf_counter()
+        for i in range(n):
+            AEMDescriptorFactory.create_descriptor(at.JDKSAVDECC_DESCRIPTOR_STREAM_INPUT, 0, em, config)
+        factory = (time.perf_counter()-t0)/n
+
+        kwargs = {'descriptor_index': 0, **config['AEMDescriptor_STREAM_INPUT']}
+        t0 = time.perf_counter()
+        for i in range(n):
+            AEMDescriptor_STREAM_INPUT(**kwargs)
+        direct = (time.perf_counter()-t0)/n
+
+        print(f"create_descriptor: {factory*1e6:.1f} us, constructor: {direct*1e6:.1f} us")
+        # the factory adds the kwargs filtering only
+        assert factory < 2*direct
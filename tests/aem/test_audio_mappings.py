@@ -0,0 +1,104 @@
+import pytest
+import struct
+import time
+import yaml
+
+import atdecc.atdecc_api as at
+from atdecc.util import *
+from atdecc.aem import AudioMappings, EntityModel
+from atdecc.aem.audiomap import MAPPINGS_PER_PAGE
+from atdecc.adp import EntityInfo
+
+
+PORT = (at.JDKSAVDECC_DESCRIPTOR_STREAM_PORT_INPUT, 0)
+
+
+def mappings_of(audioMappings, descriptor_type, descriptor_index):
+    """
+    All mappings of a port, page by page
+    """
+    number_of_maps = audioMappings.numberOfMaps(descriptor_type, descriptor_index)
+    mappings = []
+    for map_index in range(number_of_maps):
+        _, number_of_mappings, page = audioMappings.page(descriptor_type, descriptor_index, map_index)
+        assert len(page) == 8*number_of_mappings
+        mappings += struct.iter_unpack("!4H", page)
+    return mappings
+
+
+class TestAudioMappings:
+
+    def config(self, channels=128, ports=2):
+        config = yaml.safe_load(open("./tests/fixtures/config.yml", 'r'))
+        counts = config['AEMDescriptor_CONFIGURATION']['descriptor_counts']
+        counts[at.JDKSAVDECC_DESCRIPTOR_STREAM_INPUT] = ports
+        counts[at.JDKSAVDECC_DESCRIPTOR_STREAM_PORT_INPUT] = ports
+        counts[at.JDKSAVDECC_DESCRIPTOR_AUDIO_CLUSTER] = ports
+        counts[at.JDKSAVDECC_DESCRIPTOR_AUDIO_MAP] = ports
+        config['AEMDescriptor_AUDIO_MAP']['number_of_mappings'] = channels
+        return config
+
+    def test_pages(self):
+        assert 62 == MAPPINGS_PER_PAGE
+
+        model = EntityModel.compile(EntityInfo(entity_id=42), self.config(channels=128))
+        audioMappings = model.audioMappings
+
+        assert PORT in audioMappings
+        assert (at.JDKSAVDECC_DESCRIPTOR_STREAM_PORT_INPUT, 2) not in audioMappings
+        # 62+62+4
+        assert 3 == audioMappings.numberOfMaps(*PORT)
+        assert [audioMappings.page(*PORT, i)[:2] for i in range(3)] == [(3, 62), (3, 62), (3, 4)]
+        with pytest.raises(IndexError):
+            audioMappings.page(*PORT, 3)
+
+        # the mappings of the AUDIO_MAP of the port, in order
+        assert mappings_of(audioMappings, *PORT) == [(0, ch, 0, ch) for ch in range(128)]
+        assert mappings_of(audioMappings, at.JDKSAVDECC_DESCRIPTOR_STREAM_PORT_INPUT, 1) == [(1, ch, 0, ch) for ch in range(128)]
+
+        # shared by the current model
+        em = EntityInfo(entity_id=42)
+        em.available_index += 1
+        assert model.current(em).audioMappings is audioMappings
+
+    def test_add_remove(self):
+        audioMappings = AudioMappings(perPage=4)
+        audioMappings.addPort(*PORT)
+        assert 1 == audioMappings.numberOfMaps(*PORT)
+        assert audioMappings.page(*PORT, 0) == (1, 0, bytes())
+
+        audioMappings.add(*PORT, [(0, ch, 0, ch) for ch in range(6)])
+        assert [audioMappings.page(*PORT, i)[:2] for i in range(2)] == [(2, 4), (2, 2)]
+
+        # existing mappings are skipped, the last page is filled up
+        audioMappings.add(*PORT, [(0, 0, 0, 0), (0, 6, 0, 6)])
+        assert 7 == audioMappings.mappings(*PORT)
+        assert [audioMappings.page(*PORT, i)[1] for i in range(2)] == [4, 3]
+
+        # only the pages of the removed mappings change
+        first = audioMappings.pages[PORT][0]
+        audioMappings.remove(*PORT, [(0, 5, 0, 5), (0, 9, 0, 9)])
+        assert audioMappings.pages[PORT][0] is first
+        assert mappings_of(audioMappings, *PORT) == [(0, ch, 0, ch) for ch in (0, 1, 2, 3, 4, 6)]
+
+        # emptied pages are dropped
+        audioMappings.remove(*PORT, [(0, 4, 0, 4), (0, 6, 0, 6)])
+        assert 1 == audioMappings.numberOfMaps(*PORT)
+        audioMappings.remove(*PORT, [(0, ch, 0, ch) for ch in range(4)])
+        assert audioMappings.page(*PORT, 0) == (1, 0, bytes())
+
+    ### benchmarks
+
+    def test_get_audio_map_benchmark(self):
+        model = EntityModel.compile(EntityInfo(entity_id=42), self.config(channels=128, ports=8))
+        audioMappings = model.audioMappings
+
+        t0 = time.perf_counter()
+        for _ in range(1000):
+            for port in range(8):
+                for map_index in range(3):
+                    audioMappings.page(at.JDKSAVDECC_DESCRIPTOR_STREAM_PORT_INPUT, port, map_index)
+        elapsed = time.perf_counter()-t0
+
+        # 24000 pages
+        assert elapsed < 1.
@@ -0,0 +1,59 @@
+import pytest
+import yaml
+from unittest.mock import patch
+
+import atdecc.atdecc_api as at
+from atdecc.util import *
+from atdecc.aem import AEMDescriptorFactory, DescriptorCache
+from atdecc.adp import EntityInfo
+
+class TestDescriptorCache:
+    def config(self):
+        return yaml.safe_load(open("./tests/fixtures/config.yml", 'r'))
+
+    def test_encoded(self):
+        em = EntityInfo(entity_id=42)
+        config = self.config()
+        cache = DescriptorCache(AEMDescriptorFactory)
+
+        for descriptor_type in (at.JDKSAVDECC_DESCRIPTOR_ENTITY, at.JDKSAVDECC_DESCRIPTOR_STREAM_INPUT, at.JDKSAVDECC_DESCRIPTOR_AUDIO_UNIT):
+            expected = AEMDescriptorFactory.create_descriptor(descriptor_type, 0, em, config).encode()
+            assert expected == cache.get(0, descriptor_type, 0, em, config)
+            assert expected == cache.get(0, descriptor_type, 0, em, config)
+
+    def test_unknown_descriptor_type(self):
+        cache = DescriptorCache(AEMDescriptorFactory)
+        with pytest.raises(ValueError):
+            cache.get(0, 0xfffe, 0, EntityInfo(entity_id=42), self.config())
+
+    def test_invalidation(self):
+        em = EntityInfo(entity_id=42)
+        config = self.config()
+        cache = DescriptorCache(AEMDescriptorFactory)
+
+        with patch.object(AEMDescriptorFactory, 'create_descriptor', wraps=AEMDescriptorFactory.create_descriptor) as create_descriptor:
+            cache.get(0, at.JDKSAVDECC_DESCRIPTOR_ENTITY, 0, em, config)
+            cache.get(0, at.JDKSAVDECC_DESCRIPTOR_STREAM_INPUT, 0, em, config)
+            cache.get(0, at.JDKSAVDECC_DESCRIPTOR_STREAM_INPUT, 1, em, config)
+            assert 3 == create_descriptor.call_count
+
+            # served from the cache
+            cache.get(0, at.JDKSAVDECC_DESCRIPTOR_ENTITY, 0, em, config)
+            cache.get(0, at.JDKSAVDECC_DESCRIPTOR_STREAM_INPUT, 0, em, config)
+            assert 3 == create_descriptor.call_count
+
+            # the ENTITY descriptor depends on available_index, STREAM_INPUT doesn't
+            em.available_index += 1
+            encoded = cache.get(0, at.JDKSAVDECC_DESCRIPTOR_ENTITY, 0, em, config)
+            cache.get(0, at.JDKSAVDECC_DESCRIPTOR_STREAM_INPUT, 0, em, config)
+            assert 4 == create_descriptor.call_count
+            assert 1 == AEMDescriptorFactory.create_descriptor(at.JDKSAVDECC_DESCRIPTOR_ENTITY, 0, em, config).descriptor.available_index
+            assert encoded == AEMDescriptorFactory.create_descriptor(at.JDKSAVDECC_DESCRIPTOR_ENTITY, 0, em, config).encode()
+            create_descriptor.reset_mock()
+
+            # a change of the config section in place
+            config['AEMDescriptor_STREAM_INPUT']['buffer_length'] = 1000
+            cache.get(0, at.JDKSAVDECC_DESCRIPTOR_ENTITY, 0, em, config)
+            encoded = cache.get(0, at.JDKSAVDECC_DESCRIPTOR_STREAM_INPUT, 0, em, config)
+            assert 1 == create_descriptor.call_count
+            assert encoded == AEMDescriptorFactory.create_descriptor(at.JDKSAVDECC_DESCRIPTOR_STREAM_INPUT, 0, em, config).encode()
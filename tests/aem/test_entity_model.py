@@ -0,0 +1,142 @@
+import pytest
+import yaml
+
+import atdecc.atdecc_api as at
+from atdecc.util import *
+from atdecc.aem import AEMDescriptorFactory, EntityModel, EntityModelError
+from atdecc.adp import EntityInfo
+
+class TestEntityModel:
+    def config(self):
+        return yaml.safe_load(open("./tests/fixtures/config.yml", 'r'))
+
+    def test_compile(self):
+        em = EntityInfo(entity_id=42)
+        config = self.config()
+
+        model = EntityModel.compile(em, config)
+
+        assert sorted(model.descriptors) == sorted([
+            (0, at.JDKSAVDECC_DESCRIPTOR_ENTITY, 0),
+            (0, at.JDKSAVDECC_DESCRIPTOR_CONFIGURATION, 0),
+            (0, at.JDKSAVDECC_DESCRIPTOR_AUDIO_UNIT, 0),
+            (0, at.JDKSAVDECC_DESCRIPTOR_STREAM_INPUT, 0),
+            (0, at.JDKSAVDECC_DESCRIPTOR_AVB_INTERFACE, 0),
+            (0, at.JDKSAVDECC_DESCRIPTOR_CLOCK_SOURCE, 0),
+            (0, at.JDKSAVDECC_DESCRIPTOR_CLOCK_DOMAIN, 0),
+        ])
+        for (configuration_index, descriptor_type, descriptor_index), encoded in model.descriptors.items():
+            assert encoded == AEMDescriptorFactory.create_descriptor(descriptor_type, descriptor_index, em, config).encode()
+        assert 1 == model.counts[(0, at.JDKSAVDECC_DESCRIPTOR_STREAM_INPUT)]
+        assert model.get(0, at.JDKSAVDECC_DESCRIPTOR_STREAM_INPUT, 1) is None
+
+        # read-only
+        with pytest.raises(TypeError):
+            model.descriptors[(0, at.JDKSAVDECC_DESCRIPTOR_STREAM_INPUT, 1)] = bytes()
+
+    def test_current(self):
+        em = EntityInfo(entity_id=42)
+        model = EntityModel.compile(em, self.config())
+
+        assert model.current(em) is model
+
+        em.available_index += 1
+        current = model.current(em)
+        assert current is not model
+        assert current.get(0, at.JDKSAVDECC_DESCRIPTOR_ENTITY, 0) != model.get(0, at.JDKSAVDECC_DESCRIPTOR_ENTITY, 0)
+        # unchanged descriptors are shared
+        assert current.get(0, at.JDKSAVDECC_DESCRIPTOR_STREAM_INPUT, 0) is model.get(0, at.JDKSAVDECC_DESCRIPTOR_STREAM_INPUT, 0)
+
+    def test_missing_parameter(self):
+        config = self.config()
+        config['AEMDescriptor_CONFIGURATION']['descriptor_counts'][at.JDKSAVDECC_DESCRIPTOR_AUDIO_CLUSTER] = 2
+        del config['AEMDescriptor_AUDIO_CLUSTER']['signal_type']
+
+        with pytest.raises(EntityModelError) as e:
+            EntityModel.compile(EntityInfo(entity_id=42), config)
+
+        assert len(e.value.errors) == 2
+        assert all('AEMDescriptor_AUDIO_CLUSTER' in error and 'signal_type' in error for error in e.value.errors)
+
+    def test_unknown_descriptor_type(self):
+        config = self.config()
+        config['AEMDescriptor_CONFIGURATION']['descriptor_counts'][0xfffe] = 1
+
+        with pytest.raises(EntityModelError) as e:
+            EntityModel.compile(EntityInfo(entity_id=42), config)
+
+        assert e.value.errors == ["No descriptor class registered for type 0xfffe"]
+
+    def test_references(self):
+        config = self.config()
+        descriptor_counts = config['AEMDescriptor_CONFIGURATION']['descriptor_counts']
+        # STREAM_PORT_INPUT 0 has cluster 0 and map 0, STREAM_PORT_INPUT 1 cluster 1 and map 1
+        descriptor_counts[at.JDKSAVDECC_DESCRIPTOR_STREAM_PORT_INPUT] = 2
+        descriptor_counts[at.JDKSAVDECC_DESCRIPTOR_AUDIO_CLUSTER] = 2
+        descriptor_counts[at.JDKSAVDECC_DESCRIPTOR_AUDIO_MAP] = 2
+        EntityModel.compile(EntityInfo(entity_id=42), config)
+
+        descriptor_counts[at.JDKSAVDECC_DESCRIPTOR_AUDIO_MAP] = 1
+        config['AEMDescriptor_CLOCK_DOMAIN'] = {'clock_sources': [0, 1], 'clock_source_index': 2}
+
+        with pytest.raises(EntityModelError) as e:
+            EntityModel.compile(EntityInfo(entity_id=42), config)
+
+        errors = sorted(e.value.errors)
+        assert len(errors) == 3
+        assert errors[0] == 'AEMDescriptor_CLOCK_DOMAIN 0: CLOCK_SOURCE 1..1 out of 1'
+        assert errors[1] == 'AEMDescriptor_CLOCK_DOMAIN 0: clock_source_index 2 not in clock_sources [0, 1]'
+        assert errors[2] == 'AEMDescriptor_STREAM_PORT_INPUT 1: AUDIO_MAP 1..1 out of 1'
+
+    def test_configurations(self):
+        em = EntityInfo(entity_id=42)
+        config = self.config()
+        config['configurations'] = [
+            {},
+            {
+                'AEMDescriptor_CONFIGURATION': {
+                    'object_name': '64 in',
+                    'descriptor_counts': {at.JDKSAVDECC_DESCRIPTOR_STREAM_INPUT: 8},
+                },
+                'AEMDescriptor_AUDIO_UNIT': {'number_of_external_output_ports': 64},
+            },
+        ]
+
+        configurations = EntityModel.configurations(config)
+        assert len(configurations) == 2
+        # sections are merged with the ones at the top level
+        assert configurations[1]['AEMDescriptor_AUDIO_UNIT']['number_of_external_output_ports'] == 64
+        assert configurations[1]['AEMDescriptor_AUDIO_UNIT']['object_name'] == config['AEMDescriptor_AUDIO_UNIT']['object_name']
+        assert configurations[0]['AEMDescriptor_CONFIGURATION'] == config['AEMDescriptor_CONFIGURATION']
+        assert [c['AEMDescriptor_ENTITY']['current_configuration'] for c in configurations] == [0, 1]
+        assert all(c['AEMDescriptor_ENTITY']['configurations_count'] == 2 for c in configurations)
+
+        models = EntityModel.compileConfigurations(em, config)
+        assert [model.configurationIndex for model in models] == [0, 1]
+        assert sorted(models[1].descriptors) == sorted([
+            (1, at.JDKSAVDECC_DESCRIPTOR_ENTITY, 0),
+            (1, at.JDKSAVDECC_DESCRIPTOR_CONFIGURATION, 1),
+        ]+[(1, at.JDKSAVDECC_DESCRIPTOR_STREAM_INPUT, i) for i in range(8)])
+        assert models[1].get(1, at.JDKSAVDECC_DESCRIPTOR_CONFIGURATION, 1) == \
+            AEMDescriptorFactory.create_descriptor(at.JDKSAVDECC_DESCRIPTOR_CONFIGURATION, 1, em, configurations[1]).encode()
+        # every model has the ENTITY descriptor with its current_configuration
+        for configuration_index, model in enumerate(models):
+            assert model.get(configuration_index, at.JDKSAVDECC_DESCRIPTOR_ENTITY, 0) == \
+                AEMDescriptorFactory.create_descriptor(at.JDKSAVDECC_DESCRIPTOR_ENTITY, 0, em, configurations[configuration_index]).encode()
+        assert models[0].get(0, at.JDKSAVDECC_DESCRIPTOR_ENTITY, 0) != models[1].get(1, at.JDKSAVDECC_DESCRIPTOR_ENTITY, 0)
+
+        # a single configuration without the list
+        del config['configurations']
+        assert [model.configurationIndex for model in EntityModel.compileConfigurations(em, config)] == [0]
+
+    def test_configurations_errors(self):
+        config = self.config()
+        config['configurations'] = [
+            {},
+            {'AEMDescriptor_CONFIGURATION': {'descriptor_counts': {0xfffe: 1}}},
+        ]
+
+        with pytest.raises(EntityModelError) as e:
+            EntityModel.compileConfigurations(EntityInfo(entity_id=42), config)
+
+        assert e.value.errors == ["CONFIGURATION 1: No descriptor class registered for type 0xfffe"]